@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+import time
+
+from src.knowledge_store import KnowledgeStore
+from src.knowledge_sqlite import SqliteKnowledgeStore
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+
+
+def reindex(data_dir):
+    """Recompute the normalized questions in an existing knowledge.db and rebuild its FTS index.
+
+    Needed after text_norm.normalize changes; opening an older database
+    already upgrades its schema.
+    """
+    db_file = os.path.join(data_dir, "knowledge.db")
+    if not os.path.exists(db_file):
+        print(f"{db_file} does not exist.")
+        return 1
+    start = time.perf_counter()
+    store = SqliteKnowledgeStore(db_file)
+    store.rebuild_search_index()
+    count = len(store.get()["questions"])
+    store.close()
+    print(f"Reindexed {count} entries in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 0
+
+
+def migrate(data_dir, force=False):
+    """One-shot copy of knowledge.json (+ pending log) into knowledge.db.
+
+    The database is built under a temporary name and renamed into place, so
+    the apps never open a half-migrated knowledge.db. knowledge.json is left
+    untouched; LAOMIND_KNOWLEDGE_BACKEND=json switches back to it.
+    """
+    json_file = os.path.join(data_dir, "knowledge.json")
+    db_file = os.path.join(data_dir, "knowledge.db")
+    tmp_file = db_file + ".migrating"
+
+    if os.path.exists(db_file) and not force:
+        print(f"{db_file} already exists (use --force to rebuild it).")
+        return 1
+
+    source = KnowledgeStore(json_file)
+    data = source.get()
+    if source._load_failed:
+        print(f"Could not read {json_file}; nothing migrated.")
+        return 1
+
+    start = time.perf_counter()
+    for path in (tmp_file, tmp_file + "-wal", tmp_file + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    target = SqliteKnowledgeStore(tmp_file)
+    target.save({"questions": [dict(e) for e in data["questions"]]})
+    count = len(target.get()["questions"])
+    target.close() # Last connection closing checkpoints and removes the WAL
+
+    for path in (db_file + "-wal", db_file + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.replace(tmp_file, db_file)
+
+    dropped = len(data["questions"]) - count
+    print(f"Migrated {count} entries to {db_file} in {(time.perf_counter() - start) * 1000:.0f} ms"
+          + (f" ({dropped} duplicate questions dropped)" if dropped else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate data/knowledge.json to the SQLite backend.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--force", action="store_true", help="Rebuild knowledge.db if it already exists")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Only rebuild the search index of an existing knowledge.db")
+    args = parser.parse_args()
+    sys.exit(reindex(args.data_dir) if args.reindex else migrate(args.data_dir, force=args.force))
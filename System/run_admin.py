@@ -1,16 +1,43 @@
 
 import sys
-from PyQt5.QtWidgets import QApplication
-from src.ui_admin import AdminAppQt
+from src.startup import StartupProfiler, parse_startup_args
+from src.telemetry import configure_logging, install_metrics_dump
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # Same --profile-startup / --startup-budget-ms options as run_chat.py
+    profile, as_json, budget_ms, qt_args = parse_startup_args(sys.argv)
+    profiler = StartupProfiler("run_admin", enabled=profile, budget_ms=budget_ms)
+    # $LAOMIND_LOG_LEVEL=DEBUG shows per-request traces; $LAOMIND_METRICS_FILE dumps metrics on exit
+    configure_logging()
+    install_metrics_dump()
+
+    from PyQt5.QtWidgets import QApplication
+    profiler.mark("import PyQt5")
+
+    app = QApplication(qt_args)
     
     # Global Font Fix for Windows
     from PyQt5.QtGui import QFont
     font = QFont("Leelawadee UI", 11)
     app.setFont(font)
-    
+    profiler.mark("QApplication")
+
+    from src.ui_admin import AdminAppQt
+    profiler.mark("import ui_admin")
+
     window = AdminAppQt()
+    profiler.mark("window built")
     window.show()
+    profiler.mark("window shown")
+
+    if profile:
+        from PyQt5.QtCore import QTimer
+
+        def first_frame():
+            profiler.mark("first frame")
+            print(profiler.to_json()) if as_json else profiler.report()
+            app.exit(1 if profiler.over_budget() else 0)
+
+        QTimer.singleShot(0, first_frame)
+
     sys.exit(app.exec_())
@@ -0,0 +1,43 @@
+import argparse
+import json
+import sys
+
+from src.benchmark import DEFAULT_SIZES, DEFAULT_STRATEGIES, format_report, run_benchmark
+
+
+def _int_list(text):
+    return [int(x.replace("_", "")) for x in text.split(",") if x.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark for ChatBot.get_response.")
+    parser.add_argument("--sizes", type=_int_list, default=list(DEFAULT_SIZES),
+                        help="Knowledge base sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--strategies", default=",".join(DEFAULT_STRATEGIES),
+                        help="Retrieval strategies to compare (linear, ngram, fts)")
+    parser.add_argument("--queries", type=int, default=200, help="Queries replayed per run")
+    parser.add_argument("--agreement-queries", type=int, default=50,
+                        help="Queries checked against the full SequenceMatcher scan (0 to skip)")
+    parser.add_argument("--max-linear", type=int, default=100000,
+                        help="Skip the linear strategy above this size (0 = never skip)")
+    parser.add_argument("--model-latency", type=float, default=0.0,
+                        help="Seconds the stub model waits per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Where generated datasets are kept (reused if present)")
+    parser.add_argument("--timeout", type=int, default=3600, help="Seconds allowed per run")
+    parser.add_argument("--output", "-o", help="Write the JSON results here")
+    args = parser.parse_args()
+
+    report = run_benchmark(sizes=args.sizes,
+                           strategies=[s.strip() for s in args.strategies.split(",") if s.strip()],
+                           queries=args.queries, agreement_queries=args.agreement_queries,
+                           seed=args.seed, work_dir=args.work_dir, max_linear=args.max_linear,
+                           model_latency=args.model_latency, timeout=args.timeout,
+                           log=lambda msg: print(msg, file=sys.stderr))
+    print(format_report(report), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if any("error" in row for row in report["results"]) else 0)
@@ -1,16 +1,51 @@
 
 import sys
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtGui import QFont
-from src.ui_chat import ChatAppQt
+from src.startup import StartupProfiler, parse_startup_args
+from src.telemetry import configure_logging, install_metrics_dump
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # --profile-startup prints per-phase timings and exits once the chat is usable;
+    # --startup-budget-ms N makes it exit with status 1 when startup is slower than N
+    profile, as_json, budget_ms, qt_args = parse_startup_args(sys.argv)
+    profiler = StartupProfiler("run_chat", enabled=profile, budget_ms=budget_ms)
+    # $LAOMIND_LOG_LEVEL=DEBUG shows per-request traces; $LAOMIND_METRICS_FILE dumps metrics on exit
+    configure_logging()
+    install_metrics_dump()
+
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QFont
+    from PyQt5.QtCore import QTimer
+    profiler.mark("import PyQt5")
+
+    app = QApplication(qt_args)
     
     # Global Font Setting
     font = QFont("Leelawadee UI", 11)
     app.setFont(font)
-    
-    window = ChatAppQt()
+    profiler.mark("QApplication")
+
+    from src.ui_chat import ChatAppQt
+    profiler.mark("import ui_chat")
+
+    window = ChatAppQt(profiler=profiler)
     window.show()
+    profiler.mark("window shown")
+
+    if profile:
+        state = {"frame": False, "engine": False}
+
+        def finish(key):
+            state[key] = True
+            if all(state.values()):
+                print(profiler.to_json()) if as_json else profiler.report()
+                app.exit(1 if profiler.over_budget() else 0)
+
+        def first_frame():
+            profiler.mark("first frame")
+            finish("frame")
+
+        # Runs as soon as the event loop has painted the window
+        QTimer.singleShot(0, first_frame)
+        window.engine_ready.connect(lambda: finish("engine"))
+
     sys.exit(app.exec_())
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+
+from src.telemetry import configure_logging, install_metrics_dump
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless HTTP/JSON chat server (no Qt needed).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-dir", help="Knowledge/emotion data folder (default: the project's data/)")
+    parser.add_argument("--workers", type=int, default=64, help="Threads running chat turns")
+    parser.add_argument("--model-concurrency", type=int, default=4,
+                        help="Calls to each model provider allowed at the same time across all sessions")
+    parser.add_argument("--model-queue", type=int, default=64,
+                        help="Calls allowed to wait for a model slot before new ones get 503")
+    parser.add_argument("--model-wait-timeout", type=float, default=60,
+                        help="Seconds a call may wait for a model slot before it gets 503")
+    parser.add_argument("--max-pending", type=int, default=1000,
+                        help="Turns in flight before new chats get 503")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--session-ttl", type=int, default=3600, help="Seconds before an idle session is dropped")
+    parser.add_argument("--request-timeout", type=int, default=300)
+    parser.add_argument("--retrieval", choices=("linear", "ngram", "fts", "semantic"),
+                        help="Retrieval strategy (default: the knowledge backend's own, or $LAOMIND_RETRIEVAL)")
+    parser.add_argument("--exact-skip-llm", choices=("always", "long", "never"),
+                        help="Whether a question matching a stored one exactly is answered without the model")
+    parser.add_argument("--slow-ms", type=float, default=30000,
+                        help="Model calls slower than this count as failures for failover (0 = only errors)")
+    parser.add_argument("--hedge-after-ms", type=float,
+                        help="Also ask the other provider when the first has not answered after this long")
+    args = parser.parse_args()
+
+    # $LAOMIND_LOG_LEVEL=INFO shows slow requests; $LAOMIND_METRICS_FILE dumps metrics on exit
+    configure_logging()
+    install_metrics_dump()
+
+    from src.engine import ChatBot
+    from src.server import serve
+
+    chatbot = ChatBot(data_dir=args.data_dir)
+    chatbot.set_model_concurrency(args.model_concurrency, max_waiting=args.model_queue,
+                                  wait_timeout=args.model_wait_timeout)
+    chatbot.router.hedge_after_ms = args.hedge_after_ms
+    chatbot.set_provider_slow_ms(args.slow_ms or None)
+    if args.retrieval:
+        chatbot.retrieval_strategy = args.retrieval
+    if args.exact_skip_llm:
+        chatbot.exact_skip_llm = args.exact_skip_llm
+    try:
+        asyncio.run(serve(chatbot, host=args.host, port=args.port, workers=args.workers,
+                          max_pending=args.max_pending, max_sessions=args.max_sessions,
+                          session_ttl=args.session_ttl, request_timeout=args.request_timeout))
+    except KeyboardInterrupt:
+        pass
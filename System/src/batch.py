@@ -0,0 +1,78 @@
+"""Retrieval for ChatBot.match_batch / answer_batch, spread over worker processes.
+
+Each worker builds its own retriever over the questions once (in the pool
+initializer) and then matches whole chunks of queries. Only question
+strings go to the workers and only (score, position) pairs come back, so
+the answers are never pickled.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .retrieval import KnowledgeIndex, build_retriever, rank_matches, widen_below_threshold, widen_matches
+from .text_norm import detect_language, normalize
+
+# Set in each worker process by _init_worker
+_WORKER = None
+
+
+def _init_worker(questions, strategy, candidate_limit, fallback_score, widen):
+    global _WORKER
+    entries = [{"q": q} for q in questions]
+    prepared = KnowledgeIndex().prepare(entries)
+    # The fts strategy lives in SQLite; workers use the n-gram index instead.
+    # fallback_score None means one index over every script
+    _WORKER = {
+        "retriever": build_retriever(strategy, entries, prepared, fallback_score is not None),
+        "fallback_score": fallback_score,
+        "prepared": prepared,
+        "positions": {id(e): i for i, e in enumerate(entries)},
+        "candidate_limit": candidate_limit,
+        "widen": widen,
+    }
+
+
+def _match_chunk(start, queries, k):
+    retriever = _WORKER["retriever"]
+    prepared = _WORKER["prepared"]
+    positions = _WORKER["positions"]
+    results = []
+    limit = _WORKER["candidate_limit"]
+    fallback_score = _WORKER["fallback_score"]
+    widen = _WORKER["widen"]
+    for query in queries:
+        text = normalize(query)
+        language = detect_language(text)
+        matches = rank_matches(text, retriever.candidates(text, limit), k, prepared=prepared)
+        if fallback_score is not None:
+            matches = widen_matches(text, retriever, matches, language, k, limit, fallback_score)[0]
+        if widen is not None:
+            threshold, wide_limit = widen
+            matches = widen_below_threshold(text, retriever, matches, threshold, k, wide_limit)[0]
+        results.append((language, [(score, positions[id(e)]) for score, e in matches]))
+    return start, results
+
+
+def default_workers():
+    return max(1, min(8, (os.cpu_count() or 2) - 1))
+
+
+def match_in_processes(entries, queries, k, strategy, candidate_limit, fallback_score=None,
+                       workers=None, chunk_size=256, widen=None):
+    """Yield (start, [(language, [(score, entry), ...]), ...]) per chunk of `queries`, as chunks finish.
+
+    `widen` is (threshold, limit) for retrieval.widen_below_threshold, like ChatBot.find_matches.
+    """
+    questions = [e["q"] for e in entries]
+    chunks = [(start, queries[start:start + chunk_size]) for start in range(0, len(queries), chunk_size)]
+    pool = ProcessPoolExecutor(max_workers=min(workers or default_workers(), len(chunks)),
+                               initializer=_init_worker,
+                               initargs=(questions, strategy, candidate_limit, fallback_score, widen))
+    try:
+        futures = [pool.submit(_match_chunk, start, chunk, k) for start, chunk in chunks]
+        for future in as_completed(futures):
+            start, results = future.result()
+            yield start, [(language, [(score, entries[i]) for score, i in matches])
+                          for language, matches in results]
+    finally:
+        # Also runs when the caller stops early: chunks not started yet are dropped
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,382 @@
+"""Offline retrieval benchmark for ChatBot.get_response.
+
+The parent process generates synthetic Lao/Thai/English knowledge bases and
+query sets; every (size, strategy) pair then runs in its own subprocess
+(`python -m src.benchmark CONFIG RESULT`) so peak RSS is measured per run.
+See run_benchmark.py for the command line.
+"""
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SYSTEM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAO_WORDS = [
+    "ກິນ", "ເຂົ້າ", "ແລ້ວ", "ບໍ່", "ເຈົ້າ", "ຢູ່", "ໃສ", "ແມ່ນ", "ຫຍັງ", "ລາວ", "ປະເທດ", "ເມືອງ",
+    "ນະຄອນຫຼວງ", "ວຽງຈັນ", "ຮຽນ", "ໜັງສື", "ໂຮງຮຽນ", "ຄອມພິວເຕີ", "ພາສາ", "ອາຫານ", "ລົດ", "ທາງ",
+    "ຝົນ", "ຕົກ", "ອາກາດ", "ຮ້ອນ", "ໜາວ", "ເວລາ", "ມື້ນີ້", "ມື້ອື່ນ", "ເທົ່າໃດ", "ແນວໃດ", "ເປັນຫຍັງ",
+    "ໃຜ", "ຊື່", "ເບີໂທ", "ລາຄາ", "ຊື້", "ຂາຍ", "ຕະຫຼາດ", "ໂຮງໝໍ", "ທ່ານໝໍ", "ຢາ", "ເຈັບ", "ຫົວ",
+    "ນ້ຳ", "ໄຟຟ້າ", "ເຮືອນ", "ຫ້ອງ", "ການ", "ເຮັດວຽກ", "ເງິນ", "ທະນາຄານ", "ບັດ", "ເປີດ", "ປິດ",
+    "ປີ", "ເດືອນ", "ອາທິດ", "ຊົ່ວໂມງ", "ແຂວງ", "ບ້ານ", "ຄອບຄົວ", "ໝູ່", "ວັດ", "ບຸນ", "ເພງ",
+]
+THAI_WORDS = [
+    "กิน", "ข้าว", "แล้ว", "หรือยัง", "คุณ", "อยู่", "ที่ไหน", "คือ", "อะไร", "ประเทศ", "เมือง",
+    "กรุงเทพ", "เรียน", "หนังสือ", "โรงเรียน", "คอมพิวเตอร์", "ภาษา", "อาหาร", "รถ", "ทาง", "ฝน",
+    "ตก", "อากาศ", "ร้อน", "หนาว", "เวลา", "วันนี้", "พรุ่งนี้", "เท่าไร", "อย่างไร", "ทำไม", "ใคร",
+    "ชื่อ", "เบอร์โทร", "ราคา", "ซื้อ", "ขาย", "ตลาด", "โรงพยาบาล", "หมอ", "ยา", "เจ็บ", "หัว",
+    "น้ำ", "ไฟฟ้า", "บ้าน", "ห้อง", "การ", "ทำงาน", "เงิน", "ธนาคาร", "บัตร", "เปิด", "ปิด",
+]
+ENGLISH_WORDS = [
+    "what", "is", "the", "how", "do", "i", "where", "can", "find", "price", "of", "a", "bank",
+    "account", "open", "close", "time", "today", "tomorrow", "weather", "rain", "hot", "cold",
+    "school", "book", "computer", "language", "food", "car", "road", "hospital", "doctor",
+    "medicine", "house", "room", "work", "money", "card", "market", "buy", "sell", "phone",
+    "number", "name", "country", "city", "capital", "learn", "teach", "python", "lao", "thai",
+    "festival", "temple", "music", "family", "friend", "village", "province", "water", "power",
+]
+LANGUAGES = (("lao", LAO_WORDS, "", 0.5), ("thai", THAI_WORDS, "", 0.25), ("english", ENGLISH_WORDS, " ", 0.25))
+FILLERS = {"lao": "ແດ່", "thai": "ครับ", "english": "please"}
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_STRATEGIES = ("linear", "ngram", "fts")
+STRATEGY_BACKENDS = {"fts": "sqlite"}
+
+
+class StubModelClient:
+    """Stands in for OllamaClient/GeminiClient: answers instantly (or after `latency` s)."""
+    def __init__(self, latency=0.0, model="stub"):
+        self.latency = latency
+        self.model = model
+        self.calls = 0
+
+    def check_connection(self):
+        return True
+
+    def get_models(self):
+        return [self.model]
+
+    def get_stats(self):
+        return {}
+
+    def generate_response(self, prompt, options=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return "Stub answer."
+
+    def stream_response(self, prompt, options=None):
+        yield self.generate_response(prompt)
+
+
+def _pick_language(rng):
+    x = rng.random()
+    for lang in LANGUAGES:
+        x -= lang[3]
+        if x < 0:
+            return lang
+    return LANGUAGES[-1]
+
+
+def _make_question(rng):
+    name, words, sep, _ = _pick_language(rng)
+    tokens = [rng.choice(words) for _ in range(rng.randint(3, 7))]
+    if not sep and rng.random() < 0.3:
+        # Lao/Thai are mostly written without spaces, but not always
+        tokens.insert(rng.randint(1, len(tokens) - 1), " ")
+    return name, sep.join(tokens)
+
+
+def generate_knowledge(size, seed=0):
+    """`size` unique synthetic Q/A pairs, as knowledge.json entries."""
+    rng = random.Random(seed)
+    seen = set()
+    entries = []
+    while len(entries) < size:
+        lang, q = _make_question(rng)
+        if len(seen) > 0.8 * size:
+            q = f"{q} {len(entries)}" # Keep generation fast once collisions get common
+        key = q.lower().strip()
+        if key in seen:
+            continue
+        seen.add(key)
+        # Some long answers, so the FAST MODE path is exercised too
+        a = f"ຄຳຕອບ {len(entries)}: {q}" + (" ລາຍລະອຽດເພີ່ມເຕີມ" * 4 if rng.random() < 0.3 else "")
+        entries.append({"q": q, "a": a})
+    return entries
+
+
+def _perturb(rng, lang, q):
+    kind = rng.choice(("exact", "case", "typo", "partial", "extra"))
+    if kind == "case":
+        return kind, f"  {q.upper()} "
+    if kind == "typo" and len(q) > 4:
+        i = rng.randrange(len(q) - 1)
+        if rng.random() < 0.5:
+            return kind, q[:i] + q[i + 1:]
+        return kind, q[:i] + q[i + 1] + q[i] + q[i + 2:]
+    if kind == "partial":
+        return kind, q[:max(3, int(len(q) * 0.7))]
+    if kind == "extra":
+        return kind, f"{q} {FILLERS[lang]}"
+    return "exact", q
+
+
+def generate_queries(entries, count, seed=0, miss_ratio=0.2):
+    """Queries drawn from the knowledge base (with typos, truncation, etc.) plus misses."""
+    rng = random.Random(seed + 1)
+    keys = {e["q"].lower().strip() for e in entries}
+    queries = []
+    while len(queries) < count:
+        if rng.random() < miss_ratio:
+            lang, q = _make_question(rng)
+            if q.lower().strip() in keys:
+                continue
+            queries.append({"kind": "miss", "text": q})
+        else:
+            q = rng.choice(entries)["q"]
+            lang = "english" if q[:1].isascii() else ("thai" if "\u0e00" <= q[:1] <= "\u0e7f" else "lao")
+            kind, text = _perturb(rng, lang, q)
+            queries.append({"kind": kind, "text": text})
+    return queries
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values), math.ceil(p / 100.0 * len(sorted_values))) - 1)
+    return sorted_values[k]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None # Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+# Worker side (runs in a subprocess)
+def _run_strategy(config):
+    from src.engine import ChatBot
+    from src.models.discovery import ModelDiscovery
+    from src.response_cache import ResponseCache
+
+    with open(config["queries_file"], 'r', encoding='utf-8') as f:
+        queries = json.load(f)
+
+    start = time.perf_counter()
+    bot = ChatBot(data_dir=config["data_dir"])
+    stub = StubModelClient(latency=config.get("model_latency", 0.0))
+    bot.ollama = stub
+    bot.model_discovery = ModelDiscovery(stub)
+    bot.set_model(stub.model)
+    # Every query must reach retrieval; cached answers would hide it
+    bot.response_cache = ResponseCache(max_entries=0)
+    bot.retrieval_strategy = config["strategy"]
+    load_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    bot._get_retriever()
+    index_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    run_start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        bot.get_response(query["text"])
+        latencies.append((time.perf_counter() - t) * 1000)
+        bot.session.clear() # Same prompt shape for every query
+    elapsed = time.perf_counter() - run_start
+
+    top1 = []
+    for query in queries[:config["agreement_queries"]]:
+        matches = bot.find_matches(query["text"], 1)
+        top1.append([matches[0][1]["q"], matches[0][0]] if matches else None)
+
+    latencies.sort()
+    return {
+        "load_ms": load_ms,
+        "index_ms": index_ms,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "max": latencies[-1] if latencies else None,
+        },
+        "throughput_qps": len(latencies) / elapsed if elapsed > 0 else None,
+        "model_calls": stub.calls,
+        "peak_rss_mb": peak_rss_mb(),
+        "top1": top1,
+    }
+
+
+def _run_baseline(config):
+    """Top-1 of the original full SequenceMatcher scan, for the agreement check."""
+    from src.retrieval import rank_matches
+    from src.text_norm import normalize
+
+    with open(config["queries_file"], 'r', encoding='utf-8') as f:
+        queries = json.load(f)[:config["agreement_queries"]]
+    with open(os.path.join(config["data_dir"], "knowledge.json"), 'r', encoding='utf-8') as f:
+        entries = json.load(f)["questions"]
+    top1 = []
+    for query in queries:
+        matches = rank_matches(normalize(query["text"]), entries, 1)
+        top1.append([matches[0][1]["q"], matches[0][0]] if matches else None)
+    return {"top1": top1}
+
+
+def run_worker(config_file, result_file):
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if config["strategy"] == "baseline":
+        result = _run_baseline(config)
+    else:
+        result = _run_strategy(config)
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+
+
+# Parent side
+def _prepare_dataset(work_dir, size, seed, backends, log):
+    size_dir = os.path.join(work_dir, str(size))
+    json_dir = os.path.join(size_dir, "json")
+    json_file = os.path.join(json_dir, "knowledge.json")
+    if not os.path.exists(json_file):
+        log(f"  generating {size} entries...")
+        os.makedirs(json_dir, exist_ok=True)
+        entries = generate_knowledge(size, seed)
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump({"questions": entries}, f, ensure_ascii=False)
+    else:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            entries = json.load(f)["questions"]
+
+    dirs = {"json": json_dir}
+    if "sqlite" in backends:
+        sqlite_dir = os.path.join(size_dir, "sqlite")
+        dirs["sqlite"] = sqlite_dir
+        if not os.path.exists(os.path.join(sqlite_dir, "knowledge.db")):
+            log(f"  building knowledge.db for {size} entries...")
+            from src.knowledge_sqlite import SqliteKnowledgeStore
+            store = SqliteKnowledgeStore(os.path.join(sqlite_dir, "knowledge.db"))
+            store.save({"questions": [dict(e) for e in entries]})
+            store.close()
+    return entries, dirs
+
+
+def _spawn(config, work_dir, timeout):
+    fd, config_file = tempfile.mkstemp(suffix=".json", dir=work_dir)
+    os.close(fd)
+    result_file = config_file[:-5] + ".result.json"
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    env = dict(os.environ)
+    env.pop("LAOMIND_KNOWLEDGE_BACKEND", None) # The data dir decides the backend
+    try:
+        proc = subprocess.run([sys.executable, "-m", "src.benchmark", config_file, result_file],
+                              cwd=SYSTEM_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              timeout=timeout)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.decode('utf-8', 'replace')[-2000:]}
+        with open(result_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout} s"}
+    finally:
+        for path in (config_file, result_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _agreement(top1, baseline):
+    pairs = [(a, b) for a, b in zip(top1, baseline)]
+    if not pairs:
+        return None, None
+    same_q = sum(1 for a, b in pairs if (a and a[0]) == (b and b[0]))
+    # Different entry but an equally good score still gives an equally good answer
+    same_score = sum(1 for a, b in pairs if (a is None) == (b is None) and (a is None or abs(a[1] - b[1]) < 1e-9))
+    return same_q / len(pairs), same_score / len(pairs)
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, strategies=DEFAULT_STRATEGIES, queries=200, agreement_queries=50,
+                  seed=0, work_dir=None, max_linear=100000, model_latency=0.0, timeout=3600, log=print):
+    """Run every size x strategy and return the results as a JSON-serialisable dict."""
+    work_dir = work_dir or tempfile.mkdtemp(prefix="laomind-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    agreement_queries = min(agreement_queries, queries)
+    backends = {STRATEGY_BACKENDS.get(s, "json") for s in strategies}
+    report = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "queries": queries,
+            "agreement_queries": agreement_queries,
+            "model_latency": model_latency,
+            "work_dir": work_dir,
+        },
+        "results": [],
+    }
+
+    for size in sizes:
+        log(f"size {size}")
+        entries, dirs = _prepare_dataset(work_dir, size, seed, backends, log)
+        query_set = generate_queries(entries, queries, seed)
+        del entries
+        queries_file = os.path.join(work_dir, str(size), "queries.json")
+        with open(queries_file, 'w', encoding='utf-8') as f:
+            json.dump(query_set, f, ensure_ascii=False)
+
+        base = {"queries_file": queries_file, "agreement_queries": agreement_queries,
+                "model_latency": model_latency}
+        baseline = None
+        if agreement_queries:
+            log("  baseline (full SequenceMatcher scan)...")
+            baseline = _spawn(dict(base, strategy="baseline", data_dir=dirs["json"]), work_dir, timeout)
+
+        for strategy in strategies:
+            row = {"size": size, "strategy": strategy, "backend": STRATEGY_BACKENDS.get(strategy, "json")}
+            if strategy == "linear" and max_linear and size > max_linear:
+                row["skipped"] = f"linear scan skipped above {max_linear} entries"
+                report["results"].append(row)
+                continue
+            log(f"  {strategy}...")
+            result = _spawn(dict(base, strategy=strategy, data_dir=dirs[row["backend"]]), work_dir, timeout)
+            top1 = result.pop("top1", None)
+            row.update(result)
+            if top1 is not None and baseline and "top1" in baseline:
+                row["top1_agreement"], row["top1_score_agreement"] = _agreement(top1, baseline["top1"])
+            report["results"].append(row)
+    return report
+
+
+def format_report(report):
+    lines = [f"{'size':>8} {'strategy':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>8} "
+             f"{'RSS MB':>8} {'top1':>6} {'score':>6}"]
+    fmt = lambda v, spec: format(v, spec) if isinstance(v, (int, float)) else "-"
+    for row in report["results"]:
+        if "skipped" in row or "error" in row:
+            lines.append(f"{row['size']:>8} {row['strategy']:<8} {row.get('skipped') or 'ERROR'}")
+            continue
+        lat = row["latency_ms"]
+        lines.append(f"{row['size']:>8} {row['strategy']:<8} {fmt(lat['p50'], '8.2f')} {fmt(lat['p95'], '8.2f')} "
+                     f"{fmt(lat['p99'], '8.2f')} {fmt(row['throughput_qps'], '8.1f')} "
+                     f"{fmt(row['peak_rss_mb'], '8.1f')} {fmt(row.get('top1_agreement'), '6.2f')} "
+                     f"{fmt(row.get('top1_score_agreement'), '6.2f')}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    run_worker(sys.argv[1], sys.argv[2])
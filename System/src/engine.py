@@ -1,10 +1,13 @@
 import json
+import logging
 import os
 import random
-import shutil
+import re
 import time
 import sys
-from difflib import SequenceMatcher
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 # Path Calculation
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +18,7 @@ PROJECT_ROOT = os.path.dirname(SYSTEM_DIR)
 
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+RESPONSE_CACHE_FILE = os.path.join(DATA_DIR, "cache", "responses.db")
 
 # Add System folder to sys.path to allow importing src
 if SYSTEM_DIR not in sys.path:
@@ -22,22 +26,67 @@ if SYSTEM_DIR not in sys.path:
 
 from src.models.ollama_client import OllamaClient
 from src.models.gemini_client import GeminiClient
+from src.models.discovery import ModelDiscovery
+from src.models.single_flight import SingleFlight
+from src.models.router import ModelBusyError, ModelSlots, ProviderRouter
+from src.batch import default_workers, match_in_processes
+from src.knowledge_store import open_knowledge_store
+from src.prompt_builder import PromptBuilder, summarize_turn
+from src.retrieval import PartitionedRetriever, rank_matches, scaled_limit, widen_below_threshold, widen_matches
+from src.text_norm import detect_language, normalize
+from src.semantic import DEFAULT_EMBEDDING_MODEL, OllamaEncoder, SemanticRetriever, VectorIndex, semantic_available
+from src.response_cache import ResponseCache
+from src.telemetry import METRICS, Trace
 
-print(f"DEBUG CORE: CURRENT_DIR = {CURRENT_DIR}")
+logger = logging.getLogger(__name__)
+
+# Word replacements per personality / tone. When both apply, the personality
+# wins (it used to be applied first, so the tone never saw those words).
+PERSONALITY_REPLACEMENTS = {
+    "ເພື່ອນ": {"ຂ້ອຍ": "ເຮົາ", "ເຈົ້າ": "ໂຕ"},
+    "ບອດໜ້າຮັກ": {"ຂ້ອຍ": "ນ້ອງບອດ", "ເຈົ້າ": "ອ້າຍ"},
+}
+TONE_REPLACEMENTS = {
+    "ໜ້າຮັກ": {".": "~", "!": "!!"},
+    "ເປັນກັນເອງ": {"ຂ້ອຍ": "ເຮົາ", "ເຈົ້າ": "ໂຕ"},
+}
+
+# "depth" setting -> most tokens the model may generate
+DEPTH_NUM_PREDICT = {"ສັ້ນ": 256, "ປົກກະຕິ": 512, "ລະອຽດ": 1024}
+
+MOOD_EMOJIS = {
+    "ມີຄວາມສຸກ": ["😊", "😄", "✨", "🎉", "💖"],
+    "ເສົ້າ": ["😔", "😢", "💔", "...", "🌧️"],
+    "ຕື່ນເຕັ້ນ": ["🤩", "🔥", "🚀", "😲", "‼️"],
+    "ສະຫງົບ": ["😌", "🍵", "🍃", "🧘", "🕊️"],
+    "ທົ່ວໄປ": [] # No specific emojis for neutral
+}
 
 class EmotionManager:
     """Manages emotional state and style application."""
-    def __init__(self):
-        self.data_file = os.path.join(DATA_DIR, "emotion.json")
+    def __init__(self, data_dir=None):
+        self.data_file = os.path.join(data_dir or DATA_DIR, "emotion.json")
+        self._signature = None
+        # (personality, tone) -> (pattern, replacement table), swapped in as one tuple
+        # so a thread never pairs a new pattern with the old table
+        self._style = (None, None, {})
         self.settings = self.load_emotions()
 
+    def _file_signature(self):
+        try:
+            st = os.stat(self.data_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
     def load_emotions(self):
         default = {
             "mood": "ທົ່ວໄປ", "tone": "ທາງການ", "personality": "ຜູ້ຊ່ວຍ",
             "empathy": 5, "accuracy": 8, "creativity": 5, "depth": "ປົກກະຕິ",
             "memory_length": 5
         }
-        if not os.path.exists(self.data_file): return default
+        self._signature = self._file_signature()
+        if self._signature is None: return default
         try:
             with open(self.data_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -46,50 +95,77 @@ class EmotionManager:
                 return data
         except: return default
 
+    def get_settings(self):
+        """Cached settings; emotion.json is only re-read when it changes on disk."""
+        if self._file_signature() != self._signature:
+            self.settings = self.load_emotions()
+        return self.settings
+
+    def model_options(self):
+        """Generation options from the settings: creativity 1-10 -> temperature 0.2-1.0, depth -> num_predict."""
+        settings = self.get_settings()
+        creativity = min(10, max(1, int(settings.get("creativity", 5))))
+        return {
+            "temperature": round(0.2 + (creativity - 1) * 0.8 / 9, 2),
+            "num_predict": DEPTH_NUM_PREDICT.get(settings.get("depth"), DEPTH_NUM_PREDICT["ປົກກະຕິ"]),
+        }
+
+    def memory_length(self):
+        """How many past turns are kept in the conversation history."""
+        return max(1, int(self.get_settings().get("memory_length", 5)))
+
     def save_emotions(self, settings_dict):
         self.settings = settings_dict
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
         with open(self.data_file, 'w', encoding='utf-8') as f:
             json.dump(self.settings, f, indent=4, ensure_ascii=False)
+        self._signature = self._file_signature()
+
+    def _compile_style(self, personality, tone):
+        """(pattern, table) for the personality + tone replacements merged into one regex.
+
+        Rebuilt only when they change.
+        """
+        key = (personality, tone)
+        style = self._style
+        if style[0] != key:
+            table = dict(TONE_REPLACEMENTS.get(tone, {}))
+            table.update(PERSONALITY_REPLACEMENTS.get(personality, {}))
+            pattern = None
+            if table:
+                words = sorted(table, key=len, reverse=True)
+                pattern = re.compile("|".join(re.escape(w) for w in words))
+            style = self._style = (key, pattern, table)
+        return style[1], style[2]
 
     def apply_style(self, response_text):
-        self.settings = self.load_emotions()
-        mood = self.settings.get("mood", "ທົ່ວໄປ")
-        tone = self.settings.get("tone", "ທາງການ")
-        personality = self.settings.get("personality", "ຜູ້ຊ່ວຍ")
-        empathy = int(self.settings.get("empathy", 5))
+        settings = self.get_settings()
+        mood = settings.get("mood", "ທົ່ວໄປ")
+        tone = settings.get("tone", "ທາງການ")
+        personality = settings.get("personality", "ຜູ້ຊ່ວຍ")
+        empathy = int(settings.get("empathy", 5))
 
+        # 1. Word replacements (personality + tone) in a single pass
+        pattern, table = self._compile_style(personality, tone)
         styled = response_text
-        
-        # 1. Personality Prefixes/Suffixes
+        if pattern is not None:
+            styled = pattern.sub(lambda m: table[m.group(0)], styled)
+
+        # 2. Personality Prefixes
         if personality == "ຄູສອນ":
             if not styled.startswith("[ຄູ]"):
                 styled = f"[ຄູ]: {styled}"
-        elif personality == "ເພື່ອນ":
-            styled = styled.replace("ຂ້ອຍ", "ເຮົາ").replace("ເຈົ້າ", "ໂຕ")
-        elif personality == "ບອດໜ້າຮັກ":
-            styled = styled.replace("ຂ້ອຍ", "ນ້ອງບອດ").replace("ເຈົ້າ", "ອ້າຍ")
 
-        # 2. Tone Adjustments
+        # 3. Tone Suffixes
         if tone == "ໜ້າຮັກ":
-            styled = styled.replace(".", "~").replace("!", "!!")
             if not styled.endswith("~"):
                 styled += " ເຈົ້າ~"
         elif tone == "ເປັນກັນເອງ":
-            styled = styled.replace("ຂ້ອຍ", "ເຮົາ").replace("ເຈົ້າ", "ໂຕ")
             if random.random() > 0.7:
                 styled += " ນ່າ"
 
-        # 3. Mood Emojis (Detailed)
-        emoji_map = {
-            "ມີຄວາມສຸກ": ["😊", "😄", "✨", "🎉", "💖"],
-            "ເສົ້າ": ["😔", "😢", "💔", "...", "🌧️"],
-            "ຕື່ນເຕັ້ນ": ["🤩", "🔥", "🚀", "😲", "‼️"],
-            "ສະຫງົບ": ["😌", "🍵", "🍃", "🧘", "🕊️"],
-            "ທົ່ວໄປ": [] # No specific emojis for neutral
-        }
-        
-        target_emojis = emoji_map.get(mood, [])
+        # 4. Mood Emojis (Detailed)
+        target_emojis = MOOD_EMOJIS.get(mood, [])
         if target_emojis:
             # Chance to add emojis based on empathy level (1-10) -> 10% to 100% chance
             if random.randint(1, 10) <= empathy:
@@ -99,103 +175,387 @@ class EmotionManager:
         
         return styled
 
+class ChatSession:
+    """The conversation history of one user (the chat window has one; the server one per client).
+
+    Turns that fall out of the last `max_history` are kept as one-line
+    summaries (at most `max_summary` of them) for the prompt builder.
+    `model_context` is Ollama's encoding of the turns so far, valid only if
+    every turn since it was reset went through that model.
+    """
+    def __init__(self, max_history=5, max_summary=10):
+        self.history = []
+        self.summary = []
+        self.max_history = max_history
+        self.max_summary = max_summary
+        self.model_context = None
+        self.context_model = None
+        self.context_turns = 0
+
+    def update_context(self, context, model=None, reused=False):
+        """Remember Ollama's context after a turn; None (any other kind of turn) forgets it."""
+        if context is None:
+            self.model_context = None
+            self.context_model = None
+            self.context_turns = 0
+            return
+        self.model_context = context
+        self.context_model = model
+        self.context_turns = self.context_turns + 1 if reused else 1
+
+    def add_turn(self, user_input, reply):
+        self.history.append(f"User: {user_input}")
+        self.history.append(f"AI: {reply}")
+        if len(self.history) > self.max_history * 2:
+            dropped = self.history[:-(self.max_history*2)]
+            self.history = self.history[-(self.max_history*2):]
+            for i in range(0, len(dropped) - 1, 2):
+                self.summary.append(summarize_turn(dropped[i], dropped[i + 1]))
+            del self.summary[:-self.max_summary]
+
+    def clear(self):
+        self.history = []
+        self.summary = []
+        self.update_context(None)
+
 class ChatBot:
-    def __init__(self):
-        self.data_file = os.path.join(DATA_DIR, "knowledge.json")
-        self.backup_dir = BACKUP_DIR
+    def __init__(self, data_dir=None):
+        # data_dir defaults to the project's data/ folder (the benchmark uses its own)
+        self.data_dir = data_dir or DATA_DIR
+        self.backup_dir = BACKUP_DIR if data_dir is None else os.path.join(data_dir, "backups")
+        # knowledge.json or knowledge.db, see open_knowledge_store
+        self.store = open_knowledge_store(self.data_dir, backup_dir=self.backup_dir)
+        self.data_file = self.store.data_file
         self.knowledge = self.load_knowledge()
-        self.emotion_manager = EmotionManager()
+
+        # Retrieval index, rebuilt only when the knowledge store changes.
+        # $LAOMIND_RETRIEVAL=semantic adds embedding matches (needs numpy and an
+        # Ollama embedding model); a cosine >= semantic_min_score counts like a string match
+        self.retrieval_strategy = os.environ.get("LAOMIND_RETRIEVAL") or self.store.default_strategy
+        self.embedding_model = DEFAULT_EMBEDDING_MODEL
+        self.semantic_min_score = 0.8
+        self.semantic_index = None
+        # Candidates scored per query (scaled up past 10k entries, see retrieval.scaled_limit).
+        # When the best is below the match threshold, candidate_widen times as many are
+        # scored once more: that answer would otherwise go to the model
+        self.candidate_limit = 50
+        self.candidate_widen = 10
+        self.rag_top_k = 5
+        # Each query is matched against questions in its own script first; the
+        # other scripts are only searched when the best score is below this
+        self.partition_by_language = True
+        self.partition_fallback_score = 0.3
+        # A question that equals a stored one after normalization is looked up in
+        # O(1) and skips fuzzy matching. exact_skip_llm decides whether it also
+        # skips the model: "always", "long" (only answers longer than
+        # fast_answer_min_chars, like any >0.95 match) or "never"
+        self.exact_skip_llm = "always"
+        self.fast_answer_min_chars = 50
+        # Keeps prompts (and Ollama's prefill time) bounded however long answers/history get
+        self.prompt_builder = PromptBuilder()
+        # Follow-up turns send Ollama only the new question plus the context it returned
+        # last time, until memory_length turns or context_limit tokens; then a full prompt
+        self.reuse_context = True
+        self.context_limit = 3072
+        self._retriever = None
+        self._retriever_key = None
+        self._retriever_lock = threading.Lock()
+
+        # Model answers for repeated questions (persisted across restarts)
+        cache_file = RESPONSE_CACHE_FILE if data_dir is None else os.path.join(data_dir, "cache", "responses.db")
+        self.response_cache = ResponseCache(db_path=cache_file)
+        self.emotion_manager = EmotionManager(self.data_dir)
         
         # Model Managers
         # Model Managers
         self.ollama = OllamaClient()
         self.gemini = GeminiClient()
         
-        # History Limit (Last 5 turns)
-        self.conversation_history = []
-        self.max_history = 5
+        # History Limit (Last 5 turns). get_response/stream_response take a
+        # session=ChatSession(...) to keep several conversations apart
+        self.session = ChatSession(max_history=5)
+
+        # At most this many calls per provider run at once, whatever the number of
+        # sessions; identical prompts already in flight share one call. With
+        # model_max_waiting / model_wait_timeout set, a call that cannot get a slot
+        # within them raises ModelBusyError (the server answers 503)
+        self.model_concurrency = 4
+        self.model_max_waiting = None
+        self.model_wait_timeout = None
+        self._model_slots = {}
+        self._model_slots_lock = threading.Lock()
+        self._inflight = SingleFlight()
         
         # Runtime settings
         self.use_external_model = True # Default to TRUE
         self.active_provider = "ollama" 
         self.external_model_name = "gemma3"
 
-        # Auto-Discovery: Check if gemma3 exists, if not, pick ANY available model
-        if self.active_provider == "ollama":
-            available = self.ollama.get_models()
-            if available:
-                if self.external_model_name not in available:
-                    print(f"[DEBUG] Default model '{self.external_model_name}' not found. Switching to '{available[0]}'.")
-                    self.external_model_name = available[0]
-                    self.ollama.model = available[0]
-                else:
-                    print(f"[DEBUG] Model '{self.external_model_name}' found and ready.")
+        # active_provider is tried first; a failing or slow one is skipped for a while
+        # (circuit breaker) and the other answers. Three calls in a row slower than
+        # provider_slow_ms count as failing too. router.hedge_after_ms turns on hedging.
+        self.provider_slow_ms = 30000
+        self.router = ProviderRouter(self._provider_client, ("ollama", "gemini"), slow_ms=self.provider_slow_ms)
+
+        # Auto-Discovery runs in the background; the model is resolved on the
+        # first request that needs Ollama (see _resolve_model)
+        self.model_discovery = ModelDiscovery(self.ollama)
+        self.model_discovery.start()
+        self.discovery_timeout = 5.0
+        self._model_resolved = False
+
+        # Requests slower than this are traced at INFO instead of DEBUG
+        self.slow_request_ms = 10000
+
+    @property
+    def conversation_history(self):
+        return self.session.history
+
+    @conversation_history.setter
+    def conversation_history(self, history):
+        self.session.history = history
+
+    @property
+    def max_history(self):
+        return self.session.max_history
+
+    @max_history.setter
+    def max_history(self, n):
+        self.session.max_history = n
+
+    def new_session(self):
+        return ChatSession(max_history=self.max_history)
+
+    def set_provider_slow_ms(self, ms):
+        """Calls slower than `ms` count as failures for the circuit breaker (None: only errors do)."""
+        self.provider_slow_ms = ms
+        self.router.set_slow_ms(ms)
+
+    def set_model_concurrency(self, n, max_waiting=None, wait_timeout=None):
+        """Limit how many calls to each provider may run at the same time (shared by all sessions).
+
+        At most `max_waiting` further calls queue for a slot, each for at most
+        `wait_timeout` seconds; None leaves the queue unbounded.
+        """
+        with self._model_slots_lock:
+            self.model_concurrency = max(1, int(n))
+            self.model_max_waiting = max_waiting
+            self.model_wait_timeout = wait_timeout
+            self._model_slots = {}
+
+    @contextmanager
+    def _model_slot(self, trace, provider=None):
+        provider = provider or self.active_provider
+        with self._model_slots_lock:
+            slots = self._model_slots.get(provider)
+            if slots is None:
+                slots = self._model_slots[provider] = ModelSlots(provider, self.model_concurrency,
+                                                                 self.model_max_waiting, self.model_wait_timeout)
+        with trace.span("llm_wait"):
+            slots.acquire()
+        try:
+            yield
+        finally:
+            slots.release()
+
+    def warm_up(self):
+        """Load the Ollama model in the background so the first message does not pay for it."""
+        def run():
+            if not self.use_external_model or self.active_provider != "ollama":
+                return
+            if not self._model_resolved:
+                self._resolve_model()
+            warm_up = getattr(self.ollama, "warm_up", None)
+            if warm_up is None:
+                return
+            start = time.perf_counter()
+            if warm_up():
+                logger.info("Model '%s' loaded in %.0f ms", self.ollama.model, (time.perf_counter() - start) * 1000)
             else:
-                print("[DEBUG] No models found in Ollama. Please pull a model.")
+                logger.info("Could not warm up model '%s'", self.ollama.model)
+
+        thread = threading.Thread(target=run, name="ollama-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _resolve_model(self):
+        # Check if gemma3 exists, if not, pick ANY available model
+        available = self.model_discovery.get(timeout=self.discovery_timeout)
+        if available is None:
+            logger.info("Model discovery still running. Using the current model for now.")
+            return
+        self._model_resolved = True
+        if available:
+            if self.external_model_name not in available:
+                logger.info("Default model '%s' not found. Switching to '%s'.", self.external_model_name, available[0])
+                self.external_model_name = available[0]
+                self.ollama.model = available[0]
+            else:
+                self.ollama.model = self.external_model_name
+                logger.info("Model '%s' found and ready.", self.external_model_name)
+        else:
+            logger.warning("No models found in Ollama. Please pull a model.")
+
+    def set_model(self, model_name):
+        """Select an Ollama model explicitly (skips auto-discovery)."""
+        self.external_model_name = model_name
+        self.ollama.model = model_name
+        self._model_resolved = True
 
     def load_knowledge(self):
-        if not os.path.exists(self.data_file): return {"questions": []}
-        try:
-            with open(self.data_file, 'r', encoding='utf-8') as f: return json.load(f)
-        except: return {"questions": []}
+        # Parsed once and kept in memory; the store only re-reads the file when it changes
+        return self.store.get()
 
     def save_knowledge(self):
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(self.knowledge, f, indent=4, ensure_ascii=False)
+        self.store.save(self.knowledge)
     
     def refresh_knowledge(self):
-        self.knowledge = self.load_knowledge()
+        self.knowledge = self.store.get()
+
+    def _semantic_index(self):
+        if self.semantic_index is None:
+            if not semantic_available():
+                logger.warning("Semantic retrieval needs numpy; falling back to '%s'.", self.store.default_strategy)
+                self.retrieval_strategy = self.store.default_strategy
+                return None
+            path = os.path.join(self.data_dir, "cache", "embeddings")
+            self.semantic_index = VectorIndex(path, OllamaEncoder(self.ollama, self.embedding_model))
+        return self.semantic_index
+
+    def _build_retriever(self, strategy):
+        if strategy != SemanticRetriever.name:
+            return self.store.retriever(strategy, self.partition_by_language)
+        index = self.semantic_index
+        entries = self.knowledge["questions"]
+        # Only questions without a vector yet (new or edited) are embedded
+        index.sync([self.store._key(e["q"]) for e in entries])
+        # Cosine matches cross scripts, so only the lexical half is partitioned
+        lexical = self.store.retriever(self.store.default_strategy, self.partition_by_language)
+        return SemanticRetriever(index, entries, lexical, self.store._key, self.semantic_min_score)
+
+    def _get_retriever(self):
+        strategy = self.retrieval_strategy
+        generation = None
+        if strategy == SemanticRetriever.name:
+            index = self._semantic_index()
+            if index is None:
+                strategy = self.retrieval_strategy
+            else:
+                generation = index.generation
+        key = (strategy, self.partition_by_language, self.store.version, generation)
+        retriever = self._retriever
+        if retriever is None or self._retriever_key != key:
+            # One build shared by every thread that asks at the same time
+            with self._retriever_lock:
+                if self._retriever is None or self._retriever_key != key:
+                    self._retriever = self._build_retriever(strategy)
+                    # The build itself may have added vectors
+                    if generation is not None:
+                        key = (strategy, self.partition_by_language, self.store.version,
+                               self.semantic_index.generation)
+                    self._retriever_key = key
+                retriever = self._retriever
+        return retriever
+
+    def get_knowledge_stats(self):
+        return dict(self.store.stats, backend=self.store.name, version=self.store.version,
+                    entries=len(self.knowledge["questions"]), partitions=self.get_partition_sizes())
+
+    def get_partition_sizes(self):
+        """Entries per script partition of the current index ({} before the first query or when off)."""
+        lexical = getattr(self._retriever, "lexical", self._retriever)
+        return dict(lexical.sizes) if isinstance(lexical, PartitionedRetriever) else {}
+
+    def get_metrics(self):
+        """Request counters and latency histograms (see telemetry.MetricsRegistry)."""
+        return METRICS.snapshot()
+
+    def find_exact(self, user_input, refresh=True):
+        """The entry whose normalized question equals the input's, or None. No fuzzy scoring."""
+        if refresh:
+            self.refresh_knowledge()
+        entry = self._get_retriever().prepared.exact.get(normalize(user_input))
+        METRICS.inc("exact_match", result="miss" if entry is None else "hit")
+        return entry
+
+    def find_matches(self, user_input, k=None, refresh=True):
+        """Top-k knowledge matches for the input as (score, entry), best first."""
+        if refresh:
+            self.refresh_knowledge()
+        query = normalize(user_input)
+        # Only the retriever's candidates are scored, each exactly once, against
+        # the questions normalized when the index was built
+        k = k or self.rag_top_k
+        retriever = self._get_retriever()
+        lexical = getattr(retriever, "lexical", retriever)
+        total = len(lexical.entries)
+        limit = scaled_limit(self.candidate_limit, total)
+        if isinstance(retriever, SemanticRetriever):
+            candidates, semantic = retriever.search(query, limit)
+            matches = rank_matches(query, candidates, k, semantic, retriever.prepared)
+        else:
+            candidates = retriever.candidates(query, limit)
+            matches = rank_matches(query, candidates, k, prepared=retriever.prepared)
+
+        if isinstance(lexical, PartitionedRetriever):
+            language = detect_language(query)
+            matches, outcome = widen_matches(query, lexical, matches, language, k, limit,
+                                             self.partition_fallback_score)
+            METRICS.inc("partition_lookups", partition=language, result=outcome)
+        if total > limit or isinstance(lexical, PartitionedRetriever):
+            matches, widened = widen_below_threshold(query, lexical, matches, self.match_threshold(), k,
+                                                     limit * self.candidate_widen)
+            if widened:
+                METRICS.inc("candidates_widened")
+        return matches
+
+    def match_threshold(self):
+        """Similarity from which the stored answer is used (the "accuracy" setting, 1-10 -> 0.1-0.9)."""
+        accuracy_threshold = int(self.emotion_manager.get_settings().get("accuracy", 8)) / 10.0
+        return max(0.1, min(0.9, accuracy_threshold))
 
     def _detect_language(self, text):
-        # ກວດສອບພາສາຈາກ Unicode tools
-        lao_count = 0
-        thai_count = 0
-        eng_count = 0
-        
-        for char in text:
-            code = ord(char)
-            if 0x0E80 <= code <= 0x0EFF:
-                lao_count += 1
-            elif 0x0E00 <= code <= 0x0E7F:
-                thai_count += 1
-            elif 0x0041 <= code <= 0x005A or 0x0061 <= code <= 0x007A:
-                eng_count += 1
-                
-        # ຕັດສິນໃຈວ່າພາສາໃດຫຼາຍທີ່ສຸດ
-        if lao_count > thai_count and lao_count > eng_count:
-            return "Lao"
-        elif thai_count > lao_count and thai_count > eng_count:
-            return "Thai"
-        elif eng_count > lao_count and eng_count > thai_count:
-            return "English"
-        return "Lao" # ຄ່າເລີ່ມຕົ້ນ
-
-    def get_response(self, user_input):
-        print(f"\n[DEBUG] Processing User Input: {user_input}")
-        
+        return detect_language(text)
+
+    def _prepare_reply(self, user_input, trace=None, session=None):
+        """Match the input against the knowledge base and decide how to answer it.
+
+        Returns a plan dict: "mode" is one of fast/enhance/rag/local, "prompt" is
+        the model prompt (or None), "text" the answer to use without a model and
+        "fallback" the answer to use if the model call fails.
+        """
+        trace = trace or Trace("prepare_reply", log=logger)
+        logger.debug("Processing user input: %s", user_input)
+        session = session or self.session
+        session.max_history = self.emotion_manager.memory_length()
+
+        with trace.span("reload"):
+            self.refresh_knowledge()
+        # The same ranked list gives the best match and the RAG context below
+        with trace.span("match"):
+            exact = self.find_exact(user_input, refresh=False)
+            if exact is not None:
+                top_matches = [(1.0, exact)]
+            else:
+                top_matches = self.find_matches(user_input, refresh=False)
+        with trace.span("prompt"):
+            return self._build_plan(user_input, top_matches, session, exact is not None)
+
+    def _build_plan(self, user_input, top_matches, session, exact=False):
         # 1. ກວດສອບພາສາທີ່ຜູ້ໃຊ້ພິມ
         detected_lang = self._detect_language(user_input)
-        print(f"[DEBUG] Detected Language: {detected_lang}")
-        
-        self.refresh_knowledge()
-        user_input_lower = user_input.lower().strip()
-        best_match = None
-        highest_similarity = 0.0
-
-        for entry in self.knowledge["questions"]:
-            similarity = SequenceMatcher(None, user_input_lower, entry["q"].lower()).ratio()
-            if similarity > highest_similarity:
-                highest_similarity = similarity
-                best_match = entry
+        logger.debug("Detected language: %s", detected_lang)
+
+        if top_matches:
+            highest_similarity, best_match = top_matches[0]
+        else:
+            highest_similarity, best_match = 0.0, None
         
-        print(f"[DEBUG] Best Local Match: '{best_match['q'] if best_match else 'None'}' (Similarity: {highest_similarity:.2f})")
+        logger.debug("Best local match: '%s' (similarity: %.2f)",
+                     best_match['q'] if best_match else 'None', highest_similarity)
 
-        accuracy_threshold = int(self.emotion_manager.settings.get("accuracy", 8)) / 10.0
-        real_threshold = max(0.1, min(0.9, accuracy_threshold))
+        real_threshold = self.match_threshold()
 
-        raw_response = ""
-        
         # 2. ກໍານົດຄໍາສັ່ງພາສາທີ່ເຂັ້ມງວດ
         lang_instruction = f"Strict Rule: You MUST answer in {detected_lang} Language ONLY. No other languages."
         if detected_lang == "Lao":
@@ -205,149 +565,449 @@ class ChatBot:
         
         # 3. ກໍລະນີພົບຂໍ້ມູນໃນຖານຂໍ້ມູນ (Strict Match)
         if highest_similarity >= real_threshold:
-            print("[DEBUG] Local Match Found.")
+            logger.debug("Local match found.")
             local_ans = best_match["a"]
             
             # ຖ້າຂໍ້ມູນຖືກຕ້ອງ 95% ແລະ ຍາວພໍ -> ຕອບເລີຍ (ໄວທັນໃຈ)
-            if highest_similarity > 0.95 and len(local_ans) > 50:
-                 print("[DEBUG] Perfect Match & Detailed Answer -> Returning Local directly (FAST MODE).")
-                 return self.emotion_manager.apply_style(local_ans)
+            skip_llm = highest_similarity > 0.95 and len(local_ans) > self.fast_answer_min_chars
+            if exact:
+                skip_llm = self.exact_skip_llm == "always" or (self.exact_skip_llm == "long" and skip_llm)
+            if skip_llm:
+                 logger.debug("Perfect match & detailed answer -> returning local directly (FAST MODE).")
+                 return {"mode": "fast", "prompt": None, "text": local_ans, "fallback": local_ans,
+                         "sources": [best_match]}
 
-            print("[DEBUG] Enhancing with AI...")
+            if not self.use_external_model:
+                return {"mode": "local", "prompt": None, "text": local_ans, "fallback": local_ans,
+                        "sources": [best_match]}
+
+            logger.debug("Enhancing with AI...")
             
-            if self.use_external_model:
-                try:
-                    # ຄໍາສັ່ງໃຫ້ AI ປັບປຸງຄໍາຕອບ
-                    HISTORY_CONTEXT = "\n".join(self.conversation_history)
-                    prompt = (
-                        f"Instructions: You are a helpful AI Assistant. \n"
-                        f"I have an answer from my database: '{local_ans}'. \n"
-                        f"Please rewrite this answer to be more polite, natural, and helpful. \n"
-                        f"IMPORTANT: Please expand on the answer. Add relevant details or explanations to make it comprehensive.\n"
-                        f"{lang_instruction}\n"
-                        f"Constraint: Do NOT provide Romanized pronunciation in parentheses. \n"
-                        f"Constraint: Do not use 'Ka/Krap' slash format. Speak naturally. \n"
-                        f"Context from previous conversation:\n{HISTORY_CONTEXT}\n"
-                        f"User Question: {user_input}\n"
-                        f"Enhanced Answer:"
-                    )
-                    
-                    if self.active_provider == "gemini":
-                        raw_response = self.gemini.generate_response(prompt)
-                    else:
-                        raw_response = self.ollama.generate_response(prompt)
-                        
-                    print(f"[DEBUG] AI Enhanced Answer: {raw_response[:30]}...")
-                except:
-                    raw_response = local_ans
-            else:
-                raw_response = local_ans
+            # ຄໍາສັ່ງໃຫ້ AI ປັບປຸງຄໍາຕອບ
+            prompt, followup, tokens = self.prompt_builder.build_enhance(user_input, local_ans,
+                                                                         lang_instruction, session)
+            METRICS.observe("prompt_tokens", tokens, mode="enhance")
+            return {"mode": "enhance", "prompt": prompt, "followup": followup, "text": local_ans,
+                    "fallback": local_ans, "sources": [best_match], "prompt_tokens": tokens}
             
         # 4. ກໍລະນີບໍ່ພົບຂໍ້ມູນກົງໆ (Hybrid/RAG)
-        elif self.use_external_model:
-            print("[DEBUG] Entering HYBRID/RAG Mode (AI Enabled)...")
-            
-            # ຊອກຫາຂໍ້ມູນໃກ້ຄຽງ 5 ອັນດັບ
-            context = "Information from Knowledge Base:\n"
-            data_matches = sorted(self.knowledge["questions"], 
-                                key=lambda x: SequenceMatcher(None, user_input_lower, x["q"].lower()).ratio(), 
-                                reverse=True)[:5]
-            
-            found_context = False
-            for m in data_matches: 
-                if SequenceMatcher(None, user_input_lower, m["q"].lower()).ratio() > 0.15:
-                    context += f"- Q: {m['q']} | A: {m['a']}\n"
-                    found_context = True
-            
-            if not found_context:
-                context = "No specific local data available."
-
-            # Build Prompt with History
-            history_text = "\n".join(self.conversation_history)
-            prompt = (
-                f"Instructions: You are a helpful AI Assistant. \n"
-                f"You have access to a local knowledge base (provided below). \n"
-                f"Use that information as a starting point, but please EXPAND on it. \n"
-                f"Provide a detailed, comprehensive, and helpful response. \n"
-                f"{lang_instruction}\n"
-                f"Constraint: Do NOT provide Romanized pronunciation. Write ONLY the script.\n"
-                f"Constraint: Speak naturally. Avoid mechanical repetitive greetings.\n\n"
-                f"Previous Conversation:\n{history_text}\n\n"
-                f"{context}\n"
-                f"User Question: {user_input}\n"
-                f"Answer:"
-            )
-            
-            # ເອີ້ນໃຊ້ AI Model
-            ai_success = False
-            try:
-                if self.active_provider == "gemini":
-                    raw_response = self.gemini.generate_response(prompt)
-                else:
-                    raw_response = self.ollama.generate_response(prompt)
-                
-                if "Error" in raw_response or "404" in raw_response:
-                    ai_success = False
-                else:
-                    ai_success = True
-            except Exception as e:
-                print(f"[DEBUG] Exception calling model: {e}")
-                ai_success = False
+        if self.use_external_model:
+            logger.debug("Entering HYBRID/RAG mode (AI enabled)...")
             
+            # ຊອກຫາຂໍ້ມູນໃກ້ຄຽງ 5 ອັນດັບ, best first, cut to the prompt budget (with history)
+            prompt, followup, sources, tokens = self.prompt_builder.build_rag(user_input, top_matches,
+                                                                              lang_instruction, session)
+            METRICS.observe("prompt_tokens", tokens, mode="rag")
             # ຖ້າ AI ຕອບບໍ່ໄດ້
-            if not ai_success:
-                print("[DEBUG] AI Failed. Falling back to simple Local Logic.")
-                if highest_similarity < 0.3:
-                    raw_response = "ຂໍໂທດ, ຂ້ອຍບໍ່ເຂົ້າໃຈຄຳຖາມນີ້ (AI Error)."
-                else:
-                    raw_response = "ຂ້ອຍບໍ່ແນ່ໃຈປານໃດ... (AI Error)"
+            if highest_similarity < 0.3:
+                fallback = "ຂໍໂທດ, ຂ້ອຍບໍ່ເຂົ້າໃຈຄຳຖາມນີ້ (AI Error)."
+            else:
+                fallback = "ຂ້ອຍບໍ່ແນ່ໃຈປານໃດ... (AI Error)"
+            return {"mode": "rag", "prompt": prompt, "followup": followup, "text": fallback,
+                    "fallback": fallback, "sources": sources, "prompt_tokens": tokens}
         
         # 5. ກໍລະນີ AI ປິດ ແລະ ບໍ່ມີຂໍ້ມູນ
+        logger.debug("AI disabled and no local match.")
+        if highest_similarity < 0.3:
+            text = "ຂໍໂທດ, ຂ້ອຍບໍ່ເຂົ້າໃຈຄຳຖາມນີ້."
         else:
-            print("[DEBUG] AI Disabled and no local match.")
-            if highest_similarity < 0.3:
-                raw_response = "ຂໍໂທດ, ຂ້ອຍບໍ່ເຂົ້າໃຈຄຳຖາມນີ້."
-            else:
-                raw_response = "ຂ້ອຍບໍ່ແນ່ໃຈປານໃດ..."
+            text = "ຂ້ອຍບໍ່ແນ່ໃຈປານໃດ..."
+        return {"mode": "local", "prompt": None, "text": text, "fallback": text, "sources": []}
+
+    def _provider_client(self, name):
+        if name == "gemini":
+            return self.gemini
+        if not self._model_resolved:
+            self._resolve_model()
+        return self.ollama
+
+    def _active_client(self):
+        return self._provider_client(self.active_provider)
+
+    def get_provider_health(self):
+        return self.router.snapshot()
+
+    def _cache_key(self, user_input, plan, session):
+        client = self._active_client()
+        model = getattr(client, "model", None) or getattr(client, "api_url", "")
+        return ResponseCache.make_key(user_input, plan["sources"], self.active_provider, model,
+                                      session.summary + session.history, self.emotion_manager.model_options())
+
+    def _cache_put(self, key, raw_response, plan):
+        # The key names the active provider; an answer the router got elsewhere
+        # (failover, hedging) must not be served later as that provider's
+        if plan.get("provider") != self.active_provider:
+            logger.debug("Not caching answer from %s (active: %s).", plan.get("provider"), self.active_provider)
+            return
+        self.response_cache.put(key, raw_response, [e["q"] for e in plan["sources"]])
+
+    def _reusable_context(self, session, client):
+        """The session's Ollama context if the next turn can build on it, else None."""
+        if not self.reuse_context or session is None or session.model_context is None:
+            return None
+        if session.context_model != getattr(client, "model", None):
+            return None
+        if session.context_turns >= session.max_history or len(session.model_context) > self.context_limit:
+            return None
+        return session.model_context
+
+    def _generate(self, plan, trace, skip=(), session=None):
+        """Call the models through the router; returns (text, ok). On failure text is the plan's fallback.
+
+        Raises ModelBusyError when no provider had a free slot (see set_model_concurrency).
+        An Ollama answer also leaves its context in plan["context"] (see ChatSession.update_context).
+        Only the returned answer's context is stored: a hedged call that lost keeps running and
+        must not touch the plan, so every attempt hands its context back through the router.
+        """
+        primary = self.active_provider
+        client = self._active_client()
+        model = getattr(client, "model", None) or getattr(client, "api_url", "")
+        options = self.emotion_manager.model_options()
+        context = self._reusable_context(session, self.ollama)
+
+        def call(name, client, prompt):
+            with self._model_slot(trace, name):
+                if name != "ollama" or not hasattr(client, "generate"):
+                    return client.generate_response(prompt, options=options)
+                if context is not None:
+                    prompt = plan["followup"]
+                text, new_context = client.generate(prompt, options, context)
+                return text, {"context": new_context, "context_model": client.model,
+                              "context_reused": context is not None}
+
+        def routed():
+            return self.router.generate(plan["prompt"], primary, call, skip)
+
+        # ເອີ້ນໃຊ້ AI Model
+        try:
+            with trace.span("llm"):
+                if context is not None:
+                    # Prompt depends on this session's context, so nobody else can share the call
+                    (raw_response, provider, ok, extra), shared = routed(), False
+                else:
+                    (raw_response, provider, ok, extra), shared = self._inflight.do(
+                        (primary, model, plan["prompt"]), routed)
+            plan["provider"] = provider
+            if shared:
+                METRICS.inc("model_coalesced", provider=primary)
+            elif ok and extra:
+                # The context must belong to the very answer that goes into the history
+                plan.update(extra)
+        except ModelBusyError:
+            METRICS.inc("model_busy", provider=primary)
+            raise
+        except Exception as e:
+            logger.warning("Exception calling model: %s", e)
+            METRICS.inc("model_errors", provider=primary)
+            return plan["fallback"], False
+
+        if not ok:
+            # Enhance keeps the local answer, RAG the canned apology
+            METRICS.inc("model_errors", provider=provider or primary)
+            logger.warning("AI failed (%s). Falling back to simple local logic.",
+                           (raw_response or "no provider available")[:80])
+            return plan["fallback"], False
+        logger.debug("AI answer from %s: %s...", provider, raw_response[:30])
+        return raw_response, True
+
+    def _finish_reply(self, user_input, raw_response, cancel_event=None, session=None):
+        # A cancelled request must not leave its answer in the history
+        if cancel_event is not None and cancel_event.is_set():
+            logger.debug("Request cancelled. Discarding reply.")
+            return None
 
         # Update History
-        self.conversation_history.append(f"User: {user_input}")
-        self.conversation_history.append(f"AI: {raw_response}")
-        if len(self.conversation_history) > self.max_history * 2:
-            self.conversation_history = self.conversation_history[-(self.max_history*2):]
+        (session or self.session).add_turn(user_input, raw_response)
 
         return self.emotion_manager.apply_style(raw_response)
 
+    def _cached_response(self, user_input, plan, trace, session):
+        with trace.span("cache"):
+            key = self._cache_key(user_input, plan, session)
+            raw_response = self.response_cache.get(key)
+        METRICS.inc("response_cache", result="miss" if raw_response is None else "hit")
+        if raw_response is not None:
+            logger.debug("Response cache hit.")
+        return key, raw_response
+
+    def get_response(self, user_input, cancel_event=None, session=None):
+        # Spans: reload, match, prompt, cache, llm_wait, llm, style (see telemetry.Trace)
+        session = session or self.session
+        trace = Trace("get_response", log=logger, slow_ms=self.slow_request_ms)
+        plan = self._prepare_reply(user_input, trace, session)
+        branch = plan["mode"]
+        if branch == "fast":
+            with trace.span("style"):
+                reply = self.emotion_manager.apply_style(plan["text"])
+            trace.finish(branch)
+            return reply
+
+        if plan["prompt"] is None:
+            raw_response = plan["text"]
+        else:
+            key, raw_response = self._cached_response(user_input, plan, trace, session)
+            if raw_response is not None:
+                branch = "cached"
+            else:
+                raw_response, ok = self._generate(plan, trace, session=session)
+                if ok:
+                    self._cache_put(key, raw_response, plan)
+                else:
+                    branch = "fallback"
+        with trace.span("style"):
+            reply = self._finish_reply(user_input, raw_response, cancel_event, session)
+        if reply is not None:
+            session.update_context(plan.get("context") if branch == plan["mode"] else None,
+                                   plan.get("context_model"), plan.get("context_reused"))
+        trace.finish(branch if reply is not None else "cancelled")
+        return reply
+
+    def stream_response(self, user_input, cancel_event=None, session=None):
+        """Generator version of get_response that yields the answer as it is produced.
+
+        Yields ("delta", text) for every chunk received from the model (unstyled),
+        then a single ("final", styled_reply). Nothing is yielded after a cancel.
+        ModelBusyError is raised before the first chunk when the model has no free slot.
+        """
+        session = session or self.session
+        trace = Trace("stream_response", log=logger, slow_ms=self.slow_request_ms)
+        plan = self._prepare_reply(user_input, trace, session)
+        branch = plan["mode"]
+        if branch == "fast":
+            with trace.span("style"):
+                reply = self.emotion_manager.apply_style(plan["text"])
+            trace.finish(branch)
+            yield ("final", reply)
+            return
+
+        if plan["prompt"] is None:
+            raw_response = plan["text"]
+        else:
+            key, raw_response = self._cached_response(user_input, plan, trace, session)
+            if raw_response is not None:
+                branch = "cached"
+                yield ("delta", raw_response)
+            else:
+                parts = []
+                completed = False
+                error = None
+                # Streams from the first healthy provider (active_provider unless its circuit is open)
+                candidates = self.router.candidates(self.active_provider)
+                provider = candidates[0] if candidates else self.active_provider
+                client = self._provider_client(provider)
+                options = self.emotion_manager.model_options()
+                if provider == "ollama" and hasattr(client, "generate"):
+                    context = self._reusable_context(session, client)
+                    result = {}
+                    chunks = client.stream_response(plan["followup"] if context is not None else plan["prompt"],
+                                                    options=options, context=context, result=result)
+                else:
+                    context = result = None
+                    chunks = client.stream_response(plan["prompt"], options=options)
+                with self._model_slot(trace, provider):
+                    # Timed by hand: the consumer's time between chunks is not ours to span
+                    llm_start = time.perf_counter()
+                    try:
+                        for chunk in chunks:
+                            if cancel_event is not None and cancel_event.is_set():
+                                break
+                            if not parts:
+                                trace.add("llm_first_chunk", (time.perf_counter() - llm_start) * 1000)
+                            parts.append(chunk)
+                            yield ("delta", chunk)
+                        else:
+                            completed = True
+                    except Exception as e:
+                        logger.warning("Exception while streaming from model: %s", e)
+                        METRICS.inc("model_errors", provider=provider)
+                        error = str(e)
+                    llm_ms = (time.perf_counter() - llm_start) * 1000
+                    trace.add("llm", llm_ms)
+                if provider in self.router.health and (parts or error):
+                    self.router.record(provider, bool(parts), llm_ms, error)
+                if completed:
+                    plan["provider"] = provider
+
+                if not parts and error is not None and not (cancel_event is not None and cancel_event.is_set()):
+                    # Nothing streamed yet, so the other providers can still answer in one piece
+                    raw_response, ok = self._generate(plan, trace, skip=(provider,), session=session)
+                    if ok:
+                        parts.append(raw_response)
+                        completed = True
+                        yield ("delta", raw_response)
+                elif completed and result:
+                    plan.update(context=result.get("context"), context_model=client.model,
+                                context_reused=context is not None)
+                # Keep whatever arrived before a mid-stream failure
+                raw_response = "".join(parts) if parts else plan["fallback"]
+                if completed and parts:
+                    self._cache_put(key, raw_response, plan)
+                elif not parts:
+                    branch = "fallback"
+
+        with trace.span("style"):
+            reply = self._finish_reply(user_input, raw_response, cancel_event, session)
+        if reply is not None:
+            session.update_context(plan.get("context") if branch == plan["mode"] else None,
+                                   plan.get("context_model"), plan.get("context_reused"))
+        trace.finish(branch if reply is not None else "cancelled")
+        if reply is not None:
+            yield ("final", reply)
+
+    # Batch API (nightly regression runs, bulk FAQ answering)
+    def match_batch(self, queries, k=None, workers=None, chunk_size=256):
+        """find_matches for many queries at once, without touching any session.
+
+        Returns [{"query", "language", "matches"}, ...] in input order, matches
+        being (score, entry) like find_matches. Batches larger than one chunk
+        are matched in `workers` processes (see batch.py).
+        """
+        queries = list(queries)
+        results = [None] * len(queries)
+        for i, language, matches in self._match_stream(queries, k, workers, chunk_size, "match"):
+            results[i] = {"query": queries[i], "language": language, "matches": matches}
+        return results
+
+    def _match_stream(self, queries, k, workers, chunk_size, kind):
+        """Yield (index, language, matches) per query, in the order the chunks finish."""
+        METRICS.inc("batch_queries", len(queries), kind=kind)
+        self.refresh_knowledge()
+        k = k or self.rag_top_k
+        retriever = self._get_retriever()
+        workers = workers or default_workers()
+        # Starting processes does not pay off for one chunk, and the semantic
+        # strategy needs the embedding index, which only this process has
+        if workers <= 1 or len(queries) <= chunk_size or isinstance(retriever, SemanticRetriever):
+            for i, query in enumerate(queries):
+                yield i, detect_language(query), self.find_matches(query, k, refresh=False)
+            return
+        entries = list(self.knowledge["questions"])
+        fallback_score = self.partition_fallback_score if self.partition_by_language else None
+        # Same candidate limits as find_matches
+        limit = scaled_limit(self.candidate_limit, len(entries))
+        widen = None
+        if len(entries) > limit or self.partition_by_language:
+            widen = (self.match_threshold(), limit * self.candidate_widen)
+        for start, results in match_in_processes(entries, queries, k, retriever.name, limit,
+                                                 fallback_score, workers, chunk_size, widen):
+            for offset, (language, matches) in enumerate(results):
+                yield start + offset, language, matches
+
+    def answer_batch(self, queries, concurrency=None, workers=None, chunk_size=256):
+        """Answer many independent questions; yields one dict per query as soon as it is done.
+
+        Results come in completion order, each with "index" (position in
+        `queries`), "query", "language", "mode" (fast/local/enhance/rag/cached/
+        fallback), "answer", "sources" and "ms". Every query gets its own empty
+        session, so the chat history is left alone and no answer depends on
+        another. Model calls run on at most `concurrency` threads (default
+        model_concurrency) and still go through the per-provider slots, so a
+        batch cannot starve live chat traffic of more than that.
+        """
+        queries = list(queries)
+        concurrency = max(1, int(concurrency or self.model_concurrency))
+        pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch-llm")
+        pending = set()
+        try:
+            for i, language, matches in self._match_stream(queries, None, workers, chunk_size, "answer"):
+                trace = Trace("answer_batch", log=logger, slow_ms=self.slow_request_ms)
+                session = self.new_session()
+                with trace.span("prompt"):
+                    exact = self.find_exact(queries[i], refresh=False)
+                    if exact is not None:
+                        matches = [(1.0, exact)]
+                    plan = self._build_plan(queries[i], matches, session, exact is not None)
+                if plan["prompt"] is None:
+                    yield self._batch_answer(i, queries[i], language, plan, session, trace)
+                else:
+                    pending.add(pool.submit(self._batch_answer, i, queries[i], language, plan, session, trace))
+                # Hand back finished answers, and stop queueing prompts while the models are behind
+                while pending:
+                    done, pending = wait(pending, timeout=0 if len(pending) < concurrency * 4 else None,
+                                         return_when=FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _batch_answer(self, index, query, language, plan, session, trace):
+        branch = plan["mode"]
+        if plan["prompt"] is None:
+            raw_response = plan["text"]
+        else:
+            key, raw_response = self._cached_response(query, plan, trace, session)
+            if raw_response is not None:
+                branch = "cached"
+            else:
+                raw_response, ok = self._generate(plan, trace, session=session)
+                if ok:
+                    self._cache_put(key, raw_response, plan)
+                else:
+                    branch = "fallback"
+        with trace.span("style"):
+            answer = self.emotion_manager.apply_style(raw_response)
+        ms = trace.finish(branch)
+        return {"index": index, "query": query, "language": language, "mode": branch, "answer": answer,
+                "sources": [e["q"] for e in plan["sources"]], "ms": ms}
+
     # CRUD Operations
+    # Each change is one appended log line / transaction (see knowledge_store.py), not a full rewrite
     def add_knowledge(self, question, answer):
+        try:
+            result = self.store.upsert(question, answer)
+        except RuntimeError as e:
+            logger.error("add_knowledge failed: %s", e)
+            return "Error"
         self.refresh_knowledge()
-        for entry in self.knowledge["questions"]:
-            if entry["q"].lower() == question.lower().strip():
-                entry["a"] = answer.strip()
-                self.save_knowledge()
-                return "Updated"
-        self.knowledge["questions"].append({"q": question.strip(), "a": answer.strip()})
-        self.save_knowledge()
-        return "Added"
+        if result == "Updated":
+            self.response_cache.invalidate_question(question)
+        return result
+
+    def bulk_upsert(self, pairs):
+        """Add/update many pairs in one write. Accepts (q, a) tuples or {"q", "a"} dicts."""
+        items = []
+        for p in pairs:
+            q, a = (p["q"], p["a"]) if isinstance(p, dict) else p
+            if str(q).strip() and str(a).strip():
+                items.append((str(q), str(a)))
+        try:
+            result = self.store.bulk_upsert(items)
+        except RuntimeError as e:
+            logger.error("bulk_upsert failed: %s", e)
+            return {"added": 0, "updated": 0, "unchanged": 0, "updated_questions": [], "error": str(e)}
+        self.refresh_knowledge()
+        for q in result["updated_questions"]:
+            self.response_cache.invalidate_question(q)
+        return result
 
     def delete_knowledge(self, q_text):
+        try:
+            deleted = self.store.delete(q_text)
+        except RuntimeError as e:
+            logger.error("delete_knowledge failed: %s", e)
+            return False
         self.refresh_knowledge()
-        initial = len(self.knowledge["questions"])
-        self.knowledge["questions"] = [q for q in self.knowledge["questions"] if q["q"].lower() != q_text.lower()]
-        if len(self.knowledge["questions"]) < initial:
-            self.save_knowledge()
-            return True
-        return False
+        if deleted:
+            self.response_cache.invalidate_question(q_text)
+        return deleted
         
     def edit_knowledge(self, old_q, new_q, new_a):
+        try:
+            edited = self.store.edit(old_q, new_q, new_a)
+        except RuntimeError as e:
+            logger.error("edit_knowledge failed: %s", e)
+            return False
         self.refresh_knowledge()
-        for entry in self.knowledge["questions"]:
-            if entry["q"].lower() == old_q.lower():
-                entry["q"] = new_q.strip()
-                entry["a"] = new_a.strip()
-                self.save_knowledge()
-                return True
-        return False
+        if edited:
+            self.response_cache.invalidate_question(old_q)
+            self.response_cache.invalidate_question(new_q)
+        return edited
 
     def get_all_questions(self):
         self.refresh_knowledge()
@@ -356,8 +1016,8 @@ class ChatBot:
     def backup_data(self):
         os.makedirs(self.backup_dir, exist_ok=True)
         ts = int(time.time())
-        if os.path.exists(self.data_file):
-            shutil.copy2(self.data_file, os.path.join(self.backup_dir, f"knowledge_{ts}.json"))
+        # Always a knowledge.json-style file, whatever the backend
+        self.store.backup(os.path.join(self.backup_dir, f"knowledge_{ts}.json"))
         return f"Backup {ts}"
 
     def clean_duplicates(self):
@@ -365,8 +1025,9 @@ class ChatBot:
         seen = set()
         unique = []
         for q in self.knowledge["questions"]:
-            if q["q"].lower() not in seen:
-                seen.add(q["q"].lower())
+            key = self.store._key(q["q"])
+            if key not in seen:
+                seen.add(key)
                 unique.append(q)
         self.knowledge["questions"] = unique
         self.save_knowledge()
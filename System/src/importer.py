@@ -0,0 +1,93 @@
+import csv
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Header names accepted for the question / answer columns (case-insensitive)
+QUESTION_HEADERS = ("q", "question", "ຄຳຖາມ")
+ANSWER_HEADERS = ("a", "answer", "ຄຳຕອບ")
+
+
+def iter_csv(path):
+    """Yield (q, a) pairs from a CSV file one row at a time.
+
+    Uses the q/a (or question/answer) columns when the first row is a header,
+    otherwise the first two columns of every row.
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        header = [c.strip().lower() for c in first]
+        qi = next((i for i, c in enumerate(header) if c in QUESTION_HEADERS), None)
+        ai = next((i for i, c in enumerate(header) if c in ANSWER_HEADERS), None)
+        if qi is None or ai is None:
+            qi, ai = 0, 1
+            if len(first) > 1:
+                yield first[0], first[1]
+        for row in reader:
+            if len(row) > max(qi, ai):
+                yield row[qi], row[ai]
+
+
+def iter_jsonl(path):
+    """Yield (q, a) pairs from a JSON Lines file ({"q": ..., "a": ...} per line)."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping bad JSON on line %d of %s", line_no, path)
+                continue
+            if isinstance(item, dict):
+                q = item.get("q", item.get("question"))
+                a = item.get("a", item.get("answer"))
+                if q is not None and a is not None:
+                    yield q, a
+
+
+def iter_records(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return iter_csv(path)
+    if ext in (".jsonl", ".ndjson"):
+        return iter_jsonl(path)
+    raise ValueError(f"Unsupported import file type: {ext}")
+
+
+def import_file(chatbot, path, batch_size=1000, progress=None):
+    """Stream a CSV/JSONL file into the knowledge base in batches.
+
+    Only one batch is held in memory at a time and each batch is persisted
+    with a single write. `progress(totals)` is called after every batch.
+    """
+    totals = {"read": 0, "added": 0, "updated": 0, "unchanged": 0}
+
+    def flush(batch):
+        result = chatbot.bulk_upsert(batch)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        for k in ("added", "updated", "unchanged"):
+            totals[k] += result[k]
+        if progress:
+            progress(dict(totals))
+
+    batch = []
+    for q, a in iter_records(path):
+        q, a = str(q).strip(), str(a).strip()
+        if not q or not a:
+            continue
+        batch.append((q, a))
+        totals["read"] += 1
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return totals
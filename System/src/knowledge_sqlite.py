@@ -0,0 +1,490 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from .knowledge_store import KnowledgeBackend, _atomic_write
+from .retrieval import RETRIEVERS, PartitionedRetriever
+from .text_norm import normalize
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS knowledge (
+    id INTEGER PRIMARY KEY,
+    q TEXT NOT NULL,
+    qkey TEXT NOT NULL,
+    nq TEXT NOT NULL DEFAULT '',
+    a TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_knowledge_qkey ON knowledge (qkey);
+CREATE TABLE IF NOT EXISTS knowledge_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL
+);
+"""
+
+# External-content FTS table over knowledge.nq (the normalized question, see
+# text_norm.normalize), kept in step by triggers. Queries are normalized too,
+# so both sides of a match have the same canonical form.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+    nq, content='knowledge', content_rowid='id', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts_vocab USING fts5vocab(knowledge_fts, row);
+CREATE TRIGGER IF NOT EXISTS knowledge_fts_ai AFTER INSERT ON knowledge BEGIN
+    INSERT INTO knowledge_fts (rowid, nq) VALUES (new.id, new.nq);
+END;
+CREATE TRIGGER IF NOT EXISTS knowledge_fts_ad AFTER DELETE ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, nq) VALUES ('delete', old.id, old.nq);
+END;
+CREATE TRIGGER IF NOT EXISTS knowledge_fts_au AFTER UPDATE OF nq ON knowledge BEGIN
+    INSERT INTO knowledge_fts (knowledge_fts, rowid, nq) VALUES ('delete', old.id, old.nq);
+    INSERT INTO knowledge_fts (rowid, nq) VALUES (new.id, new.nq);
+END;
+"""
+FTS_OBJECTS = (("TRIGGER", "knowledge_fts_ai"), ("TRIGGER", "knowledge_fts_ad"), ("TRIGGER", "knowledge_fts_au"),
+               ("TABLE", "knowledge_fts_vocab"), ("TABLE", "knowledge_fts"))
+
+# PRAGMA user_version; bumped whenever the columns computed in Python (qkey, nq)
+# change meaning, so older databases get them recomputed on open.
+# 1: nq added; 2: qkey is KnowledgeBackend._key (casefold) instead of lower()
+SCHEMA_VERSION = 2
+
+
+class FtsRetriever:
+    """Candidates from the SQLite FTS5 trigram index, ranked by bm25.
+
+    The index holds the normalized questions (knowledge.nq) and the query is
+    normalized too. It is split into its character trigrams (Lao has no word breaks).
+    Like NgramRetriever, only the rarest trigrams are sent to the index:
+    ranking an OR over trigrams found in most rows would touch the whole
+    table. Queries shorter than a trigram use LIKE.
+    """
+    name = "fts"
+    max_terms = 16
+    max_postings = 1000
+
+    def __init__(self, store):
+        self.store = store
+        self.entries = store.data["questions"]
+        self.prepared = store.prepared.prepare(self.entries)
+
+    def _select_terms(self, grams):
+        docs = self.store._term_doc_counts(grams)
+        # Counts may be a little stale; a 0 costs nothing to query, so keep it
+        ranked = sorted((docs.get(g, 0), g) for g in grams)
+        selective = [g for n, g in ranked if n <= self.max_postings][:self.max_terms]
+        # Only common trigrams matched: fall back to the few rarest of them
+        return selective or [g for _, g in ranked[:3]]
+
+    def candidates(self, query, limit=50):
+        if len(self.entries) <= limit:
+            return self.entries
+        text = query # already normalized
+        if not text:
+            return []
+
+        store = self.store
+        grams = list(dict.fromkeys(text[i:i + 3] for i in range(len(text) - 2)))
+        if grams:
+            grams = self._select_terms(grams)
+            sql = ("SELECT k.q FROM knowledge_fts JOIN knowledge k ON k.id = knowledge_fts.rowid "
+                   "WHERE knowledge_fts MATCH ? ORDER BY rank LIMIT ?")
+            arg = " OR ".join('"' + g.replace('"', '""') + '"' for g in grams)
+        else:
+            sql = "SELECT q FROM knowledge WHERE nq LIKE ? ESCAPE '\\' LIMIT ?"
+            arg = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+        with store._lock:
+            try:
+                rows = store._conn.execute(sql, (arg, limit)).fetchall()
+            except sqlite3.Error as e:
+                logger.warning("FTS lookup failed: %s", e)
+                return []
+            index = store._index
+            result = []
+            for (q,) in rows:
+                entry = index.get(store._key(q))
+                if entry is not None:
+                    result.append(entry)
+            return result
+
+
+class SqliteKnowledgeStore(KnowledgeBackend):
+    """Knowledge backend on a single SQLite database (knowledge.db).
+
+    WAL mode lets the chat and admin processes read while the other writes;
+    writes run in BEGIN IMMEDIATE transactions, so they are serialized by
+    SQLite itself. Questions are unique by qkey, computed in Python by
+    KnowledgeBackend._key (SQLite's lower() only folds ASCII, so it would
+    disagree with the JSON backend); nq holds the normalized text the FTS
+    index is built on.
+    Every change is also recorded in knowledge_log, so a process that sees
+    PRAGMA data_version move only replays the new operations instead of
+    re-reading the whole table.
+    """
+    name = "sqlite"
+    default_strategy = "fts"
+
+    def __init__(self, db_path, backup_dir=None, compact_every=500, log_keep=10000, busy_timeout=5.0):
+        super().__init__()
+        self.data_file = db_path
+        self.backup_dir = backup_dir
+        self.compact_every = compact_every
+        self.log_keep = log_keep
+        self._data_version = None
+        self._ops_since_compact = 0
+        self._compacting = False
+        self.fts_enabled = False
+        self._term_docs = {} # trigram -> number of questions containing it
+        self._term_docs_rows = 0
+
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._upgrade_schema()
+            had_fts = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'knowledge_fts'").fetchone() is not None
+            try:
+                self._conn.executescript(FTS_SCHEMA)
+                self.fts_enabled = True
+                if not had_fts:
+                    # Rows written before the index existed
+                    self._conn.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+            except sqlite3.OperationalError as e:
+                # SQLite < 3.34 has no trigram tokenizer; n-gram retrieval still works
+                logger.warning("FTS5 trigram index unavailable: %s", e)
+
+    def _upgrade_schema(self):
+        """Bring an older database to SCHEMA_VERSION: add the nq column and recompute qkey / nq."""
+        c = self._conn
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have upgraded it while we waited for the lock
+            if c.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                if "nq" not in {row[1] for row in c.execute("PRAGMA table_info(knowledge)")}:
+                    c.execute("ALTER TABLE knowledge ADD COLUMN nq TEXT NOT NULL DEFAULT ''")
+                # The index is rebuilt over the new column by _create_schema
+                for kind, name in FTS_OBJECTS:
+                    c.execute(f"DROP {kind} IF EXISTS {name}")
+                self._recompute_keys()
+                c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def _recompute_keys(self):
+        """Recompute qkey and nq from q; rows whose new key collides with an earlier row are dropped."""
+        c = self._conn
+        keys = set()
+        updates, dropped = [], []
+        for row_id, q in c.execute("SELECT id, q FROM knowledge ORDER BY id").fetchall():
+            key = self._key(q)
+            if key in keys:
+                dropped.append((row_id,))
+                continue
+            keys.add(key)
+            updates.append((key, normalize(q), row_id))
+        if dropped:
+            logger.warning("Dropping %d questions that duplicate earlier ones", len(dropped))
+            c.executemany("DELETE FROM knowledge WHERE id = ?", dropped)
+        # Keys are swapped in place, so the unique index is rebuilt afterwards
+        c.execute("DROP INDEX IF EXISTS idx_knowledge_qkey")
+        c.executemany("UPDATE knowledge SET qkey = ?, nq = ? WHERE id = ?", updates)
+        c.execute("CREATE UNIQUE INDEX idx_knowledge_qkey ON knowledge (qkey)")
+        if updates:
+            # Other processes reload instead of replaying
+            c.execute("INSERT INTO knowledge_log (op) VALUES (?)", ('{"op": "reset"}',))
+        self._dirty = True
+
+    def rebuild_search_index(self):
+        """Recompute qkey / nq for every row and rebuild the FTS index from them."""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._recompute_keys()
+                    if self.fts_enabled:
+                        self._conn.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                raise RuntimeError(f"Knowledge database reindex failed: {e}")
+            self._term_docs = {}
+            self._sync()
+
+    def retriever(self, strategy, partitioned=False):
+        if strategy == FtsRetriever.name or strategy not in RETRIEVERS:
+            if self.fts_enabled:
+                fts = FtsRetriever(self)
+                # One FTS index for every script; the partitions filter its candidates
+                return PartitionedRetriever(fts.entries, fts.prepared, shared=fts) if partitioned else fts
+            strategy = "ngram"
+        return super().retriever(strategy, partitioned)
+
+    def _term_doc_counts(self, grams):
+        """Document frequency per trigram, cached until the table size drifts by 10%."""
+        with self._lock:
+            rows = len(self.data["questions"])
+            if abs(rows - self._term_docs_rows) > self._term_docs_rows // 10:
+                self._term_docs = {}
+                self._term_docs_rows = rows
+            missing = [g for g in grams if g not in self._term_docs]
+            if missing:
+                found = dict(self._conn.execute(
+                    f"SELECT term, doc FROM knowledge_fts_vocab WHERE term IN ({','.join('?' * len(missing))})",
+                    missing).fetchall())
+                for g in missing:
+                    self._term_docs[g] = found.get(g, 0)
+            return {g: self._term_docs[g] for g in grams}
+
+    # Reading
+    def _sync(self):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._dirty:
+            self._reload()
+        elif data_version != self._data_version:
+            self._replay_log()
+        self._data_version = data_version
+
+    def _reload(self):
+        start = time.perf_counter()
+        in_txn = self._conn.in_transaction
+        if not in_txn:
+            self._conn.execute("BEGIN") # one consistent snapshot of both tables
+        try:
+            row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'knowledge_log'").fetchone()
+            seq = row[0] if row else 0
+            questions = [{"q": q, "a": a} for q, a in
+                         self._conn.execute("SELECT q, a FROM knowledge ORDER BY id")]
+        finally:
+            if not in_txn:
+                self._conn.execute("COMMIT")
+        self._dirty = False
+        self.data = {"questions": questions}
+        self.seq = seq
+        self._rebuild_index()
+        self.version += 1
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["reloads"] += 1
+        self.stats["last_reload_ms"] = elapsed
+        self.stats["total_reload_ms"] += elapsed
+
+    def _replay_log(self):
+        """Apply operations other connections committed since we last looked."""
+        # Starting at our own seq proves there is no gap (pruned or reset)
+        rows = self._conn.execute("SELECT seq, op FROM knowledge_log WHERE seq >= ? ORDER BY seq",
+                                  (self.seq,)).fetchall()
+        if rows and rows[0][0] > self.seq + 1:
+            self._reload()
+            return
+        applied = 0
+        for seq, raw in rows:
+            if seq <= self.seq:
+                continue
+            op = json.loads(raw)
+            if op.get("op") == "reset":
+                self._reload()
+                return
+            self._apply(op)
+            self.seq = seq
+            applied += 1
+        if applied:
+            self.stats["replayed_ops"] += applied
+            self.version += 1
+
+    # Writing
+    def _execute_ops(self, ops):
+        c = self._conn
+        if all(op["op"] == "upsert" for op in ops):
+            # Bulk imports: one prepared statement for the whole batch
+            c.executemany("INSERT INTO knowledge (q, qkey, nq, a) VALUES (?, ?, ?, ?) "
+                          "ON CONFLICT (qkey) DO UPDATE SET a = excluded.a",
+                          [(op["q"], self._key(op["q"]), normalize(op["q"]), op["a"]) for op in ops])
+            return
+        for op in ops:
+            kind = op["op"]
+            if kind == "upsert":
+                self._execute_ops([op])
+            elif kind == "delete":
+                c.execute("DELETE FROM knowledge WHERE qkey = ?", (self._key(op["q"]),))
+            elif kind == "edit":
+                c.execute("UPDATE knowledge SET q = ?, qkey = ?, nq = ?, a = ? WHERE qkey = ?",
+                          (op["q"], self._key(op["q"]), normalize(op["q"]), op["a"], self._key(op["old_q"])))
+
+    def _write(self, make_ops):
+        """Run `make_ops()` against fresh state and commit its ops in one transaction.
+
+        Returns the result of applying each op to the in-memory mirror.
+        """
+        with self._lock:
+            self._sync()
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.Error as e:
+                raise RuntimeError(f"Knowledge database is busy: {e}")
+            try:
+                # Another process may have committed since _sync()
+                self._replay_log()
+                ops = make_ops()
+                if ops:
+                    self._execute_ops(ops)
+                    self._conn.executemany("INSERT INTO knowledge_log (op) VALUES (?)",
+                                           [(json.dumps(op, ensure_ascii=False),) for op in ops])
+                    last_seq = self._conn.execute(
+                        "SELECT seq FROM sqlite_sequence WHERE name = 'knowledge_log'").fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                self._dirty = True
+                if isinstance(e, sqlite3.Error):
+                    raise RuntimeError(f"Knowledge database write failed: {e}")
+                raise
+
+            results = [self._apply(op) for op in ops]
+            if ops:
+                self.seq = last_seq
+                self.stats["appended_ops"] += len(ops)
+                self._ops_since_compact += len(ops)
+                self.version += 1
+            # Our own commit does not move data_version
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+        if self._ops_since_compact >= self.compact_every:
+            self.compact_in_background()
+        return results
+
+    def upsert(self, question, answer):
+        op = {"op": "upsert", "q": question.strip(), "a": answer.strip()}
+        def make_ops():
+            entry = self._index.get(self._key(op["q"]))
+            if entry is not None and entry["a"] == op["a"]:
+                return []
+            return [op]
+        results = self._write(make_ops)
+        return results[0] if results else "Updated"
+
+    def bulk_upsert(self, pairs):
+        """Add or update many (question, answer) pairs in one transaction."""
+        result = {"added": 0, "updated": 0, "unchanged": 0, "updated_questions": []}
+        batch = self._dedupe_batch(pairs)
+        if not batch:
+            return result
+
+        ops = []
+        def make_ops():
+            for key, (q, a) in batch.items():
+                entry = self._index.get(key)
+                if entry is not None and entry["a"] == a:
+                    result["unchanged"] += 1
+                    continue
+                ops.append({"op": "upsert", "q": q, "a": a})
+            return ops
+
+        for op, status in zip(ops, self._write(make_ops)):
+            if status == "Added":
+                result["added"] += 1
+            else:
+                result["updated"] += 1
+                result["updated_questions"].append(op["q"])
+        return result
+
+    def delete(self, question):
+        op = {"op": "delete", "q": question.strip()}
+        results = self._write(lambda: [op] if self._key(op["q"]) in self._index else [])
+        return bool(results and results[0])
+
+    def edit(self, old_q, new_q, new_a):
+        op = {"op": "edit", "old_q": old_q.strip(), "q": new_q.strip(), "a": new_a.strip()}
+        def make_ops():
+            old_key, new_key = self._key(op["old_q"]), self._key(op["q"])
+            if old_key not in self._index:
+                return []
+            if new_key != old_key and new_key in self._index:
+                # Renaming onto another question replaces it (qkey is unique)
+                return [{"op": "delete", "q": op["q"]}, op]
+            return [op]
+        results = self._write(make_ops)
+        return bool(results and results[-1])
+
+    def save(self, data=None):
+        """Replace the whole table with `data` (used by clean_duplicates)."""
+        with self._lock:
+            if data is not None:
+                self.data = data
+            rows = [(q, a) for q, a in ((e["q"].strip(), e["a"].strip()) for e in self.data["questions"])]
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute("DELETE FROM knowledge")
+                    self._conn.executemany("INSERT OR IGNORE INTO knowledge (q, qkey, nq, a) VALUES (?, ?, ?, ?)",
+                                           [(q, self._key(q), normalize(q), a) for q, a in rows])
+                    # Tells other processes to reload instead of replaying
+                    self._conn.execute("INSERT INTO knowledge_log (op) VALUES (?)", ('{"op": "reset"}',))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                raise RuntimeError(f"Knowledge database write failed: {e}")
+            self._dirty = True
+            self._sync()
+
+    # Maintenance
+    def compact(self):
+        """Prune old log rows and checkpoint the WAL into the main database."""
+        start = time.perf_counter()
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM knowledge_log WHERE seq <= ?", (self.seq - self.log_keep,))
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except sqlite3.Error as e:
+                logger.warning("Knowledge compaction failed: %s", e)
+                return False
+            self._ops_since_compact = 0
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["compactions"] += 1
+        self.stats["last_compaction_ms"] = elapsed
+        return True
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="knowledge-compaction", daemon=True).start()
+
+    def backup(self, path):
+        """Write the current entries as a knowledge.json-style snapshot to `path`."""
+        data = self.get()
+        with self._lock:
+            snapshot = {"questions": [dict(e) for e in data["questions"]]}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, json.dumps(snapshot, indent=4, ensure_ascii=False).encode('utf-8'))
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,553 @@
+import abc
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from .retrieval import KnowledgeIndex, build_retriever
+
+logger = logging.getLogger(__name__)
+
+KNOWLEDGE_BACKENDS = ("json", "sqlite")
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock shared by every process that writes the knowledge files."""
+    with open(path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _atomic_write(path, raw):
+    # Write to a temp file in the same folder, then rename over the target,
+    # so readers (and crashes) only ever see the old file or the new one
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(5):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            # Windows refuses while another process has the file open for reading
+            if attempt == 4:
+                raise
+            time.sleep(0.05)
+
+
+class KnowledgeBackend(abc.ABC):
+    """Common part of the knowledge backends: an in-memory mirror of the entries.
+
+    `get()` returns {"questions": [{"q", "a"}, ...]} kept in sync with the
+    backing storage, and `version` is bumped whenever it changes. Backends
+    implement `_sync()`, the write operations (upsert, bulk_upsert, delete,
+    edit, save), `compact()` and `backup(path)`.
+
+    Retrievers index the questions list by position while other threads keep
+    reading it, so a delete or rename never changes it in place: `_apply`
+    builds a new list and swaps it in (copy-on-write). New entries are only
+    appended, which leaves every existing position valid.
+    """
+    name = None
+    # Retrieval strategy the engine should use with this backend
+    default_strategy = "ngram"
+
+    def __init__(self):
+        self.data = {"questions": []}
+        self.seq = 0 # last operation applied to self.data
+        # Bumped every time self.data is replaced or modified, so callers can
+        # cheaply tell whether anything derived from it is stale.
+        self.version = 0
+        self._index = {} # _key(question) -> entry
+        # Normalized text / language per question, reused across retriever rebuilds
+        self.prepared = KnowledgeIndex()
+        self._dirty = True
+        self._lock = threading.RLock()
+        self.stats = {
+            "checks": 0,
+            "reloads": 0,
+            "replayed_ops": 0,
+            "appended_ops": 0,
+            "compactions": 0,
+            "last_reload_ms": 0.0,
+            "total_reload_ms": 0.0,
+            "last_compaction_ms": 0.0,
+        }
+
+    @staticmethod
+    def _key(question):
+        """Identity of a question: questions differing only in case are the same one.
+
+        casefold() rather than lower(), so non-ASCII case pairs (ß / SS, final
+        sigma, ...) fold the same in both backends.
+        """
+        return question.casefold().strip()
+
+    @classmethod
+    def _dedupe_batch(cls, pairs):
+        """Strip and dedupe (q, a) pairs by key; the last occurrence wins."""
+        batch = {}
+        for q, a in pairs:
+            q, a = q.strip(), a.strip()
+            batch.pop(cls._key(q), None) # Re-insert so order follows the last occurrence
+            batch[cls._key(q)] = (q, a)
+        return batch
+
+    def get(self):
+        """Return the current knowledge dict, reloading from storage only if needed."""
+        with self._lock:
+            self.stats["checks"] += 1
+            self._sync()
+            return self.data
+
+    def invalidate(self):
+        """Force the next get() to re-read the storage."""
+        with self._lock:
+            self._dirty = True
+
+    @abc.abstractmethod
+    def _sync(self):
+        """Bring self.data up to date with the backing storage (called under self._lock)."""
+
+    def retriever(self, strategy, partitioned=False):
+        """Candidate retriever over the current entries (see retrieval.py), optionally split by script."""
+        entries = self.data["questions"]
+        return build_retriever(strategy, entries, self.prepared.prepare(entries), partitioned)
+
+    def _rebuild_index(self):
+        index = {}
+        for entry in self.data["questions"]:
+            index.setdefault(self._key(entry["q"]), entry)
+        self._index = index
+
+    def _apply(self, op):
+        kind = op.get("op")
+        questions = self.data["questions"]
+        if kind == "upsert":
+            entry = self._index.get(self._key(op["q"]))
+            if entry is not None:
+                entry["a"] = op["a"]
+                return "Updated"
+            entry = {"q": op["q"], "a": op["a"]}
+            questions.append(entry)
+            self._index[self._key(entry["q"])] = entry
+            return "Added"
+        if kind == "delete":
+            target = self._key(op["q"])
+            remaining = [e for e in questions if self._key(e["q"]) != target]
+            if len(remaining) == len(questions):
+                return False
+            self.data["questions"] = remaining
+            self._rebuild_index()
+            return True
+        if kind == "edit":
+            target = self._index.get(self._key(op["old_q"]))
+            if target is None:
+                return False
+            # Renaming onto another question replaces it, like the unique qkey in SQLite
+            new_key = self._key(op["q"])
+            entry = {"q": op["q"], "a": op["a"]}
+            self.data["questions"] = [entry if e is target else e for e in questions
+                                      if e is target or self._key(e["q"]) != new_key]
+            self._rebuild_index()
+            return True
+        return None
+
+
+class KnowledgeStore(KnowledgeBackend):
+    """Keeps knowledge.json parsed in memory and persists edits through an append log.
+
+    knowledge.json is a snapshot; every add/edit/delete is appended to
+    knowledge.json.log as one JSON line with a sequence number, so an edit is
+    O(1) I/O. Once the log has grown past `compact_every` operations it is
+    folded back into a new snapshot on a background thread. Snapshots are
+    written atomically (temp file + rename), and the snapshot records the last
+    sequence number it contains, so replaying the log is always safe.
+    """
+    name = "json"
+
+    def __init__(self, data_file, backup_dir=None, compact_every=500):
+        super().__init__()
+        self.data_file = data_file
+        self.log_file = data_file + ".log"
+        self.lock_file = data_file + ".lock"
+        self.backup_dir = backup_dir
+        self.compact_every = compact_every
+
+        self._signature = None
+        self._digest = None
+        self._snapshot_seq = 0
+        self._log_signature = None
+        self._log_offset = 0
+        self._log_ops = 0 # operations in the log not yet in the snapshot
+        self._load_failed = False
+        self._compacting = False
+        self.stats["hash_skips"] = 0
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _sync(self):
+        signature = self._stat(self.data_file)
+        if self._dirty or signature != self._signature:
+            self._reload(signature)
+            return
+        log_sig = self._stat(self.log_file)
+        if log_sig == self._log_signature:
+            return
+        replaced = self._log_signature is not None and (log_sig is None or log_sig[2] != self._log_signature[2])
+        if replaced or (log_sig is not None and log_sig[1] < self._log_offset):
+            # Log was replaced or truncated by a compaction we have not seen yet
+            self._reload(signature)
+            return
+        self._replay_log()
+
+    def _reload(self, signature):
+        start = time.perf_counter()
+        self._dirty = False
+        self._signature = signature
+        if signature is None:
+            self._load_snapshot({"questions": []}, None)
+        else:
+            try:
+                with open(self.data_file, 'rb') as f:
+                    raw = f.read()
+            except OSError:
+                raw = None
+
+            # mtime/size can change without the content changing (touch, copy, etc.)
+            digest = hashlib.blake2b(raw, digest_size=16).digest() if raw is not None else None
+            if digest is not None and digest == self._digest:
+                self.stats["hash_skips"] += 1
+                self._replay_log()
+                return
+
+            data = self._parse(raw)
+            if data is None:
+                data = self._recover()
+                if data is None:
+                    return
+                digest = None
+            else:
+                self._load_failed = False
+            self._load_snapshot(data, digest)
+
+        self._log_offset = 0
+        self._log_signature = None
+        self._log_ops = 0
+        self._replay_log()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["reloads"] += 1
+        self.stats["last_reload_ms"] = elapsed
+        self.stats["total_reload_ms"] += elapsed
+
+    @staticmethod
+    def _parse(raw):
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except Exception:
+            return None
+        if not isinstance(data, dict):
+            return None
+        if not isinstance(data.get("questions"), list):
+            data["questions"] = []
+        return data
+
+    def _recover(self):
+        """knowledge.json could not be parsed: never treat that as an empty database."""
+        logger.error("Could not parse %s. Writes are disabled until it is fixed.", self.data_file)
+        self._load_failed = True
+        if self._digest is not None:
+            # Keep serving what we already have in memory
+            return None
+        if self.backup_dir and os.path.isdir(self.backup_dir):
+            backups = sorted(f for f in os.listdir(self.backup_dir)
+                             if f.startswith("knowledge_") and f.endswith(".json"))
+            for name in reversed(backups):
+                try:
+                    with open(os.path.join(self.backup_dir, name), 'rb') as f:
+                        data = self._parse(f.read())
+                except OSError:
+                    data = None
+                if data is not None:
+                    logger.warning("Serving knowledge from backup %s (read-only).", name)
+                    return data
+        return {"questions": []}
+
+    def _load_snapshot(self, data, digest):
+        self.data = data
+        self._digest = digest
+        self._snapshot_seq = int(data.pop("seq", 0) or 0)
+        self.seq = self._snapshot_seq
+        self._rebuild_index()
+        self.version += 1
+
+    def _replay_log(self):
+        """Apply log lines written since we last looked (by us or another process)."""
+        log_sig = self._stat(self.log_file)
+        if log_sig is None:
+            self._log_signature = None
+            return
+        try:
+            with open(self.log_file, 'rb') as f:
+                f.seek(self._log_offset)
+                chunk = f.read()
+        except OSError:
+            return
+
+        # Only complete lines; a half-written last line is picked up later
+        end = chunk.rfind(b"\n") + 1
+        applied = 0
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                op = json.loads(line.decode('utf-8'))
+            except Exception:
+                continue
+            if op.get("seq", 0) <= self.seq:
+                continue # Already part of the snapshot
+            self._apply(op)
+            self.seq = op["seq"]
+            applied += 1
+        self._log_offset += end
+        self._log_signature = log_sig
+        self._log_ops += applied
+        if applied:
+            self.stats["replayed_ops"] += applied
+            self.version += 1
+
+    def _append(self, op, would_change):
+        """Apply one operation and log it. `would_change(store)` decides if it is a no-op."""
+        with self._lock:
+            self._sync()
+            with _file_lock(self.lock_file):
+                # Another process may have appended since _sync()
+                self._replay_log()
+                if self._load_failed:
+                    raise RuntimeError(f"{self.data_file} is unreadable; refusing to write.")
+                if not would_change():
+                    return self._apply(op)
+
+                result = self._write_ops_locked([op])[0]
+
+        if self._log_ops >= self.compact_every:
+            self.compact_in_background()
+        return result
+
+    def _write_ops_locked(self, ops):
+        """Number, log (one write + fsync) and apply operations; caller holds both locks."""
+        ops = [dict(op, seq=self.seq + i + 1) for i, op in enumerate(ops)]
+        raw = b"".join((json.dumps(op, ensure_ascii=False) + "\n").encode('utf-8') for op in ops)
+        with open(self.log_file, 'ab') as f:
+            if f.tell() > self._log_offset:
+                # Drop a torn line left by a crash before we append after it
+                f.truncate(self._log_offset)
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        results = [self._apply(op) for op in ops]
+        self.seq = ops[-1]["seq"]
+        self._log_offset += len(raw)
+        self._log_signature = self._stat(self.log_file)
+        self._log_ops += len(ops)
+        self.stats["appended_ops"] += len(ops)
+        self.version += 1
+        return results
+
+    # Write operations (all O(1) I/O)
+    def upsert(self, question, answer):
+        op = {"op": "upsert", "q": question.strip(), "a": answer.strip()}
+        def changes():
+            entry = self._index.get(self._key(op["q"]))
+            return entry is None or entry["a"] != op["a"]
+        return self._append(op, changes)
+
+    def delete(self, question):
+        op = {"op": "delete", "q": question.strip()}
+        return self._append(op, lambda: self._key(op["q"]) in self._index)
+
+    def edit(self, old_q, new_q, new_a):
+        op = {"op": "edit", "old_q": old_q.strip(), "q": new_q.strip(), "a": new_a.strip()}
+        return self._append(op, lambda: self._key(op["old_q"]) in self._index)
+
+    @staticmethod
+    def _serialize(data, seq):
+        return json.dumps(dict(data, seq=seq), indent=4, ensure_ascii=False).encode('utf-8')
+
+    def bulk_upsert(self, pairs):
+        """Add or update many (question, answer) pairs with one log write and one fsync.
+
+        Duplicates inside the batch are resolved with the hash index (last one
+        wins). Returns counts of added / updated / unchanged pairs and the
+        questions whose answers changed.
+        """
+        result = {"added": 0, "updated": 0, "unchanged": 0, "updated_questions": []}
+        batch = self._dedupe_batch(pairs)
+        if not batch:
+            return result
+
+        with self._lock:
+            self._sync()
+            with _file_lock(self.lock_file):
+                self._replay_log()
+                if self._load_failed:
+                    raise RuntimeError(f"{self.data_file} is unreadable; refusing to write.")
+
+                ops = []
+                for key, (q, a) in batch.items():
+                    entry = self._index.get(key)
+                    if entry is not None and entry["a"] == a:
+                        result["unchanged"] += 1
+                        continue
+                    ops.append({"op": "upsert", "q": q, "a": a})
+
+                if ops:
+                    for op, status in zip(ops, self._write_ops_locked(ops)):
+                        if status == "Added":
+                            result["added"] += 1
+                        else:
+                            result["updated"] += 1
+                            result["updated_questions"].append(op["q"])
+
+        if self._log_ops >= self.compact_every:
+            self.compact_in_background()
+        return result
+
+    def save(self, data=None):
+        """Write a full snapshot atomically (also clears the log)."""
+        with self._lock:
+            if data is not None:
+                self.data = data
+            with _file_lock(self.lock_file):
+                self._write_snapshot_locked(self._serialize(self.data, self.seq), self.seq)
+                self._rebuild_index()
+                self.version += 1
+
+    def _write_snapshot_locked(self, raw, seq):
+        if self._load_failed:
+            raise RuntimeError(f"{self.data_file} is unreadable; refusing to overwrite it.")
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        _atomic_write(self.data_file, raw)
+        # Our own write must not trigger a reload on the next get()
+        self._digest = hashlib.blake2b(raw, digest_size=16).digest()
+        self._signature = self._stat(self.data_file)
+        self._snapshot_seq = seq
+        self._dirty = False
+        self._rewrite_log_locked(seq)
+
+    def _rewrite_log_locked(self, keep_after):
+        # Keep only operations newer than the snapshot (appended during compaction)
+        kept = []
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'rb') as f:
+                for line in f.read().splitlines(keepends=True):
+                    if not line.endswith(b"\n"):
+                        continue
+                    try:
+                        if json.loads(line.decode('utf-8')).get("seq", 0) > keep_after:
+                            kept.append(line)
+                    except Exception:
+                        continue
+        _atomic_write(self.log_file, b"".join(kept))
+        self._log_offset = sum(len(line) for line in kept)
+        self._log_signature = self._stat(self.log_file)
+        self._log_ops = len(kept)
+
+    def compact(self):
+        """Fold the log into a fresh knowledge.json snapshot."""
+        start = time.perf_counter()
+        with self._lock:
+            self._sync()
+            if self._log_ops == 0 or self._load_failed:
+                return False
+            with _file_lock(self.lock_file):
+                self._replay_log()
+                seq = self.seq
+                signature = self._signature
+                # Cheap copy under the lock; the JSON encoding happens outside it
+                snapshot = dict(self.data, questions=[dict(e) for e in self.data["questions"]])
+
+        raw = self._serialize(snapshot, seq)
+        with self._lock:
+            with _file_lock(self.lock_file):
+                if self._stat(self.data_file) != signature:
+                    return False # Someone else wrote a snapshot meanwhile
+                self._write_snapshot_locked(raw, seq)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stats["compactions"] += 1
+        self.stats["last_compaction_ms"] = elapsed
+        return True
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                logger.warning("Knowledge compaction failed: %s", e)
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="knowledge-compaction", daemon=True).start()
+
+    def backup(self, path):
+        """Copy a complete snapshot (log folded in) to `path`."""
+        # Fold pending log entries into knowledge.json so the copy is complete
+        self.compact()
+        if os.path.exists(self.data_file):
+            shutil.copy2(self.data_file, path)
+            return True
+        return False
+
+
+def open_knowledge_store(data_dir, backup_dir=None, backend=None):
+    """Open the knowledge backend for `data_dir`.
+
+    The backend comes from the argument, then the LAOMIND_KNOWLEDGE_BACKEND
+    environment variable, then from whether knowledge.db exists (it is created
+    by migrate_knowledge.py), so the chat and admin apps always agree on it.
+    """
+    backend = backend or os.environ.get("LAOMIND_KNOWLEDGE_BACKEND", "").strip().lower()
+    if not backend:
+        backend = "sqlite" if os.path.exists(os.path.join(data_dir, "knowledge.db")) else "json"
+    if backend not in KNOWLEDGE_BACKENDS:
+        raise ValueError(f"Unknown knowledge backend: {backend}")
+    if backend == "sqlite":
+        from .knowledge_sqlite import SqliteKnowledgeStore
+        return SqliteKnowledgeStore(os.path.join(data_dir, "knowledge.db"), backup_dir=backup_dir)
+    return KnowledgeStore(os.path.join(data_dir, "knowledge.json"), backup_dir=backup_dir)
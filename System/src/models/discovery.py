@@ -0,0 +1,81 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModelDiscovery:
+    """Fetches the list of installed Ollama models in the background and caches it.
+
+    One instance is shared by the engine and the admin UI, so the list is only
+    requested once per refresh, and nobody blocks on it at startup.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.models = None # None until the first discovery has finished
+        self.last_refresh = None
+        self.duration_ms = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._callbacks = []
+
+    def start(self):
+        """Start discovery on a daemon thread (no-op if it is running or done)."""
+        with self._lock:
+            if self._done.is_set() or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="ollama-model-discovery", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            models = self.client.get_models()
+        except Exception:
+            models = []
+        with self._lock:
+            self.models = models
+            self.last_refresh = time.time()
+            self.duration_ms = (time.perf_counter() - start) * 1000
+            callbacks = list(self._callbacks)
+            self._done.set()
+        for cb in callbacks:
+            try:
+                cb(models)
+            except Exception as e:
+                logger.warning("Model discovery callback failed: %s", e)
+
+    def ready(self):
+        return self._done.is_set()
+
+    def get(self, timeout=0):
+        """Return the cached model list, waiting up to `timeout` seconds for it.
+
+        Returns None if discovery has not finished in time.
+        """
+        self.start()
+        self._done.wait(timeout)
+        return self.models
+
+    def refresh(self):
+        """Re-run discovery now (blocking) and return the fresh list."""
+        with self._lock:
+            self._done.clear()
+            self._thread = None
+        self._run()
+        return self.models
+
+    def on_ready(self, callback):
+        """Call `callback(models)` every time discovery finishes (now, if it already has).
+
+        The callback runs on the discovery thread; UI code must hand it over to
+        its own thread.
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+            if not self._done.is_set():
+                return
+            models = self.models
+        callback(models)
@@ -1,12 +1,36 @@
 import json
-import requests
+import os
+from .http_session import PooledSession
 
 class GeminiClient:
-    def __init__(self, api_key=None):
-        self.api_key = api_key
+    def __init__(self, api_key=None, pool_size=4, connect_timeout=5.0, read_timeout=10.0,
+                 retries=2, backoff=0.3):
+        # $GEMINI_API_KEY lets the engine fail over to Gemini without going through the UI
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
         # Gemini Flash 1.5 is fast and supports Lao well
         # Using specific version 001 to avoid resolution errors
         self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-001:generateContent"
+        self.stream_url = self.api_url.replace(":generateContent", ":streamGenerateContent")
+        # Keep-alive session so repeated calls skip the TCP + TLS handshake
+        self.http = PooledSession(pool_size=pool_size, connect_timeout=connect_timeout,
+                                  read_timeout=read_timeout, retries=retries, backoff=backoff)
+
+    def get_stats(self):
+        return self.http.stats.summary()
+
+    @staticmethod
+    def _generation_config(options):
+        # Same option names as Ollama so the engine can pass one dict to either client
+        config = {}
+        if options:
+            if "temperature" in options:
+                config["temperature"] = options["temperature"]
+            if options.get("num_predict", -1) > 0:
+                config["maxOutputTokens"] = options["num_predict"]
+        return config
+
+    def is_configured(self):
+        return bool(self.api_key)
 
     def check_connection(self):
         if not self.api_key:
@@ -15,7 +39,7 @@ class GeminiClient:
         # or try a dummy generic call if we want to be strict.
         return True 
 
-    def generate_response(self, context_query):
+    def generate_response(self, context_query, options=None):
         if not self.api_key:
             return "Error: Gemini API Key is missing."
             
@@ -28,9 +52,12 @@ class GeminiClient:
                 "parts": [{"text": context_query}]
             }]
         }
+        config = self._generation_config(options)
+        if config:
+            payload["generationConfig"] = config
 
         try:
-            response = requests.post(self.api_url, headers=headers, params=params, json=payload, timeout=10)
+            response = self.http.post(self.api_url, headers=headers, params=params, json=payload)
             if response.status_code == 200:
                 data = response.json()
                 try:
@@ -41,3 +68,38 @@ class GeminiClient:
                 return f"Error: Gemini API returned {response.status_code} - {response.text}"
         except Exception as e:
             return f"Error connecting to Gemini: {e}"
+
+    def stream_response(self, context_query, options=None):
+        """Yield the answer chunk by chunk using streamGenerateContent (SSE)."""
+        if not self.api_key:
+            raise RuntimeError("Gemini API Key is missing.")
+
+        headers = {'Content-Type': 'application/json'}
+        params = {'key': self.api_key, 'alt': 'sse'}
+        payload = {
+            "contents": [{
+                "parts": [{"text": context_query}]
+            }]
+        }
+        config = self._generation_config(options)
+        if config:
+            payload["generationConfig"] = config
+
+        with self.http.stream("POST", self.stream_url, headers=headers, params=params,
+                              json=payload) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Gemini API returned {response.status_code} - {response.text}")
+            for raw_line in response.iter_lines():
+                # Server-sent events: every payload line starts with "data: "
+                line = raw_line.decode('utf-8')
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:].strip())
+                if "error" in data:
+                    error = data["error"]
+                    raise RuntimeError(f"Gemini error: {error.get('message', error) if isinstance(error, dict) else error}")
+                for candidate in data.get("candidates", []):
+                    for part in candidate.get("content", {}).get("parts", []):
+                        text = part.get("text")
+                        if text:
+                            yield text
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# requests/urllib3 are imported on first use: they cost ~100 ms at startup and
+# the chat window does not need them until the first model call.
+
+# Time spent opening sockets (TCP + TLS) during the current request, per thread
+_connect_timer = threading.local()
+_adapter_class = None
+
+
+def _timed_adapter_class():
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timer.seconds = getattr(_connect_timer, "seconds", 0.0) + time.perf_counter() - start
+
+    class _TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timer.seconds = getattr(_connect_timer, "seconds", 0.0) + time.perf_counter() - start
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class _TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _TimedHTTPConnectionPool,
+                "https": _TimedHTTPSConnectionPool,
+            }
+
+    _adapter_class = _TimedHTTPAdapter
+    return _adapter_class
+
+
+class RequestStats:
+    """Keeps connect / time-to-first-byte / total timings of recent requests."""
+    def __init__(self, maxlen=200):
+        self.recent = deque(maxlen=maxlen)
+        self.count = 0
+        self.errors = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record(self, method, url, status, connect_ms, ttfb_ms, total_ms):
+        entry = {
+            "method": method, "url": url, "status": status,
+            "connect_ms": connect_ms, "ttfb_ms": ttfb_ms, "total_ms": total_ms,
+            "reused": connect_ms == 0.0,
+        }
+        with self._lock:
+            self.recent.append(entry)
+            self.count += 1
+            if status is None or status >= 400:
+                self.errors += 1
+            if not entry["reused"]:
+                self.new_connections += 1
+
+    @property
+    def last(self):
+        return self.recent[-1] if self.recent else None
+
+    def summary(self):
+        with self._lock:
+            recent = list(self.recent)
+            summary = {"requests": self.count, "errors": self.errors,
+                       "new_connections": self.new_connections}
+        for key in ("connect_ms", "ttfb_ms", "total_ms"):
+            values = [r[key] for r in recent if r[key] is not None]
+            summary[f"avg_{key}"] = sum(values) / len(values) if values else 0.0
+        return summary
+
+
+class PooledSession:
+    """A keep-alive requests.Session with retries and per-request timing stats.
+
+    Connections are pooled and reused, so only the first call to a host pays
+    for the TCP (and TLS) handshake. Retries with backoff only apply to
+    idempotent methods; a POST is never sent twice.
+    """
+    def __init__(self, pool_size=4, connect_timeout=3.0, read_timeout=30.0,
+                 retries=2, backoff=0.3):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stats = RequestStats()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Built on first use so that creating a client costs nothing
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._build_session()
+        return self._session
+
+    def _build_session(self):
+        import requests
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+            raise_on_status=False,
+        )
+        adapter = _timed_adapter_class()(pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                                         max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _timeout(self, connect_timeout, read_timeout):
+        return (connect_timeout or self.connect_timeout, read_timeout or self.read_timeout)
+
+    def request(self, method, url, connect_timeout=None, read_timeout=None, **kwargs):
+        _connect_timer.seconds = 0.0
+        start = time.perf_counter()
+        status = None
+        ttfb_ms = None
+        try:
+            r = self.session.request(method, url, timeout=self._timeout(connect_timeout, read_timeout), **kwargs)
+            status = r.status_code
+            ttfb_ms = r.elapsed.total_seconds() * 1000
+            return r
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            self.stats.record(method, url, status, _connect_timer.seconds * 1000, ttfb_ms, total_ms)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @contextmanager
+    def stream(self, method, url, connect_timeout=None, read_timeout=None, **kwargs):
+        """Streamed request; the total time is recorded when the body is done."""
+        _connect_timer.seconds = 0.0
+        start = time.perf_counter()
+        r = None
+        try:
+            r = self.session.request(method, url, timeout=self._timeout(connect_timeout, read_timeout),
+                                     stream=True, **kwargs)
+            yield r
+        finally:
+            status = ttfb_ms = None
+            if r is not None:
+                r.close()
+                status = r.status_code
+                ttfb_ms = r.elapsed.total_seconds() * 1000
+            total_ms = (time.perf_counter() - start) * 1000
+            self.stats.record(method, url, status, _connect_timer.seconds * 1000, ttfb_ms, total_ms)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
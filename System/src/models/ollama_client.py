@@ -1,20 +1,32 @@
-import requests
+import json
+from .http_session import PooledSession
 
 class OllamaClient:
-    def __init__(self, base_url="http://localhost:11434", model="gemma2:2b"):
+    def __init__(self, base_url="http://localhost:11434", model="gemma2:2b",
+                 pool_size=4, connect_timeout=2.0, read_timeout=300.0, retries=2, backoff=0.3,
+                 keep_alive="30m"):
         self.base_url = base_url
         self.model = model
+        # How long Ollama keeps the model loaded after a call (its default is 5 minutes)
+        self.keep_alive = keep_alive
+        self._legacy_embeddings = False # Set when /api/embed is missing (Ollama < 0.3)
+        # One keep-alive session per client, reused by every call
+        self.http = PooledSession(pool_size=pool_size, connect_timeout=connect_timeout,
+                                  read_timeout=read_timeout, retries=retries, backoff=backoff)
+
+    def get_stats(self):
+        return self.http.stats.summary()
 
     def check_connection(self):
         try:
-            requests.get(f"{self.base_url}/api/tags", timeout=2)
+            self.http.get(f"{self.base_url}/api/tags", read_timeout=2)
             return True
         except:
             return False
 
     def get_models(self):
         try:
-            r = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            r = self.http.get(f"{self.base_url}/api/tags", read_timeout=5)
             if r.status_code == 200:
                 data = r.json()
                 # Extract model names (e.g., "gemma:2b")
@@ -23,16 +35,85 @@ class OllamaClient:
         except:
             return []
 
-    def generate_response(self, context_query):
+    def _payload(self, prompt, stream, options=None, context=None):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive
+        }
+        if options:
+            payload["options"] = options
+        if context:
+            # Tokens of the earlier turns, as returned by the previous call
+            payload["context"] = context
+        return payload
+
+    def generate(self, context_query, options=None, context=None):
+        """Returns (answer, context). On failure the answer is an "Error..." string and context is None."""
         try:
-            payload = {
-                "model": self.model,
-                "prompt": context_query,
-                "stream": False
-            }
-            r = requests.post(f"{self.base_url}/api/generate", json=payload, timeout=300)
+            payload = self._payload(context_query, False, options, context)
+            r = self.http.post(f"{self.base_url}/api/generate", json=payload)
             if r.status_code == 200:
-                return r.json().get("response", "")
-            return f"Error: Ollama returned status {r.status_code}"
+                data = r.json()
+                return data.get("response", ""), data.get("context")
+            return f"Error: Ollama returned status {r.status_code}", None
         except Exception as e:
-            return f"Error calling Ollama: {e}"
+            return f"Error calling Ollama: {e}", None
+
+    def generate_response(self, context_query, options=None):
+        return self.generate(context_query, options)[0]
+
+    def embed(self, texts, model):
+        """Embedding vectors for `texts` (one list of floats each). Raises RuntimeError on failure.
+
+        Uses the batch /api/embed endpoint, or one /api/embeddings call per text
+        on Ollama versions that do not have it.
+        """
+        if not self._legacy_embeddings:
+            r = self.http.post(f"{self.base_url}/api/embed",
+                               json={"model": model, "input": list(texts), "keep_alive": self.keep_alive})
+            if r.status_code == 200:
+                return r.json()["embeddings"]
+            if r.status_code != 404:
+                raise RuntimeError(f"Ollama returned status {r.status_code} for /api/embed")
+            self._legacy_embeddings = True
+        vectors = []
+        for text in texts:
+            r = self.http.post(f"{self.base_url}/api/embeddings",
+                               json={"model": model, "prompt": text, "keep_alive": self.keep_alive})
+            if r.status_code != 200:
+                raise RuntimeError(f"Ollama returned status {r.status_code} for /api/embeddings")
+            vectors.append(r.json()["embedding"])
+        return vectors
+
+    def warm_up(self):
+        """Load the model into memory without generating anything (an empty prompt)."""
+        try:
+            payload = {"model": self.model, "prompt": "", "stream": False, "keep_alive": self.keep_alive}
+            return self.http.post(f"{self.base_url}/api/generate", json=payload).status_code == 200
+        except Exception:
+            return False
+
+    def stream_response(self, context_query, options=None, context=None, result=None):
+        """Yield the answer chunk by chunk from Ollama's NDJSON stream.
+
+        If `result` is a dict, the final message's "context" is stored in it.
+        """
+        payload = self._payload(context_query, True, options, context)
+        with self.http.stream("POST", f"{self.base_url}/api/generate", json=payload) as r:
+            if r.status_code != 200:
+                raise RuntimeError(f"Ollama returned status {r.status_code}")
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(f"Ollama error: {data['error']}")
+                chunk = data.get("response", "")
+                if chunk:
+                    yield chunk
+                if data.get("done") and result is not None:
+                    result["context"] = data.get("context")
+                # No break on "done": reading to the end of the body lets the
+                # connection go back to the pool instead of being closed
@@ -0,0 +1,289 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBusyError(RuntimeError):
+    """No call slot for a provider came free within the queue limits (see ModelSlots)."""
+
+
+class ModelSlots:
+    """At most `limit` calls to one provider at a time.
+
+    Callers beyond that wait in line, but at most `max_waiting` of them and
+    for at most `timeout` seconds; past either limit acquire() raises
+    ModelBusyError, so a server under load answers "busy" instead of piling up
+    threads. None means no limit.
+    """
+    def __init__(self, name, limit, max_waiting=None, timeout=None):
+        self.name = name
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.waiting = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            if self.max_waiting is not None and self.waiting >= self.max_waiting:
+                raise ModelBusyError(f"{self.name} is busy ({self.waiting} calls already waiting)")
+            self.waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            raise ModelBusyError(f"{self.name} is busy (no free slot after {self.timeout:g}s)")
+
+    def release(self):
+        self._slots.release()
+
+
+def is_error_response(text):
+    """The clients report failures as text starting with "Error" (see OllamaClient / GeminiClient)."""
+    return not text or not text.strip() or text.lstrip().startswith("Error")
+
+
+class ProviderHealth:
+    """Circuit breaker and latency stats for one provider.
+
+    closed: calls go through. After `failure_threshold` failures in a row the
+    circuit opens and the provider is skipped for `cooldown` seconds; then a
+    single trial call (half_open) either closes it again or re-opens it.
+    A call slower than `slow_ms` counts as a failure for the breaker even
+    though its answer is still used (None: latency is ignored).
+    """
+    def __init__(self, name, failure_threshold=3, cooldown=30.0, slow_ms=30000):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.slow_ms = slow_ms
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.successes = 0
+        self.failures = 0
+        self.avg_ms = None
+        self.last_error = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def available(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return not self._trial_running
+
+    def begin(self):
+        """Claim a call; False while the circuit is open (or its trial call is already running)."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            if self._trial_running:
+                return False
+            self.state = "half_open"
+            self._trial_running = True
+            return True
+
+    def record(self, ok, ms, error=None):
+        with self._lock:
+            self.avg_ms = ms if self.avg_ms is None else 0.8 * self.avg_ms + 0.2 * ms
+            slow = self.slow_ms is not None and ms > self.slow_ms
+            if ok:
+                self.successes += 1
+            else:
+                self.failures += 1
+                self.last_error = error
+            if ok and not slow:
+                self.consecutive_failures = 0
+                if self.state != "closed":
+                    logger.info("Provider %s recovered; closing its circuit", self.name)
+                self.state = "closed"
+            else:
+                self.consecutive_failures += 1
+                if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                    if self.state != "open":
+                        logger.warning("Provider %s is failing (%s); skipping it for %.0fs",
+                                       self.name, error or f"{ms:.0f} ms", self.cooldown)
+                        METRICS.inc("provider_circuit_open", provider=self.name)
+                    self.state = "open"
+                    self.opened_at = time.monotonic()
+            self._trial_running = False
+
+    def abandon(self):
+        """Give back a call claimed with begin() that never reached the provider."""
+        with self._lock:
+            self._trial_running = False
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures,
+                    "successes": self.successes, "failures": self.failures,
+                    "avg_ms": self.avg_ms, "last_error": self.last_error}
+
+
+class ProviderRouter:
+    """Sends a prompt to the preferred provider and fails over to the others.
+
+    `resolve(name)` returns the client for a provider name, so the engine can
+    swap clients at any time. Providers whose client says it is not configured
+    (GeminiClient without a key) or whose circuit is open are skipped.
+
+    A provider that is only busy (the call raised ModelBusyError before it was
+    sent) is skipped without counting against its health; when every provider
+    tried was busy, generate() raises the ModelBusyError.
+
+    With `hedge_after_ms` set, a second provider is also asked once the first
+    has not answered within that time, and whichever good answer comes first
+    wins. The loser keeps running in the background (a blocking HTTP call
+    cannot be interrupted) and only updates the health stats.
+    """
+    def __init__(self, resolve, names, failure_threshold=3, cooldown=30.0, slow_ms=30000,
+                 hedge_after_ms=None, max_workers=16):
+        self.resolve = resolve
+        self.names = tuple(names)
+        self.hedge_after_ms = hedge_after_ms
+        self.health = {name: ProviderHealth(name, failure_threshold, cooldown, slow_ms) for name in self.names}
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+        return self._executor
+
+    def set_slow_ms(self, slow_ms):
+        """Latency (ms) above which a call counts against its provider's circuit; None to ignore latency."""
+        for health in self.health.values():
+            health.slow_ms = slow_ms
+
+    def is_configured(self, name):
+        check = getattr(self.resolve(name), "is_configured", None)
+        return check() if check else True
+
+    def candidates(self, primary, skip=()):
+        """Provider names to try, `primary` first, without unconfigured or open-circuit ones."""
+        order = [primary] + [n for n in self.names if n != primary]
+        return [n for n in order if n not in skip and n in self.health
+                and self.is_configured(n) and self.health[n].available()]
+
+    def snapshot(self):
+        return {name: dict(h.snapshot(), configured=self.is_configured(name)) for name, h in self.health.items()}
+
+    def record(self, name, ok, ms, error=None):
+        self.health[name].record(ok, ms, error)
+        METRICS.inc("provider_calls", provider=name, result="ok" if ok else "error")
+        METRICS.observe("provider_ms", ms, provider=name)
+
+    @staticmethod
+    def _reply(result, provider, ok):
+        text, extra = result if isinstance(result, tuple) else (result, None)
+        return text, provider, ok, extra
+
+    def _attempt(self, name, prompt, call):
+        """Returns (result, ok), `result` being what `call` returned or an error text."""
+        if not self.health[name].begin():
+            return None, False
+        start = time.perf_counter()
+        try:
+            result = call(name, self.resolve(name), prompt)
+        except ModelBusyError:
+            self.health[name].abandon()
+            METRICS.inc("provider_busy", provider=name)
+            raise
+        except Exception as e:
+            result = f"Error calling {name}: {e}"
+        text = result[0] if isinstance(result, tuple) else result
+        ok = not is_error_response(text)
+        self.record(name, ok, (time.perf_counter() - start) * 1000, None if ok else text[:200])
+        return result, ok
+
+    def generate(self, prompt, primary, call=None, skip=()):
+        """Returns (text, provider, ok, extra).
+
+        `call(name, client, prompt)` defaults to client.generate_response. It may
+        return (text, extra) instead of the text to hand back something that
+        belongs to that very answer (the engine's Ollama context); `extra` is
+        only ever the one from the answer returned, None otherwise.
+        """
+        call = call or (lambda name, client, p: client.generate_response(p))
+        order = self.candidates(primary, skip)
+        if not order:
+            return None, None, False, None
+        if self.hedge_after_ms is not None and len(order) > 1:
+            return self._hedged(prompt, order, call)
+
+        text, used, busy = None, order[0], None
+        for i, name in enumerate(order):
+            if i:
+                METRICS.inc("provider_failover", source=order[i - 1], target=name)
+                logger.info("Failing over from %s to %s", order[i - 1], name)
+            try:
+                text, ok = self._attempt(name, prompt, call)
+            except ModelBusyError as e:
+                busy = e
+                continue
+            used = name
+            if ok:
+                return self._reply(text, name, True)
+        if text is None and busy is not None:
+            raise busy
+        return self._reply(text, used, False)
+
+    def _hedged(self, prompt, order, call):
+        pool = self._pool()
+        futures = {pool.submit(self._attempt, order[0], prompt, call): order[0]}
+        rest = list(order[1:])
+        done, _ = wait(futures, timeout=self.hedge_after_ms / 1000)
+        if not done:
+            hedge = rest.pop(0)
+            METRICS.inc("provider_hedged", provider=hedge)
+            logger.debug("%s slower than %s ms; also asking %s", order[0], self.hedge_after_ms, hedge)
+            futures[pool.submit(self._attempt, hedge, prompt, call)] = hedge
+
+        text, used, busy = None, order[0], None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, ok = future.result()
+                except ModelBusyError as e:
+                    busy = e
+                    continue
+                if ok:
+                    if futures[future] != order[0]:
+                        METRICS.inc("provider_hedge_won", provider=futures[future])
+                    return self._reply(result, futures[future], True)
+                if result is not None:
+                    text, used = result, futures[future]
+        # Everything asked so far failed; the remaining providers are tried one by one
+        for name in rest:
+            METRICS.inc("provider_failover", source=used, target=name)
+            try:
+                result, ok = self._attempt(name, prompt, call)
+            except ModelBusyError as e:
+                busy = e
+                continue
+            if ok:
+                return self._reply(result, name, True)
+            if result is not None:
+                text, used = result, name
+        if text is None and busy is not None:
+            raise busy
+        return self._reply(text, used, False)
@@ -0,0 +1,189 @@
+import re
+
+# Shared by every prompt and never formatted, so it is byte-identical from one
+# turn to the next and Ollama can reuse its cached prefill for it
+STATIC_PREFIX = (
+    "Instructions: You are a helpful AI Assistant. \n"
+    "Constraint: Do NOT provide Romanized pronunciation in parentheses. Write ONLY the script.\n"
+    "Constraint: Do not use 'Ka/Krap' slash format. Speak naturally. Avoid mechanical repetitive greetings.\n"
+)
+
+ENHANCE_TASK = (
+    "Task: I have an answer from my database (given below). "
+    "Please rewrite this answer to be more polite, natural, and helpful. \n"
+    "IMPORTANT: Please expand on the answer. Add relevant details or explanations to make it comprehensive.\n"
+)
+
+RAG_TASK = (
+    "Task: You have access to a local knowledge base (provided below). \n"
+    "Use that information as a starting point, but please EXPAND on it. \n"
+    "Provide a detailed, comprehensive, and helpful response. \n"
+)
+
+SUMMARY_HEADER = "Summary of earlier conversation:\n"
+HISTORY_HEADER = "Previous Conversation:\n"
+
+_SENTENCE_END = re.compile(r"[.!?。\n]")
+
+
+def estimate_tokens(text):
+    """Rough token count: ~4 ASCII characters per token, ~2 per token for Lao/Thai and other scripts."""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    other = len(text) - ascii_chars
+    return (ascii_chars + 3) // 4 + (other + 1) // 2
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut `text` to about `max_tokens`, at a space when there is one nearby, marking the cut with "…"."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ""
+    cut = max(1, len(text) * (max_tokens - 1) // estimate_tokens(text))
+    while cut > 1 and estimate_tokens(text[:cut]) > max_tokens - 1:
+        cut = cut * 9 // 10
+    space = text.rfind(" ", cut * 3 // 4, cut)
+    return text[:space if space > 0 else cut].rstrip() + "…"
+
+
+def summarize_turn(user_line, ai_line, width=80):
+    """One short line for a turn leaving the history window: the question and the gist of the answer."""
+    user = user_line.split(": ", 1)[-1].strip()
+    answer = ai_line.split(": ", 1)[-1].strip()
+    m = _SENTENCE_END.search(answer)
+    gist = answer[:m.end()].strip() if m else answer
+    if len(user) > width:
+        user = user[:width].rstrip() + "…"
+    if len(gist) > width:
+        gist = gist[:width].rstrip() + "…"
+    return f"- User asked: {user} / AI: {gist}"
+
+
+class PromptBuilder:
+    """Builds the enhance / RAG prompts inside a token budget.
+
+    Layout: STATIC_PREFIX, task, language rule, earlier-conversation summary,
+    recent turns, knowledge, question. Everything up to the language rule is
+    fixed text. The knowledge gets the budget first (best matches first, each
+    answer capped at `snippet_tokens`), then the newest turns up to
+    `history_tokens`; older turns that do not fit are folded into the summary,
+    which gets at most `summary_tokens`.
+
+    Each build also returns a follow-up prompt (instructions, language rule,
+    knowledge, question, but no history) for when Ollama is given the
+    previous turns as a `context`. Section headers and separators are
+    counted too, so neither prompt goes over `max_tokens`.
+    """
+    def __init__(self, max_tokens=1536, snippet_tokens=256, history_tokens=384,
+                 summary_tokens=128, min_score=0.15):
+        self.max_tokens = max_tokens
+        self.snippet_tokens = snippet_tokens
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.min_score = min_score
+
+    def build_enhance(self, user_input, local_answer, lang_instruction, session):
+        """Prompt asking the model to rewrite `local_answer`; returns (prompt, followup, token_estimate)."""
+        head = STATIC_PREFIX + ENHANCE_TASK + lang_instruction + "\n"
+        tail = self._tail("User Question: ", user_input, "\nEnhanced Answer:")
+        remaining = self._remaining(head, tail)
+        wrapper = estimate_tokens("Answer from database: ''\n")
+        # The one answer may use everything the history does not want, but never less than a snippet
+        room = max(min(self.snippet_tokens, remaining), remaining - self._history_need(session)) - wrapper
+        knowledge = f"Answer from database: '{truncate_tokens(local_answer, room)}'\n"
+        prompt, tokens = self._assemble(head, tail, knowledge, remaining, session)
+        return prompt, self._followup(head, knowledge, tail), tokens
+
+    def build_rag(self, user_input, matches, lang_instruction, session):
+        """Prompt with the best (score, entry) matches as context; returns (prompt, followup, sources, token_estimate)."""
+        head = STATIC_PREFIX + RAG_TASK + lang_instruction + "\n"
+        tail = self._tail("User Question: ", user_input, "\nAnswer:")
+        remaining = self._remaining(head, tail)
+        budget = remaining - self._history_need(session)
+
+        lines = []
+        sources = []
+        used = estimate_tokens("Information from Knowledge Base:\n")
+        for score, entry in sorted(matches, key=lambda m: m[0], reverse=True):
+            if score <= self.min_score:
+                break
+            prefix = f"- Q: {entry['q']} | A: "
+            room = min(self.snippet_tokens, budget - used - estimate_tokens(prefix) - 1)
+            if room < 16:
+                break
+            line = prefix + truncate_tokens(entry['a'], room) + "\n"
+            lines.append(line)
+            sources.append(entry)
+            used += estimate_tokens(line)
+        if sources:
+            knowledge = "Information from Knowledge Base:\n" + "".join(lines)
+        else:
+            knowledge = "No specific local data available.\n"
+        prompt, tokens = self._assemble(head, tail, knowledge, remaining, session)
+        return prompt, self._followup(head, knowledge, tail), sources, tokens
+
+    def _tail(self, label, user_input, cue):
+        # A pasted essay as the question must not push the prompt over budget
+        return label + truncate_tokens(user_input, self.max_tokens // 4) + cue
+
+    def _remaining(self, head, tail):
+        # One token is kept for the newline that starts the follow-up prompt
+        return self.max_tokens - estimate_tokens(head) - estimate_tokens(tail) - 1
+
+    @staticmethod
+    def _followup(head, knowledge, tail):
+        # Same instructions as the full prompt; only the history is left to the model's context
+        return "\n" + head + knowledge + tail
+
+    def _history_need(self, session):
+        """Tokens the history and summary would like, within their caps."""
+        history = min(self.history_tokens, sum(estimate_tokens(h) for h in session.history))
+        summary = min(self.summary_tokens, sum(estimate_tokens(s) for s in session.summary))
+        return history + summary
+
+    def _assemble(self, head, tail, knowledge, remaining, session):
+        left = remaining - estimate_tokens(knowledge)
+
+        # Newest turns first, verbatim while they fit
+        turns = [session.history[i:i + 2] for i in range(0, len(session.history), 2)]
+        recent = []
+        history_budget = min(left, self.history_tokens)
+        budget = history_budget - estimate_tokens(HISTORY_HEADER)
+        while turns:
+            text = "\n".join(turns[-1])
+            cost = estimate_tokens(text) + 1
+            if cost > budget and not recent and len(turns[-1]) == 2:
+                # The last turn is always shown, its answer cut down if it has to be
+                user, ai = turns[-1]
+                text = user + "\n" + truncate_tokens(ai, budget - estimate_tokens(user) - 2)
+                cost = estimate_tokens(text) + 1
+            if cost > budget:
+                break
+            recent.insert(0, text)
+            budget -= cost
+            turns.pop()
+        if recent:
+            left -= history_budget - budget
+
+        # Turns that did not fit join the rolling summary, newest lines kept first
+        summary_lines = list(session.summary) + [summarize_turn(*t) for t in turns if len(t) == 2]
+        kept = []
+        budget = min(left, self.summary_tokens) - estimate_tokens(SUMMARY_HEADER)
+        for line in reversed(summary_lines):
+            cost = estimate_tokens(line) + 1
+            if cost > budget:
+                break
+            kept.insert(0, line)
+            budget -= cost
+
+        parts = [head]
+        if kept:
+            parts.append(SUMMARY_HEADER + "\n".join(kept) + "\n")
+        if recent:
+            parts.append(HISTORY_HEADER + "\n".join(recent) + "\n")
+        parts.append(knowledge)
+        parts.append(tail)
+        prompt = "".join(parts)
+        return prompt, estimate_tokens(prompt)
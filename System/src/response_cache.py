@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .text_norm import normalize
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text):
+    # Same form as retrieval, so spellings that match the same entry share a cache record
+    return normalize(text)
+
+
+class ResponseCache:
+    """LRU + TTL cache for model answers, optionally backed by SQLite.
+
+    Keys cover everything that shapes the model prompt (normalized input, the
+    knowledge entries used, provider/model, the history window and the
+    generation options such as temperature), so a hit
+    is only possible when the same prompt would be sent again. Every record is
+    tagged with the questions it was built from, so editing a knowledge entry
+    can drop exactly the answers that used it.
+    """
+    def __init__(self, max_entries=1000, ttl=24 * 3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._memory = OrderedDict() # key -> (created, response, questions)
+        self._lock = threading.RLock()
+        self._db = None
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "invalidations": 0}
+
+        if db_path:
+            try:
+                self._open_db()
+            except sqlite3.Error as e:
+                logger.warning("Response cache DB unavailable, using memory only: %s", e)
+                self._db = None
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS response_sources (key TEXT NOT NULL, question TEXT NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_response_sources_q ON response_sources (question)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(user_input, sources, provider, model, history, options=None):
+        payload = json.dumps([
+            normalize_question(user_input),
+            [[entry["q"], entry["a"]] for entry in sources],
+            provider, model, list(history), options or {},
+        ], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if now - item[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return item[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    questions = [r[0] for r in self._db.execute(
+                        "SELECT question FROM response_sources WHERE key = ?", (key,))]
+                    self._remember(key, row[1], row[0], questions)
+                    self.stats["hits"] += 1
+                    self.stats["disk_hits"] += 1
+                    return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, response, questions=()):
+        questions = [normalize_question(q) for q in questions]
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, response, questions)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                                 (key, response, created))
+                self._db.execute("DELETE FROM response_sources WHERE key = ?", (key,))
+                self._db.executemany("INSERT INTO response_sources (key, question) VALUES (?, ?)",
+                                     [(key, q) for q in questions])
+                self._db.commit()
+
+    def _remember(self, key, created, response, questions):
+        self._memory[key] = (created, response, questions)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate_question(self, question):
+        """Drop every cached answer that was built from this knowledge question."""
+        q = normalize_question(question)
+        with self._lock:
+            stale = [k for k, item in self._memory.items() if q in item[2]]
+            for k in stale:
+                del self._memory[k]
+            removed = len(stale)
+            if self._db is not None:
+                keys = [r[0] for r in self._db.execute(
+                    "SELECT DISTINCT key FROM response_sources WHERE question = ?", (q,))]
+                for k in keys:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (k,))
+                    self._db.execute("DELETE FROM response_sources WHERE key = ?", (k,))
+                self._db.commit()
+                removed = max(removed, len(keys))
+            self.stats["invalidations"] += removed
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.execute("DELETE FROM response_sources")
+                self._db.commit()
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for k in [k for k, item in self._memory.items() if item[0] < cutoff]:
+                del self._memory[k]
+            if self._db is not None:
+                self._db.execute("DELETE FROM response_sources WHERE key IN (SELECT key FROM responses WHERE created < ?)", (cutoff,))
+                self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self._db.commit()
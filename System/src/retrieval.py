@@ -0,0 +1,269 @@
+import heapq
+import math
+from array import array
+from difflib import SequenceMatcher
+from operator import itemgetter
+
+from .text_norm import detect_language, normalize
+
+
+class KnowledgeIndex:
+    """Normalized text and language of every question, computed once per question.
+
+    Keyed by the question string, so the rebuild after an edit only prepares
+    the new or changed questions; `text(entry)` is then a dict lookup. Entries
+    themselves stay {"q", "a"}, since they are what gets saved.
+    """
+    def __init__(self):
+        self._meta = {}
+        self.exact = {} # normalized question -> entry, for the exact-match fast path
+
+    def __len__(self):
+        return len(self._meta)
+
+    def prepare(self, entries):
+        meta = self._meta
+        exact = {}
+        for entry in entries:
+            q = entry["q"]
+            m = meta.get(q)
+            if m is None:
+                m = meta[q] = (normalize(q), detect_language(q))
+            exact.setdefault(m[0], entry)
+        self.exact = exact
+        if len(meta) > 2 * len(entries) + 1000:
+            # Mostly deleted or renamed questions by now
+            self._meta = {e["q"]: meta[e["q"]] for e in entries}
+        return self
+
+    def _get(self, q):
+        meta = self._meta.get(q)
+        if meta is None:
+            meta = self._meta[q] = (normalize(q), detect_language(q))
+        return meta
+
+    def text(self, entry):
+        return self._get(entry["q"])[0]
+
+    def language(self, entry):
+        return self._get(entry["q"])[1]
+
+
+class LinearRetriever:
+    """Baseline: every entry is a candidate (the original full scan)."""
+    name = "linear"
+
+    def __init__(self, entries, prepared=None):
+        self.entries = entries
+        self.prepared = prepared or KnowledgeIndex().prepare(entries)
+
+    def candidates(self, query, limit=50):
+        return self.entries
+
+
+class NgramRetriever:
+    """Character n-gram inverted index over the questions.
+
+    Lao (and Thai) are written without spaces between words, so the index works
+    on overlapping character n-grams instead of words. A query only touches the
+    posting lists of its own n-grams, and very common n-grams are capped, so the
+    cost per lookup does not grow with the size of the knowledge base.
+
+    The n-gram ranking only approximates SequenceMatcher's, so the best entry
+    by ratio can fall outside the top `limit` candidates; the larger the
+    knowledge base, the more often it does. See scaled_limit and
+    widen_below_threshold for how the engine keeps that from changing answers.
+    """
+    name = "ngram"
+
+    def __init__(self, entries, prepared=None, sizes=(2, 3), max_postings=1000):
+        self.entries = entries
+        self.prepared = prepared = prepared or KnowledgeIndex().prepare(entries)
+        self.sizes = sizes
+        self.max_postings = max_postings
+        self.postings = {}
+        self.gram_counts = array('i')
+
+        for idx, entry in enumerate(entries):
+            grams = self._grams(prepared.text(entry))
+            self.gram_counts.append(len(grams))
+            for g in grams:
+                plist = self.postings.get(g)
+                if plist is None:
+                    plist = self.postings[g] = array('i')
+                plist.append(idx)
+
+    def _grams(self, text):
+        # Spaces carry no meaning for Lao, and only noise for the other languages
+        text = "".join(text.split())
+        grams = set()
+        for n in self.sizes:
+            if len(text) < n:
+                continue
+            for i in range(len(text) - n + 1):
+                grams.add(text[i:i + n])
+        if not grams and text:
+            grams.add(text)
+        return grams
+
+    def candidates(self, query, limit=50):
+        total = len(self.entries)
+        if total <= limit:
+            return self.entries
+
+        # `query` is already normalized (see text_norm.normalize)
+        q_grams = self._grams(query)
+        if not q_grams:
+            return []
+
+        # Rarest n-grams first: they are the most selective and the cheapest
+        lists = sorted((self.postings[g] for g in q_grams if g in self.postings), key=len)
+        scores = {}
+        for plist in lists:
+            if len(plist) > self.max_postings:
+                if scores:
+                    break
+                # Only very common n-grams matched; scan a bounded slice of them
+                plist = plist[:self.max_postings]
+            weight = math.log(1.0 + total / len(plist))
+            for idx in plist:
+                scores[idx] = scores.get(idx, 0.0) + weight
+
+        # Dice-style normalisation so long questions are not favoured
+        n_query = len(q_grams)
+        counts = self.gram_counts
+        best = heapq.nlargest(limit, scores.items(),
+                              key=lambda kv: kv[1] / (n_query + counts[kv[0]]))
+        return [self.entries[idx] for idx, _ in best]
+
+
+def scaled_limit(limit, total):
+    """Candidates to score for a knowledge base of `total` entries.
+
+    `limit` up to 10k entries, then one more `limit` per tenfold growth
+    (2x at 100k, 3x at 1M): more entries share the query's n-grams, so the
+    best match sits lower in the n-gram ranking.
+    """
+    if total <= 10000:
+        return limit
+    return int(limit * (1 + math.log10(total / 10000)))
+
+
+def rank_matches(query, candidates, k=5, semantic=None, prepared=None):
+    """Score each candidate once and return the top k as (score, entry), best first.
+
+    `query` must be normalized; `prepared` (a KnowledgeIndex) supplies the
+    normalized questions, which are otherwise normalized here.
+
+    `semantic` maps id(entry) to a cosine similarity (see semantic.SemanticRetriever);
+    an entry scores the higher of that and its string ratio.
+    """
+    # nlargest is stable, so on ties the earlier entry wins like the old linear scan
+    text = prepared.text if prepared is not None else lambda entry: normalize(entry["q"])
+    scored = ((SequenceMatcher(None, query, text(entry)).ratio(), entry) for entry in candidates)
+    if semantic:
+        scored = ((max(score, semantic.get(id(entry), 0.0)), entry) for score, entry in scored)
+    return heapq.nlargest(k, scored, key=itemgetter(0))
+
+
+class PartitionedRetriever:
+    """The entries split by script (Lao / Thai / English, see text_norm.detect_language).
+
+    A Lao query scored against Thai or English questions gets a ratio near 0,
+    so `candidates()` only searches the query's own partition;
+    `fallback_candidates()` searches the rest, for when that found nothing
+    good (see widen_matches), and `all_candidates()` all of them, for when
+    even that stays below the match threshold (see widen_below_threshold).
+    In-memory strategies get one retriever per
+    partition. A `shared` retriever that cannot be split (FTS lives in one
+    SQLite index) is searched once and its candidates filtered by script.
+    """
+    def __init__(self, entries, prepared, strategy=None, shared=None):
+        self.entries = entries
+        self.prepared = prepared
+        self.shared = shared
+        self.name = shared.name if shared is not None else strategy
+        groups = {}
+        for entry in entries:
+            groups.setdefault(prepared.language(entry), []).append(entry)
+        self.sizes = {language: len(group) for language, group in groups.items()}
+        self.partitions = {} if shared is not None else {
+            language: build_retriever(strategy, group, prepared) for language, group in groups.items()}
+
+    def candidates(self, query, limit=50, language=None):
+        language = language or detect_language(query)
+        if self.shared is not None:
+            script = self.prepared.language
+            return [e for e in self.shared.candidates(query, limit) if script(e) == language]
+        partition = self.partitions.get(language)
+        return partition.candidates(query, limit) if partition is not None else []
+
+    def fallback_candidates(self, query, limit=50, language=None):
+        language = language or detect_language(query)
+        if self.shared is not None:
+            script = self.prepared.language
+            return [e for e in self.shared.candidates(query, limit) if script(e) != language]
+        result = []
+        for name, partition in self.partitions.items():
+            if name != language:
+                result.extend(partition.candidates(query, limit))
+        return result
+
+    def all_candidates(self, query, limit=50):
+        if self.shared is not None:
+            return self.shared.candidates(query, limit)
+        result = []
+        for partition in self.partitions.values():
+            result.extend(partition.candidates(query, limit))
+        return result
+
+
+def widen_matches(query, retriever, matches, language, k=5, limit=50, fallback_score=0.3):
+    """Add the other partitions' matches when the query's own partition has nothing good.
+
+    Returns (matches, outcome): "hit" when the best own-partition score
+    reached `fallback_score`, otherwise "fallback", or "fallback_won" when
+    another partition gave the best match.
+    """
+    if matches and matches[0][0] >= fallback_score:
+        return matches, "hit"
+    seen = {id(entry) for _, entry in matches}
+    candidates = [e for e in retriever.fallback_candidates(query, limit, language) if id(e) not in seen]
+    others = rank_matches(query, candidates, k, prepared=retriever.prepared)
+    if not others:
+        return matches, "fallback"
+    won = not matches or others[0][0] > matches[0][0]
+    # nlargest is stable: on ties the own partition's match stays first
+    return heapq.nlargest(k, matches + others, key=itemgetter(0)), "fallback_won" if won else "fallback"
+
+
+def widen_below_threshold(query, retriever, matches, threshold, k=5, limit=500):
+    """Rescore with `limit` candidates when the best match is below `threshold`.
+
+    A query whose best candidate misses the threshold goes to the model
+    instead of the stored answer, so that is where a candidate the n-gram
+    ranking cut off would change the reply. A PartitionedRetriever is searched
+    across all partitions, since a question in another script (a mixed
+    Lao/English one, say) can still be the best match. Returns (matches, widened).
+    """
+    if matches and matches[0][0] >= threshold:
+        return matches, False
+    seen = {id(entry) for _, entry in matches}
+    search = retriever.all_candidates if isinstance(retriever, PartitionedRetriever) else retriever.candidates
+    candidates = [e for e in search(query, limit) if id(e) not in seen]
+    others = rank_matches(query, candidates, k, prepared=retriever.prepared)
+    # nlargest is stable: on ties the first pass's match stays first
+    return heapq.nlargest(k, matches + others, key=itemgetter(0)), True
+
+
+RETRIEVERS = {
+    LinearRetriever.name: LinearRetriever,
+    NgramRetriever.name: NgramRetriever,
+}
+
+
+def build_retriever(strategy, entries, prepared=None, partitioned=False):
+    if partitioned:
+        return PartitionedRetriever(entries, prepared or KnowledgeIndex().prepare(entries), strategy)
+    cls = RETRIEVERS.get(strategy, NgramRetriever)
+    return cls(entries, prepared)
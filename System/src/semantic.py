@@ -0,0 +1,323 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from .knowledge_store import _file_lock
+
+# numpy is imported on first use: semantic retrieval is optional and off by
+# default, and importing numpy would add ~90 ms to every chat/admin start
+np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+
+
+def semantic_available():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError: # The lexical strategies need nothing extra
+            return False
+        np = numpy
+    return True
+
+
+class OllamaEncoder:
+    """Embeds text through Ollama (/api/embed, or /api/embeddings on older versions).
+
+    Any object with a `name` and `encode(texts) -> list of vectors` can be
+    used instead, e.g. a local sentence-transformers model.
+    """
+    def __init__(self, client, model=DEFAULT_EMBEDDING_MODEL):
+        self.client = client
+        self.model = model
+
+    @property
+    def name(self):
+        return f"ollama:{self.model}"
+
+    def encode(self, texts):
+        return self.client.embed(texts, self.model)
+
+
+class VectorIndex:
+    """Unit-length float32 embeddings of the questions, memory-mapped from disk.
+
+    Files in `path`:
+        vectors.f32   the rows, appended as questions are embedded
+        keys.jsonl    the question key of each row, in the same order
+        meta.json     encoder name and dimension (a different encoder starts over)
+
+    Rows are only ever appended, so adding or editing a question embeds just
+    that question. The rows of deleted or renamed questions stay as garbage
+    until there is more garbage than live rows; then the files are rewritten.
+    More than `block_limit` missing questions (the first run over a large
+    knowledge base) are embedded on a background thread; until then the
+    questions without a vector are simply not semantic candidates.
+    """
+    def __init__(self, path, encoder, block_limit=64, batch_size=64, query_cache_size=1024):
+        if not semantic_available():
+            raise RuntimeError("Semantic retrieval needs numpy")
+        self.path = path
+        self.encoder = encoder
+        self.block_limit = block_limit
+        self.batch_size = batch_size
+        self.generation = 0
+        self.dim = None
+        self.matrix = None
+        self._rows = {}
+        self._keys = []
+        self._lock = threading.RLock()
+        self._filler = None
+        self._query_cache = OrderedDict()
+        self._query_cache_size = query_cache_size
+        self._failed = False
+        os.makedirs(path, exist_ok=True)
+        self._vectors_file = os.path.join(path, "vectors.f32")
+        self._keys_file = os.path.join(path, "keys.jsonl")
+        self._meta_file = os.path.join(path, "meta.json")
+        self._lock_file = os.path.join(path, "index.lock")
+        with self._lock, _file_lock(self._lock_file):
+            self._load()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def row(self, key):
+        return self._rows.get(key)
+
+    def _load(self):
+        try:
+            with open(self._meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if not meta or meta.get("encoder") != self.encoder.name:
+            self._reset()
+            return
+        self.dim = meta["dim"]
+        self._keys = []
+        self._rows = {}
+        self._read_keys(0)
+        self._remap()
+
+    def _read_keys(self, start):
+        """Pick up rows appended since `start` (possibly by another process)."""
+        try:
+            size = os.path.getsize(self._vectors_file)
+            with open(self._keys_file, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        # A row counts once both its vector and its key line are on disk
+        rows = min(len(lines), size // (4 * self.dim)) if self.dim else 0
+        for i in range(start, rows):
+            key = json.loads(lines[i])
+            self._keys.append(key)
+            self._rows[key] = i
+
+    def _remap(self):
+        rows = len(self._keys)
+        if rows:
+            self.matrix = np.memmap(self._vectors_file, dtype=np.float32, mode='r', shape=(rows, self.dim))
+        else:
+            self.matrix = None
+
+    def _reset(self):
+        for path in (self._vectors_file, self._keys_file, self._meta_file):
+            if os.path.exists(path):
+                os.remove(path)
+        self.dim = None
+        self.matrix = None
+        self._keys = []
+        self._rows = {}
+
+    def _encode(self, texts):
+        vectors = np.asarray(self.encoder.encode(texts), dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise RuntimeError(f"Encoder returned shape {vectors.shape} for {len(texts)} texts")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _append(self, keys, vectors):
+        with self._lock, _file_lock(self._lock_file):
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self._meta_file, 'w', encoding='utf-8') as f:
+                    json.dump({"encoder": self.encoder.name, "dim": self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise RuntimeError(f"Encoder dimension changed from {self.dim} to {vectors.shape[1]}")
+            self._read_keys(len(self._keys))
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if fresh:
+                # Vectors first: a key line without its vector is ignored on load
+                with open(self._vectors_file, 'ab') as f:
+                    f.write(np.ascontiguousarray(vectors[fresh]).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self._keys_file, 'a', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(keys[i], ensure_ascii=False) + "\n" for i in fresh))
+                for i in fresh:
+                    self._rows[keys[i]] = len(self._keys)
+                    self._keys.append(keys[i])
+            self._remap()
+
+    def _embed(self, missing):
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            self._append(batch, self._encode(batch))
+
+    def sync(self, keys):
+        """Make sure every question key has a row. Returns False if the encoder is unavailable."""
+        with self._lock:
+            missing = list(dict.fromkeys(k for k in keys if k not in self._rows))
+            if not missing:
+                self._maybe_compact(keys)
+                return True
+            if len(missing) > self.block_limit:
+                self._fill_in_background(missing)
+                return True
+        try:
+            self._embed(missing)
+        except Exception as e:
+            logger.warning("Could not embed %d questions: %s", len(missing), e)
+            return False
+        with self._lock:
+            self.generation += 1
+        return True
+
+    def _fill_in_background(self, missing):
+        if self._filler is not None and self._filler.is_alive():
+            return
+
+        def run():
+            logger.info("Embedding %d questions in the background", len(missing))
+            done = 0
+            try:
+                for start in range(0, len(missing), self.batch_size):
+                    batch = missing[start:start + self.batch_size]
+                    self._append(batch, self._encode(batch))
+                    done += len(batch)
+                    # Retrievers are rebuilt on every generation, so only bump now and then
+                    if done % (self.batch_size * 50) == 0:
+                        self.generation += 1
+            except Exception as e:
+                logger.warning("Background embedding stopped after %d questions: %s", done, e)
+            self.generation += 1
+            logger.info("Embedded %d questions", done)
+
+        self._filler = threading.Thread(target=run, name="embedding-fill", daemon=True)
+        self._filler.start()
+
+    def _maybe_compact(self, keys):
+        live = set(keys)
+        garbage = len(self._keys) - len(live & self._rows.keys())
+        if garbage <= max(1000, len(live)):
+            return
+        try:
+            with _file_lock(self._lock_file):
+                keep = [k for k in self._keys if k in live]
+                rows = np.asarray([self._rows[k] for k in keep], dtype=np.int64)
+                data = np.ascontiguousarray(self.matrix[rows]) if len(rows) else np.zeros((0, self.dim), np.float32)
+                self.matrix = None
+                for target, raw in ((self._vectors_file, data.tobytes()),
+                                    (self._keys_file, "".join(json.dumps(k, ensure_ascii=False) + "\n"
+                                                              for k in keep).encode('utf-8'))):
+                    tmp = target + ".tmp"
+                    with open(tmp, 'wb') as f:
+                        f.write(raw)
+                    os.replace(tmp, target)
+                self._keys = keep
+                self._rows = {k: i for i, k in enumerate(keep)}
+                self._remap()
+                self.generation += 1
+                logger.info("Compacted embeddings: dropped %d stale rows", garbage)
+        except OSError as e:
+            # Windows will not replace a file another process still has mapped
+            logger.warning("Could not compact embeddings: %s", e)
+            self._keys = []
+            self._rows = {}
+            self._read_keys(0)
+            self._remap()
+
+    def embed_query(self, text):
+        """Unit vector for a query, or None when the encoder fails (lexical results are used alone)."""
+        if not text or self.dim is None:
+            return None
+        vector = self._query_cache.get(text)
+        if vector is not None:
+            return vector
+        try:
+            vector = self._encode([text])[0]
+        except Exception as e:
+            if not self._failed:
+                logger.warning("Query embedding failed, using lexical matching only: %s", e)
+            self._failed = True
+            return None
+        self._failed = False
+        with self._lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+
+class SemanticRetriever:
+    """Lexical candidates plus the nearest questions by cosine similarity.
+
+    `search()` returns (candidates, semantic_scores). `semantic_scores` maps
+    id(entry) to the cosine for entries at or above `min_score`, which
+    rank_matches uses in place of the string ratio when it is higher. That is
+    what lets a paraphrase count as a local match.
+    """
+    name = "semantic"
+
+    def __init__(self, index, entries, lexical, key, min_score=0.8):
+        self.index = index
+        self.entries = entries
+        self.lexical = lexical
+        self.prepared = lexical.prepared
+        self.min_score = min_score
+        self.matrix = index.matrix
+        rows = len(self.matrix) if self.matrix is not None else 0
+        # Row -> position in entries; -1 for stale rows and rows added after this snapshot
+        self.row_entry = np.full(rows, -1, dtype=np.int64)
+        for i, entry in enumerate(entries):
+            r = index.row(key(entry["q"]))
+            if r is not None and r < rows:
+                self.row_entry[r] = i
+        self.live = int((self.row_entry >= 0).sum())
+
+    def candidates(self, query, limit=50):
+        return self.search(query, limit)[0]
+
+    def search(self, query, limit=50):
+        candidates = list(self.lexical.candidates(query, limit))
+        if not self.live:
+            return candidates, {}
+        vector = self.index.embed_query(query)
+        if vector is None:
+            return candidates, {}
+
+        sims = self.matrix @ vector
+        sims[self.row_entry < 0] = -np.inf
+        k = min(limit, self.live)
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+
+        seen = {id(e) for e in candidates}
+        scores = {}
+        for r in top:
+            entry = self.entries[self.row_entry[r]]
+            cos = float(sims[r])
+            if cos >= self.min_score:
+                scores[id(entry)] = cos
+            if id(entry) not in seen:
+                seen.add(id(entry))
+                candidates.append(entry)
+        return candidates, scores
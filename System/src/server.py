@@ -0,0 +1,387 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.models.router import ModelBusyError
+from src.telemetry import METRICS
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+MAX_HEADERS = 100
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SessionEntry:
+    __slots__ = ("session", "lock", "last_used")
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = asyncio.Lock() # One turn at a time per conversation
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """ChatSession per client id, oldest dropped first past `max_sessions` or after `ttl` idle seconds.
+
+    Only touched from the event loop, so it needs no locking.
+    """
+    def __init__(self, chatbot, max_sessions=10000, ttl=3600):
+        self.chatbot = chatbot
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, session_id=None):
+        """Return (session_id, entry); an unknown or missing id starts a new conversation."""
+        session_id = str(session_id) if session_id else uuid.uuid4().hex
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._entries[session_id] = SessionEntry(self.chatbot.new_session())
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(session_id)
+        entry.last_used = time.monotonic()
+        return session_id, entry
+
+    def drop(self, session_id):
+        return self._entries.pop(session_id, None) is not None
+
+    def expire(self):
+        cutoff = time.monotonic() - self.ttl
+        expired = [sid for sid, e in self._entries.items() if e.last_used < cutoff and not e.lock.locked()]
+        for sid in expired:
+            del self._entries[sid]
+        return len(expired)
+
+
+class ChatServer:
+    """HTTP/JSON front end for one shared ChatBot.
+
+    Every session shares the bot's knowledge index, retriever and response
+    cache; only the history is per session. The engine is blocking, so each
+    turn runs on a thread pool of `workers` threads, and the bot itself caps
+    how many of those may be inside a model call (ChatBot.set_model_concurrency).
+    Past `max_pending` turns in flight new chats get a 503 instead of queueing,
+    and so does a turn whose model call found no free slot (ModelBusyError).
+
+    Endpoints:
+        POST /chat                 {"message": ..., "session_id": ..., "stream": false}
+        DELETE /sessions/<id>      forget a conversation
+        GET /health                status as JSON
+        GET /metrics               Prometheus text (telemetry.METRICS)
+    """
+    def __init__(self, chatbot, host="127.0.0.1", port=8765, workers=64, max_pending=1000,
+                 max_sessions=10000, session_ttl=3600, request_timeout=300, idle_timeout=75):
+        self.chatbot = chatbot
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.idle_timeout = idle_timeout
+        self.sessions = SessionStore(chatbot, max_sessions=max_sessions, ttl=session_ttl)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat")
+        self.pending = 0
+        self._server = None
+        self._expiry_task = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # Build the retrieval index before the first client waits on it
+        await loop.run_in_executor(self.executor, self.chatbot.find_matches, "")
+        self.chatbot.warm_up()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._expiry_task = loop.create_task(self._expire_sessions())
+        logger.info("Serving on http://%s:%d", self.host, self.port)
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._expiry_task:
+            self._expiry_task.cancel()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False)
+
+    async def _expire_sessions(self):
+        while True:
+            await asyncio.sleep(min(60, self.sessions.ttl))
+            dropped = self.sessions.expire()
+            if dropped:
+                logger.debug("Expired %d idle sessions", dropped)
+
+    # --- HTTP plumbing ---
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            raise HTTPError(400, "Bad request line")
+        method, target, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > MAX_HEADERS:
+                raise HTTPError(400, "Too many headers")
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(400, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length < 0 or length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+        return method.upper(), target.split("?", 1)[0], body, keep_alive
+
+    @staticmethod
+    async def _send(writer, status, body, content_type="application/json; charset=utf-8", keep_alive=True):
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await self._send(writer, status, body, keep_alive=keep_alive)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.idle_timeout)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                except ValueError: # Line longer than the reader's limit
+                    await self._send_json(writer, 400, {"error": "Request line too long"}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                start = time.perf_counter()
+                route, status, keep_alive = await self._dispatch(writer, method, path, body, keep_alive)
+                METRICS.inc("http_requests", route=route, status=status)
+                METRICS.observe("http_ms", (time.perf_counter() - start) * 1000, route=route)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception("Unhandled error while serving a connection")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, method, path, body, keep_alive):
+        """Route one request; returns (route, status, keep_alive) for the metrics."""
+        if path == "/chat":
+            route, allowed = "chat", ("POST",)
+        elif path.startswith("/sessions/"):
+            route, allowed = "sessions", ("DELETE",)
+        elif path in ("/health", "/metrics"):
+            route, allowed = path[1:], ("GET",)
+        else:
+            await self._send_json(writer, 404, {"error": "Not found"}, keep_alive)
+            return "unknown", 404, keep_alive
+        if method not in allowed:
+            await self._send_json(writer, 405, {"error": "Method not allowed"}, keep_alive)
+            return route, 405, keep_alive
+
+        try:
+            if route == "chat":
+                status, keep_alive = await self._chat(writer, body, keep_alive)
+                return route, status, keep_alive
+            if route == "sessions":
+                dropped = self.sessions.drop(path[len("/sessions/"):])
+                await self._send_json(writer, 200 if dropped else 404, {"dropped": dropped}, keep_alive)
+                return route, 200 if dropped else 404, keep_alive
+            if route == "health":
+                await self._send_json(writer, 200, self.health(), keep_alive)
+            else:
+                body = self.metrics_text().encode('utf-8')
+                await self._send(writer, 200, body, "text/plain; version=0.0.4; charset=utf-8", keep_alive)
+            return route, 200, keep_alive
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": e.message}, keep_alive)
+            return route, e.status, keep_alive
+        except ConnectionError:
+            raise
+        except Exception:
+            logger.exception("Error while handling %s %s", method, path)
+            await self._send_json(writer, 500, {"error": "Internal server error"}, keep_alive=False)
+            return route, 500, False
+
+    # --- Endpoints ---
+
+    def health(self):
+        bot = self.chatbot
+        return {
+            "status": "ok",
+            "sessions": len(self.sessions),
+            "pending": self.pending,
+            "entries": len(bot.knowledge["questions"]),
+            "provider": bot.active_provider,
+            "model": bot.external_model_name,
+            "providers": bot.get_provider_health(),
+        }
+
+    def metrics_text(self):
+        partitions = "".join(f'laomind_partition_entries{{partition="{name}"}} {n}\n'
+                             for name, n in sorted(self.chatbot.get_partition_sizes().items()))
+        return (METRICS.to_prometheus()
+                + f"laomind_sessions {len(self.sessions)}\n"
+                + f"laomind_pending_requests {self.pending}\n"
+                + partitions)
+
+    async def _chat(self, writer, body, keep_alive):
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        message = payload.get("message") if isinstance(payload, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "'message' is required")
+        if self.pending >= self.max_pending:
+            METRICS.inc("http_rejected", reason="busy")
+            raise HTTPError(503, "Server busy, try again later")
+
+        session_id, entry = self.sessions.get(payload.get("session_id"))
+        self.pending += 1
+        try:
+            if payload.get("stream"):
+                async with entry.lock:
+                    return await self._stream_chat(writer, message, session_id, entry, keep_alive)
+            return await self._plain_chat(writer, message, session_id, entry, keep_alive)
+        finally:
+            self.pending -= 1
+
+    async def _plain_chat(self, writer, message, session_id, entry, keep_alive):
+        loop = asyncio.get_running_loop()
+        cancel_event = threading.Event()
+        await entry.lock.acquire()
+        try:
+            future = loop.run_in_executor(self.executor, self.chatbot.get_response,
+                                          message, cancel_event, entry.session)
+        except BaseException:
+            entry.lock.release()
+            raise
+        # The worker owns the session until it returns, even after a 504 has been sent,
+        # so the next turn of this conversation waits for it instead of racing it
+        future.add_done_callback(lambda _: entry.lock.release())
+        try:
+            reply = await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            # The worker thread can't be interrupted; the cancel keeps its answer out of the history
+            cancel_event.set()
+            raise HTTPError(504, "Timed out waiting for the model")
+        except ModelBusyError as e:
+            METRICS.inc("http_rejected", reason="model_busy")
+            raise HTTPError(503, f"Model busy, try again later ({e})")
+        await self._send_json(writer, 200, {"session_id": session_id, "reply": reply}, keep_alive)
+        return 200, keep_alive
+
+    async def _stream_chat(self, writer, message, session_id, entry, keep_alive):
+        """NDJSON over chunked encoding: {"type": "delta"|"final"|"error", "text": ...} per line."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancel_event = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError: # Loop already closed (server shutting down)
+                cancel_event.set()
+
+        def produce():
+            try:
+                for item in self.chatbot.stream_response(message, cancel_event, entry.session):
+                    put(item)
+            except ModelBusyError as e:
+                put(("busy", str(e)))
+            except Exception as e:
+                logger.exception("stream_response failed")
+                put(("error", str(e)))
+            finally:
+                put(None)
+
+        future = loop.run_in_executor(self.executor, produce)
+        # Nothing is sent before the first event, so a busy model can still get a 503
+        item = await queue.get()
+        if item is not None and item[0] == "busy":
+            await future
+            METRICS.inc("http_rejected", reason="model_busy")
+            raise HTTPError(503, f"Model busy, try again later ({item[1]})")
+        head = ("HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        try:
+            writer.write(head.encode('latin-1'))
+            first = json.dumps({"type": "session", "session_id": session_id}) + "\n"
+            self._write_chunk(writer, first.encode('utf-8'))
+            while item is not None:
+                kind, text = item
+                line = json.dumps({"type": kind, "text": text}, ensure_ascii=False) + "\n"
+                self._write_chunk(writer, line.encode('utf-8'))
+                await writer.drain()
+                item = await queue.get()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            # Client went away: stop the model stream and keep the reply out of the history
+            cancel_event.set()
+            keep_alive = False
+        finally:
+            # Hold the session lock until the worker is done with the session
+            await future
+        return 200, keep_alive
+
+    @staticmethod
+    def _write_chunk(writer, data):
+        writer.write(f"{len(data):X}\r\n".encode('latin-1') + data + b"\r\n")
+
+
+async def serve(chatbot, host="127.0.0.1", port=8765, **options):
+    server = ChatServer(chatbot, host=host, port=port, **options)
+    await server.start()
+    print(f"LaoMind server listening on http://{server.host}:{server.port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
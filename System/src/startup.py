@@ -0,0 +1,66 @@
+import json
+import sys
+import time
+
+# Captured as early as possible; run_*.py import this module first
+PROCESS_START = time.perf_counter()
+
+
+class StartupProfiler:
+    """Records how long each startup phase takes (--profile-startup)."""
+    def __init__(self, name, enabled=False, budget_ms=None):
+        self.name = name
+        self.enabled = enabled
+        self.budget_ms = budget_ms
+        self.phases = []
+        self._last = PROCESS_START
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append({
+            "phase": phase,
+            "ms": (now - self._last) * 1000,
+            "at_ms": (now - PROCESS_START) * 1000,
+        })
+        self._last = now
+
+    def total_ms(self):
+        return self.phases[-1]["at_ms"] if self.phases else 0.0
+
+    def over_budget(self):
+        return self.budget_ms is not None and self.total_ms() > self.budget_ms
+
+    def report(self, stream=None):
+        stream = stream or sys.stdout
+        print(f"Startup profile: {self.name}", file=stream)
+        for p in self.phases:
+            print(f"  {p['phase']:<28} {p['ms']:8.1f} ms   (at {p['at_ms']:8.1f} ms)", file=stream)
+        print(f"  {'total':<28} {self.total_ms():8.1f} ms", file=stream)
+        if self.budget_ms is not None:
+            status = "OVER BUDGET" if self.over_budget() else "within budget"
+            print(f"  budget {self.budget_ms:.0f} ms -> {status}", file=stream)
+
+    def to_json(self):
+        return json.dumps({"name": self.name, "phases": self.phases, "total_ms": self.total_ms(),
+                           "budget_ms": self.budget_ms, "over_budget": self.over_budget()})
+
+
+def parse_startup_args(argv):
+    """Pull --profile-startup / --startup-budget-ms N / --profile-json out of argv."""
+    enabled = "--profile-startup" in argv
+    as_json = "--profile-json" in argv
+    budget_ms = None
+    rest = []
+    skip = False
+    for i, arg in enumerate(argv):
+        if skip:
+            skip = False
+            continue
+        if arg == "--startup-budget-ms" and i + 1 < len(argv):
+            budget_ms = float(argv[i + 1])
+            skip = True
+        elif arg.startswith("--startup-budget-ms="):
+            budget_ms = float(arg.split("=", 1)[1])
+        elif arg not in ("--profile-startup", "--profile-json"):
+            rest.append(arg)
+    return enabled, as_json, budget_ms, rest
@@ -0,0 +1,202 @@
+import atexit
+import bisect
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last one catches the rest
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf"))
+
+
+def configure_logging(level=None):
+    """Set up logging for the apps. `level` defaults to $LAOMIND_LOG_LEVEL, then WARNING."""
+    level = level or os.environ.get("LAOMIND_LOG_LEVEL", "WARNING")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.WARNING
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # Only our own modules get the chosen level; libraries (urllib3...) stay quiet
+    logging.getLogger("src").setLevel(level)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (count, sum, min, max and bucket counts)."""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (an estimate)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return self.max if bound == float("inf") else min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if b == float("inf") else str(b)): n for b, n in zip(self.buckets, self.counts)},
+        }
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms, keyed by name + labels.
+
+    `snapshot()` / `to_json()` dump everything; `to_prometheus()` renders the
+    Prometheus text format so the numbers can be scraped.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _label_text(labels):
+        return ",".join(f'{k}="{v}"' for k, v in labels)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._counters.items())]
+            histograms = [dict(h.snapshot(), name=n, labels=dict(l)) for (n, l), h in sorted(self._histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, prefix="laomind_"):
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{prefix}{name}_total{{{self._label_text(labels)}}} {value}")
+            for (name, labels), hist in sorted(self._histograms.items()):
+                seen = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    seen += n
+                    le = "+Inf" if bound == float("inf") else bound
+                    all_labels = self._label_text(labels + (("le", le),))
+                    lines.append(f"{prefix}{name}_bucket{{{all_labels}}} {seen}")
+                lines.append(f"{prefix}{name}_sum{{{self._label_text(labels)}}} {hist.sum}")
+                lines.append(f"{prefix}{name}_count{{{self._label_text(labels)}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every ChatBot in the process
+METRICS = MetricsRegistry()
+
+
+def install_metrics_dump(path=None):
+    """Write METRICS as JSON to `path` (default $LAOMIND_METRICS_FILE) when the process exits."""
+    path = path or os.environ.get("LAOMIND_METRICS_FILE")
+    if not path:
+        return False
+    atexit.register(METRICS.dump, path)
+    return True
+
+
+class Trace:
+    """Span timings for one request.
+
+    Use `with trace.span("match"): ...` around each stage, then `finish(branch)`
+    to log one line with every span and feed the metrics registry.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, name, log=None, metrics=None, slow_ms=None):
+        self.name = name
+        self.id = next(Trace._ids)
+        self.log = log or logger
+        self.metrics = metrics or METRICS
+        self.slow_ms = slow_ms
+        self.spans = []
+        self.start = time.perf_counter()
+        self.branch = None
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        self.spans.append((name, ms))
+
+    def total_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def finish(self, branch):
+        """Record the request under `branch` (fast, local, enhance, rag, fallback, ...)."""
+        total = self.total_ms()
+        self.branch = branch
+        self.metrics.inc("requests", request=self.name, branch=branch)
+        self.metrics.observe("request_ms", total, request=self.name, branch=branch)
+        for name, ms in self.spans:
+            self.metrics.observe("stage_ms", ms, stage=name)
+
+        level = logging.INFO if self.slow_ms is not None and total >= self.slow_ms else logging.DEBUG
+        if self.log.isEnabledFor(level):
+            spans = " ".join(f"{name}={ms:.1f}ms" for name, ms in self.spans)
+            self.log.log(level, "trace %s id=%d branch=%s total=%.1fms %s",
+                         self.name, self.id, branch, total, spans)
+        return total
+
+    def to_dict(self):
+        return {"name": self.name, "id": self.id, "branch": self.branch,
+                "spans": [{"name": n, "ms": ms} for n, ms in self.spans]}
@@ -0,0 +1,65 @@
+"""Text normalization and script detection shared by indexing and querying.
+
+normalize() is applied once per question when the index is built (see
+retrieval.KnowledgeIndex) and once per query, so matching compares the same
+canonical form on both sides:
+
+    NFC, case folding, whitespace collapsed to single spaces
+    zero-width characters and soft hyphens removed
+    Lao/Thai: a tone mark typed before an upper vowel is moved after it,
+    NIGGAHITA + AA (ໍາ / ํา, how several keyboards type it) becomes SARA AM (ຳ / ำ),
+    and ຫນ / ຫມ become ໜ / ໝ
+"""
+import re
+import unicodedata
+
+ZERO_WIDTH = "\u200b\u200c\u200d\u2060\ufeff\u00ad"
+_DROP_ZERO_WIDTH = str.maketrans("", "", ZERO_WIDTH)
+
+# Tone mark followed by an upper vowel -> vowel first (the order Unicode renders and stores)
+_LAO_TONE_ORDER = re.compile("([\u0ec8-\u0ecb])([\u0eb1\u0eb4-\u0eb7\u0ebb\u0ecd])")
+_THAI_TONE_ORDER = re.compile("([\u0e48-\u0e4b])([\u0e31\u0e34-\u0e37\u0e47\u0e4d])")
+# NIGGAHITA (+ tone mark) + AA -> (tone mark +) SARA AM
+_LAO_AM = re.compile("\u0ecd([\u0ec8-\u0ecb]?)\u0eb2")
+_THAI_AM = re.compile("\u0e4d([\u0e48-\u0e4b]?)\u0e32")
+_LAO_LIGATURES = (("\u0eab\u0e99", "\u0edc"), ("\u0eab\u0ea1", "\u0edd"))
+
+_LAO_RUN = re.compile("[\u0e80-\u0eff]+")
+_THAI_RUN = re.compile("[\u0e00-\u0e7f]+")
+_LATIN_RUN = re.compile("[A-Za-z]+")
+
+
+def normalize(text):
+    """Canonical form of a question or query for matching."""
+    if not text:
+        return ""
+    if text.isascii():
+        return " ".join(text.lower().split())
+    text = unicodedata.normalize("NFC", text).translate(_DROP_ZERO_WIDTH).casefold()
+    if text and max(text) >= "\u0e00": # Thai, Lao or anything above them
+        text = _LAO_TONE_ORDER.sub(r"\2\1", text)
+        text = _LAO_AM.sub("\\1\u0eb3", text)
+        for pair, ligature in _LAO_LIGATURES:
+            text = text.replace(pair, ligature)
+        text = _THAI_TONE_ORDER.sub(r"\2\1", text)
+        text = _THAI_AM.sub("\\1\u0e33", text)
+    return " ".join(text.split())
+
+
+def script_counts(text):
+    """(Lao, Thai, Latin) letter counts, counted in runs by the regex engine rather than per character."""
+    return (sum(map(len, _LAO_RUN.findall(text))),
+            sum(map(len, _THAI_RUN.findall(text))),
+            sum(map(len, _LATIN_RUN.findall(text))))
+
+
+def detect_language(text):
+    # ກວດສອບພາສາຈາກ Unicode ranges; ຕັດສິນໃຈວ່າພາສາໃດຫຼາຍທີ່ສຸດ
+    lao, thai, eng = script_counts(text)
+    if lao > thai and lao > eng:
+        return "Lao"
+    elif thai > lao and thai > eng:
+        return "Thai"
+    elif eng > lao and eng > thai:
+        return "English"
+    return "Lao" # ຄ່າເລີ່ມຕົ້ນ
@@ -5,16 +5,23 @@ import json
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QTabWidget, QLabel, QComboBox, QSlider, QCheckBox, QPushButton, 
                              QScrollArea, QFrame, QListWidget, QMessageBox, QDialog, QLineEdit, 
-                             QTextEdit, QGroupBox, QFormLayout, QPlainTextEdit)
+                             QTextEdit, QGroupBox, QFormLayout, QPlainTextEdit, QFileDialog)
 from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, pyqtSignal
 
 try:
     from .engine import ChatBot
+    from .importer import import_file
 except ImportError:
     from engine import ChatBot
+    from importer import import_file
+
+FALLBACK_MODELS = ["gemma:2b", "gemma2:2b", "llama3", "mistral"]
 
 class AdminAppQt(QMainWindow):
+    # Emitted from the model discovery thread, delivered on the UI thread
+    models_discovered = pyqtSignal(list)
+
     def __init__(self):
         super().__init__()
         self.chatbot = ChatBot()
@@ -155,6 +162,10 @@ class AdminAppQt(QMainWindow):
         btn_ai.setStyleSheet("background-color: #9C27B0; color: white;")
         btn_ai.clicked.connect(self._ai_import_dialog)
         
+        btn_file = QPushButton("📂 ນຳເຂົ້າຈາກໄຟລ໌ (CSV/JSONL)")
+        btn_file.setStyleSheet("background-color: #009688; color: white;")
+        btn_file.clicked.connect(self._file_import)
+        
         btn_refresh = QPushButton("ໂຫຼດຂໍ້ມູນຄືນ")
         btn_refresh.clicked.connect(self._idx_knowledge_list)
         
@@ -164,6 +175,7 @@ class AdminAppQt(QMainWindow):
         
         controls_layout.addWidget(btn_add)
         controls_layout.addWidget(btn_ai)
+        controls_layout.addWidget(btn_file)
         controls_layout.addWidget(btn_refresh)
         controls_layout.addStretch()
         controls_layout.addWidget(btn_del)
@@ -244,6 +256,28 @@ class AdminAppQt(QMainWindow):
             self.chatbot.delete_knowledge(q_part)
             self._idx_knowledge_list()
 
+    def _file_import(self):
+        path, _ = QFileDialog.getOpenFileName(self, "ນຳເຂົ້າຂໍ້ມູນ", "",
+                                              "Q/A files (*.csv *.jsonl *.ndjson)")
+        if not path: return
+        
+        def progress(totals):
+            self.statusBar().showMessage(f"ກຳລັງນຳເຂົ້າ... {totals['read']} ລາຍການ")
+            QApplication.processEvents()
+        
+        try:
+            totals = import_file(self.chatbot, path, progress=progress)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Import failed: {e}")
+            return
+        finally:
+            self.statusBar().clearMessage()
+        
+        QMessageBox.information(self, "Success",
+                                f"ນຳເຂົ້າສຳເລັດ: ເພີ່ມ {totals['added']}, ອັບເດດ {totals['updated']}, "
+                                f"ບໍ່ປ່ຽນ {totals['unchanged']}")
+        self._idx_knowledge_list()
+
     def _ai_import_dialog(self):
         dialog = QDialog(self)
         dialog.setWindowTitle("ສ້າງຂໍ້ມູນອັດຕະໂນມັດ (AI Data Generator)")
@@ -291,12 +325,14 @@ class AdminAppQt(QMainWindow):
                 clean_json = resp.replace("```json", "").replace("```", "").strip()
                 data = json.loads(clean_json)
                 
-                count = 0
                 if isinstance(data, list):
-                    for item in data:
-                        if "q" in item and "a" in item:
-                            self.chatbot.add_knowledge(item["q"], item["a"])
-                            count += 1
+                    pairs = [item for item in data if isinstance(item, dict) and "q" in item and "a" in item]
+                    # One batch write instead of a reload + rewrite per pair
+                    result = self.chatbot.bulk_upsert(pairs)
+                    if "error" in result:
+                        QMessageBox.critical(dialog, "Error", f"Failed: {result['error']}")
+                        return
+                    count = result["added"] + result["updated"]
                     
                     QMessageBox.information(dialog, "Success", f"AI ສ້າງຂໍ້ມູນສຳເລັດ {count} ຂໍ້!")
                     self._idx_knowledge_list()
@@ -326,13 +362,15 @@ class AdminAppQt(QMainWindow):
         group = QGroupBox("ສະຖານະການທຳງານ (Status)")
         form = QFormLayout()
         
-        # Model Selection
+        # Model Selection (list comes from the engine's background discovery)
         self.combo_model = QComboBox()
-        available_models = self.chatbot.ollama.get_models()
+        available_models = self.chatbot.model_discovery.models
         if not available_models:
-             available_models = ["gemma:2b", "gemma2:2b", "llama3", "mistral"]
+             available_models = FALLBACK_MODELS
         self.combo_model.addItems(available_models)
         self.combo_model.setCurrentText(self.chatbot.external_model_name)
+        self.models_discovered.connect(self._set_model_list)
+        self.chatbot.model_discovery.on_ready(self.models_discovered.emit)
         
         refresh_btn = QPushButton("🔄")
         refresh_btn.setFixedWidth(40)
@@ -361,11 +399,17 @@ class AdminAppQt(QMainWindow):
         
         layout.addStretch()
 
+    def _set_model_list(self, mods):
+        if not mods:
+            return
+        current = self.combo_model.currentText()
+        self.combo_model.clear()
+        self.combo_model.addItems(mods)
+        self.combo_model.setCurrentText(current if current in mods else self.chatbot.external_model_name)
+
     def _refresh_models(self):
-        mods = self.chatbot.ollama.get_models()
+        mods = self.chatbot.model_discovery.refresh()
         if mods:
-            self.combo_model.clear()
-            self.combo_model.addItems(mods)
             QMessageBox.information(self, "Refreshed", f"Found {len(mods)} models!")
         else:
             QMessageBox.warning(self, "Error", "Could not fetch models.")
@@ -374,8 +418,7 @@ class AdminAppQt(QMainWindow):
         val = self.combo_model.currentText()
         self.chatbot.active_provider = "ollama"
         self.chatbot.use_external_model = self.check_ai.isChecked()
-        self.chatbot.external_model_name = val
-        self.chatbot.ollama.model = val
+        self.chatbot.set_model(val)
         
         QMessageBox.information(self, "Success", f"Updated AI Status!\nModel: {val}\nAI Enabled: {self.chatbot.use_external_model}")
 
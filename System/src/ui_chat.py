@@ -1,10 +1,12 @@
 
 import sys
 import os
+import threading
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLineEdit, QPushButton, QLabel, QScrollArea, QFrame, QSizePolicy)
 from PyQt5.QtGui import QFont, QIcon, QPalette, QColor
-from PyQt5.QtCore import Qt, QTimer, QSize
+from PyQt5.QtCore import Qt, QTimer, QSize, QThread, pyqtSignal
 
 try:
     from .engine import ChatBot
@@ -30,11 +32,75 @@ class CopyableLabel(QLabel):
         clipboard = QApplication.clipboard()
         clipboard.setText(self.text())
 
+class ReplyWorker(QThread):
+    """Streams ChatBot replies off the UI thread."""
+    chunk_received = pyqtSignal(int, str)
+    reply_ready = pyqtSignal(int, str)
+    reply_failed = pyqtSignal(int, str)
+
+    def __init__(self, chatbot, request_id, user_msg, parent=None):
+        super().__init__(parent)
+        self.chatbot = chatbot
+        self.request_id = request_id
+        self.user_msg = user_msg
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        # Stops reading the model stream at the next chunk; the reply is dropped
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            for kind, text in self.chatbot.stream_response(self.user_msg, cancel_event=self.cancel_event):
+                if self.cancel_event.is_set():
+                    return
+                if kind == "delta":
+                    self.chunk_received.emit(self.request_id, text)
+                else:
+                    self.reply_ready.emit(self.request_id, text)
+        except Exception as e:
+            if not self.cancel_event.is_set():
+                self.reply_failed.emit(self.request_id, str(e))
+
+class EngineLoader(QThread):
+    """Builds the ChatBot (knowledge load etc.) after the window is already visible."""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def run(self):
+        try:
+            chatbot = ChatBot()
+            # Loads the model in the background; the first message no longer waits for it
+            chatbot.warm_up()
+            self.loaded.emit(chatbot)
+        except Exception as e:
+            self.failed.emit(str(e))
+
 class ChatAppQt(QMainWindow):
-    def __init__(self):
+    engine_ready = pyqtSignal()
+
+    def __init__(self, profiler=None):
         super().__init__()
-        self.chatbot = ChatBot()
+        self.profiler = profiler
+        # Filled in by EngineLoader; messages sent before that are queued
+        self.chatbot = None
+        self._engine_error = None
+
+        # Messages waiting for a reply are answered one at a time, in order
+        self._pending = deque()
+        self._worker = None
+        self._workers = set() # Keep running threads alive until they finish
+        self._request_seq = 0
+        self._stream_bubble = None
+        self._stream_text = ""
+
         self.init_ui()
+        if self.profiler: self.profiler.mark("window built")
+
+        self._engine_loader = EngineLoader(self)
+        self._engine_loader.loaded.connect(self._on_engine_loaded)
+        self._engine_loader.failed.connect(self._on_engine_failed)
+        self._engine_loader.start()
 
     def init_ui(self):
         self.setWindowTitle("LaoMind-AI (Intelligent Chatbot)")
@@ -79,6 +145,39 @@ class ChatAppQt(QMainWindow):
         self.scroll_area.setWidget(self.chat_container)
         self.main_layout.addWidget(self.scroll_area)
 
+        # Typing Indicator (shown while the AI is generating)
+        self.typing_bar = QWidget()
+        self.typing_bar.setStyleSheet("background-color: #F2F2F2;")
+        typing_layout = QHBoxLayout(self.typing_bar)
+        typing_layout.setContentsMargins(15, 4, 15, 4)
+
+        self.typing_label = QLabel("AI ກຳລັງພິມ...")
+        self.typing_label.setStyleSheet("color: #777777; font-style: italic;")
+        typing_layout.addWidget(self.typing_label)
+        typing_layout.addStretch()
+
+        self.cancel_btn = QPushButton("ຍົກເລີກ")
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.clicked.connect(self.cancel_reply)
+        self.cancel_btn.setStyleSheet("""
+            QPushButton {
+                background-color: transparent;
+                color: #f44336;
+                border: 1px solid #f44336;
+                border-radius: 10px;
+                padding: 2px 10px;
+            }
+        """)
+        typing_layout.addWidget(self.cancel_btn)
+
+        self.typing_bar.hide()
+        self.main_layout.addWidget(self.typing_bar)
+
+        self._typing_dots = 0
+        self._typing_base = "AI ກຳລັງພິມ"
+        self._typing_timer = QTimer(self)
+        self._typing_timer.timeout.connect(self._animate_typing)
+
         # 3. Input Area
         input_container = QWidget()
         input_container.setStyleSheet("background-color: white; border-top: 1px solid #DDDDDD;")
@@ -122,9 +221,23 @@ class ChatAppQt(QMainWindow):
 
         self.main_layout.addWidget(input_container)
 
+    def _on_engine_loaded(self, chatbot):
+        self.chatbot = chatbot
+        if self.profiler: self.profiler.mark("engine ready")
+
         # Welcome Message
         first_msg = self.chatbot.emotion_manager.apply_style("ສະບາຍດີ! ມີຫຍັງໃຫ້ຂ້ອຍຊ່ວຍມື້ນີ້?")
         self.display_message("AI", first_msg, False)
+        self.engine_ready.emit()
+        self._start_next_reply()
+
+    def _on_engine_failed(self, error):
+        self._engine_error = error
+        # Messages queued while loading will never be answered; same clean-up as a failed reply
+        self._pending.clear()
+        self._set_typing(False)
+        self.input_field.setEnabled(True)
+        self.display_message("AI", f"ຂໍໂທດ, ເລີ່ມລະບົບບໍ່ສຳເລັດ: {error}", False)
 
     def send_message(self):
         msg = self.input_field.text().strip()
@@ -134,13 +247,103 @@ class ChatAppQt(QMainWindow):
         self.display_message("ທ່ານ", msg, True)
         self.input_field.clear()
 
-        # Get reply (Logic kept same)
-        # Using QTimer to minimize UI freeze, though threading would be better in future
-        QTimer.singleShot(100, lambda: self._process_reply(msg))
+        if self._engine_error is not None:
+            self.display_message("AI", f"ຂໍໂທດ, ເລີ່ມລະບົບບໍ່ສຳເລັດ: {self._engine_error}", False)
+            return
+
+        # Reply is generated on a worker thread so the window stays responsive
+        self._pending.append(msg)
+        if self.chatbot is None:
+            self._set_typing(True)
+        self._start_next_reply()
+
+    def _start_next_reply(self):
+        if self.chatbot is None or self._worker is not None or not self._pending:
+            return
+        user_msg = self._pending.popleft()
+        self._request_seq += 1
+
+        worker = ReplyWorker(self.chatbot, self._request_seq, user_msg, self)
+        worker.chunk_received.connect(self._on_reply_chunk)
+        worker.reply_ready.connect(self._on_reply_ready)
+        worker.reply_failed.connect(self._on_reply_failed)
+        worker.finished.connect(lambda w=worker: self._on_worker_finished(w))
+        self._worker = worker
+        self._workers.add(worker)
+        self._set_typing(True)
+        worker.start()
+
+    def _on_reply_chunk(self, request_id, chunk):
+        if self._worker is None or request_id != self._worker.request_id:
+            return # Stale chunk from a cancelled request
+        self._stream_text += chunk
+        if self._stream_bubble is None:
+            self._set_typing(True, streaming=True)
+            self._stream_bubble = self.display_message("AI", self._stream_text, False)
+        else:
+            self._stream_bubble.setText(self._stream_text)
+            self._scroll_to_bottom()
+
+    def _on_reply_ready(self, request_id, reply):
+        if self._worker is None or request_id != self._worker.request_id:
+            return # Stale reply from a cancelled request
+        if self._stream_bubble is not None:
+            # Swap the raw streamed text for the styled final answer
+            self._stream_bubble.setText(reply)
+            QTimer.singleShot(50, lambda: self._scroll_to_bottom())
+        else:
+            self.display_message("AI", reply, False)
+        self._reply_done()
+
+    def _on_reply_failed(self, request_id, error):
+        if self._worker is None or request_id != self._worker.request_id:
+            return
+        self.display_message("AI", f"ຂໍໂທດ, ເກີດຂໍ້ຜິດພາດ: {error}", False)
+        self._reply_done()
+
+    def _on_worker_finished(self, worker):
+        self._workers.discard(worker)
+        worker.deleteLater()
+        # Covers workers that finish without emitting (e.g. cancelled in the engine)
+        if worker is self._worker:
+            self._reply_done()
+
+    def _reply_done(self):
+        self._worker = None
+        self._stream_bubble = None
+        self._stream_text = ""
+        self._set_typing(False)
+        self._start_next_reply()
+
+    def cancel_reply(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        self.display_message("AI", "(ຍົກເລີກການຕອບແລ້ວ)", False)
+        self._reply_done()
+
+    def _set_typing(self, active, streaming=False):
+        if active:
+            self._typing_dots = 0
+            self._typing_base = "AI ກຳລັງຕອບ" if streaming else "AI ກຳລັງພິມ"
+            self.typing_label.setText(self._typing_base)
+            self.typing_bar.show()
+            self._typing_timer.start(400)
+        else:
+            self._typing_timer.stop()
+            self.typing_bar.hide()
+
+    def _animate_typing(self):
+        self._typing_dots = (self._typing_dots + 1) % 4
+        self.typing_label.setText(self._typing_base + "." * self._typing_dots)
 
-    def _process_reply(self, user_msg):
-        reply = self.chatbot.get_response(user_msg)
-        self.display_message("AI", reply, False)
+    def closeEvent(self, event):
+        self._pending.clear()
+        self._engine_loader.wait(2000)
+        for worker in list(self._workers):
+            worker.cancel()
+            worker.wait(2000)
+        super().closeEvent(event)
 
     def display_message(self, sender, message, is_user):
         # Create a container row for alignment
@@ -188,6 +391,7 @@ class ChatAppQt(QMainWindow):
         
         # Auto Scroll to bottom
         QTimer.singleShot(50, lambda: self._scroll_to_bottom())
+        return bubble
 
     def _scroll_to_bottom(self):
         scrollbar = self.scroll_area.verticalScrollBar()
@@ -0,0 +1,7 @@
+"""Lets the tests import src.* whether pytest is started from System/ or the project root."""
+import os
+import sys
+
+SYSTEM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SYSTEM_DIR not in sys.path:
+    sys.path.insert(0, SYSTEM_DIR)
@@ -0,0 +1,34 @@
+"""EmotionManager style replacements follow the current personality / tone settings."""
+import shutil
+import tempfile
+import unittest
+
+from src.engine import EmotionManager
+
+
+class ApplyStyleTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.manager = EmotionManager(self.data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def style(self, text, **settings):
+        self.manager.save_emotions(dict(self.manager.get_settings(), empathy=0, **settings))
+        return self.manager.apply_style(text)
+
+    def test_replacements_follow_the_settings(self):
+        self.assertEqual(self.style("ຂ້ອຍຮູ້", personality="ເພື່ອນ"), "ເຮົາຮູ້")
+        self.assertEqual(self.style("ຂ້ອຍຮູ້", personality="ບອດໜ້າຮັກ"), "ນ້ອງບອດຮູ້")
+        self.assertEqual(self.style("ຂ້ອຍຮູ້", personality="ຜູ້ຊ່ວຍ"), "ຂ້ອຍຮູ້")
+
+    def test_pattern_and_table_are_published_together(self):
+        self.style("x", personality="ເພື່ອນ")
+        key, pattern, table = self.manager._style
+        self.assertEqual(key, ("ເພື່ອນ", "ທາງການ"))
+        self.assertEqual(set(pattern.pattern.split("|")), set(table))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""SQLite knowledge backend: FTS candidates on normalized text and schema upgrades."""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from src.knowledge_sqlite import SCHEMA_VERSION, FtsRetriever, SqliteKnowledgeStore
+from src.text_norm import normalize
+
+FILLER = [f"question number {i}" for i in range(20)]
+
+
+class SqliteStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.data_dir, "knowledge.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def open_store(self):
+        store = SqliteKnowledgeStore(self.db_file)
+        self.addCleanup(store.close)
+        if not store.fts_enabled:
+            self.skipTest("SQLite without the FTS5 trigram tokenizer")
+        return store
+
+    def fts_questions(self, store, query):
+        store.get()
+        return [e["q"] for e in FtsRetriever(store).candidates(normalize(query), limit=3)]
+
+
+class FtsNormalizationTest(SqliteStoreTestCase):
+    def test_stored_variants_are_found_by_normalized_query(self):
+        store = self.open_store()
+        store.bulk_upsert([(q, "a") for q in FILLER])
+        variants = {
+            "ສະ​ບາຍ​ດີ": "ສະບາຍດີ", # zero-width spaces
+            "ຫນ້າຮ້ອນ": "ໜ້າຮ້ອນ", # ຫນ instead of ໜ
+            "ນໍ້າກິນ": "ນ້ຳກິນ", # ໍ + tone + າ instead of ຳ
+        }
+        for stored in variants:
+            store.upsert(stored, "a")
+        for stored, query in variants.items():
+            self.assertIn(stored, self.fts_questions(store, query))
+
+    def test_edit_reindexes_the_normalized_text(self):
+        store = self.open_store()
+        store.bulk_upsert([(q, "a") for q in FILLER] + [("ສະບາຍດີ", "a")])
+        store.edit("ສະບາຍດີ", "ຂອບ​ໃຈຫລາຍໆ", "b")
+        self.assertIn("ຂອບ​ໃຈຫລາຍໆ", self.fts_questions(store, "ຂອບໃຈຫລາຍໆ"))
+        self.assertNotIn("ສະບາຍດີ", self.fts_questions(store, "ສະບາຍດີ"))
+
+    def test_older_database_is_upgraded(self):
+        # Schema before the nq column: the FTS index covered the raw question
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.executescript("""
+                CREATE TABLE knowledge (id INTEGER PRIMARY KEY, q TEXT NOT NULL, qkey TEXT NOT NULL, a TEXT NOT NULL);
+                CREATE UNIQUE INDEX idx_knowledge_qkey ON knowledge (qkey);
+                CREATE TABLE knowledge_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL);
+                CREATE VIRTUAL TABLE knowledge_fts USING fts5(q, content='knowledge', content_rowid='id', tokenize='trigram');
+                CREATE TRIGGER knowledge_fts_ai AFTER INSERT ON knowledge BEGIN
+                    INSERT INTO knowledge_fts (rowid, q) VALUES (new.id, new.q);
+                END;
+            """)
+            conn.executemany("INSERT INTO knowledge (q, qkey, a) VALUES (?, lower(?), 'a')",
+                             [(q, q) for q in FILLER + ["ສະ​ບາຍ​ດີ", "Straße", "STRASSE"]])
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            self.skipTest(f"SQLite without the FTS5 trigram tokenizer: {e}")
+        finally:
+            conn.close()
+
+        store = self.open_store()
+        self.assertEqual(store._conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+        # lower() kept these apart; the casefold key merges them and the later row goes
+        questions = [e["q"] for e in store.get()["questions"]]
+        self.assertIn("Straße", questions)
+        self.assertNotIn("STRASSE", questions)
+        self.assertEqual(len(questions), len(FILLER) + 2)
+        self.assertIn("ສະ​ບາຍ​ດີ", self.fts_questions(store, "ສະບາຍດີ"))
+
+
+if __name__ == "__main__":
+    unittest.main()
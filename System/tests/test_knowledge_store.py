@@ -0,0 +1,90 @@
+"""Both knowledge backends: the same edits give the same entries, and readers never see a list change under them."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.knowledge_sqlite import SqliteKnowledgeStore
+from src.knowledge_store import KnowledgeBackend, KnowledgeStore
+
+
+class JsonBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def open_store(self):
+        return KnowledgeStore(os.path.join(self.data_dir, "knowledge.json"))
+
+    def questions(self, store):
+        return sorted((e["q"], e["a"]) for e in store.get()["questions"])
+
+    def test_get_reloads_only_after_another_writer_changes_the_data(self):
+        store = self.open_store()
+        store.upsert("q1", "a1")
+        data = store.get()
+        reloads = store.stats["reloads"]
+        self.assertIs(store.get(), data)
+        self.assertEqual(store.stats["reloads"], reloads)
+        self.open_store().upsert("q2", "a2")
+        self.assertEqual(self.questions(store), [("q1", "a1"), ("q2", "a2")])
+
+    def test_edit_onto_existing_question_replaces_it(self):
+        store = self.open_store()
+        store.bulk_upsert([("A", "1"), ("B", "2"), ("C", "3")])
+        self.assertTrue(store.edit("A", "b", "x"))
+        self.assertEqual(self.questions(store), [("C", "3"), ("b", "x")])
+        store.upsert("B", "y")
+        self.assertEqual(self.questions(store), [("C", "3"), ("b", "y")])
+
+    def test_questions_differing_only_in_case_are_one(self):
+        store = self.open_store()
+        store.upsert("Straße", "1")
+        self.assertEqual(store.upsert("STRASSE", "2"), "Updated")
+        self.assertEqual(self.questions(store), [("Straße", "2")])
+
+    def test_delete_and_edit_strip_the_question(self):
+        store = self.open_store()
+        store.bulk_upsert([("A", "1"), ("B", "2")])
+        self.assertTrue(store.delete("  a "))
+        self.assertTrue(store.edit(" B\n", "C", "3"))
+        self.assertFalse(store.delete("nothing"))
+        self.assertEqual(self.questions(store), [("C", "3")])
+
+    def test_delete_does_not_change_the_list_readers_hold(self):
+        store = self.open_store()
+        store.bulk_upsert([("A", "1"), ("B", "2"), ("C", "3")])
+        before = store.get()["questions"]
+        held = list(before)
+        store.delete("A")
+        store.edit("B", "D", "4")
+        self.assertEqual(before, held)
+        self.assertIsNot(store.get()["questions"], before)
+
+    def test_other_process_replays_the_log(self):
+        writer, reader = self.open_store(), self.open_store()
+        writer.bulk_upsert([("A", "1"), ("B", "2")])
+        self.assertEqual(len(reader.get()["questions"]), 2)
+        writer.edit("A", "b", "x")
+        writer.delete("b")
+        self.assertEqual(self.questions(reader), [])
+        self.assertEqual(reader.stats["reloads"], 1)
+
+
+class SqliteBackendTest(JsonBackendTest):
+    def open_store(self):
+        store = SqliteKnowledgeStore(os.path.join(self.data_dir, "knowledge.db"))
+        self.addCleanup(store.close)
+        return store
+
+
+class KnowledgeBackendTest(unittest.TestCase):
+    def test_backend_must_implement_sync(self):
+        with self.assertRaises(TypeError):
+            KnowledgeBackend()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""PromptBuilder stays within its token budget and keeps the instructions in follow-ups."""
+import random
+import unittest
+
+from src.engine import ChatSession
+from src.prompt_builder import ENHANCE_TASK, RAG_TASK, STATIC_PREFIX, PromptBuilder, estimate_tokens
+
+LANG = "Strict Rule: You MUST answer in Lao Language ONLY. No other languages. (Use Lao Script)."
+PIECES = ["ສະບາຍດີ ", "hello world ", "ກິນເຂົ້າແລ້ວບໍ່", "xxxxxxx ", "ທ່ານ "]
+
+
+class PromptBuilderTest(unittest.TestCase):
+    def text(self, rng, n):
+        return "".join(rng.choice(PIECES) for _ in range(n))
+
+    def session(self, rng):
+        session = ChatSession(max_history=rng.randint(1, 6))
+        for _ in range(rng.randint(0, 8)):
+            session.add_turn(self.text(rng, rng.randint(1, 60)), self.text(rng, rng.randint(1, 300)))
+        return session
+
+    def test_prompts_never_exceed_budget(self):
+        rng = random.Random(7)
+        for _ in range(2000):
+            builder = PromptBuilder(max_tokens=rng.choice([384, 768, 1536]),
+                                    snippet_tokens=rng.choice([64, 256]),
+                                    history_tokens=rng.choice([64, 384]),
+                                    summary_tokens=rng.choice([32, 128]))
+            question = self.text(rng, rng.randint(1, 400))
+            if rng.random() < 0.5:
+                prompt, followup, _ = builder.build_enhance(question, self.text(rng, rng.randint(1, 800)),
+                                                            LANG, self.session(rng))
+            else:
+                matches = [(rng.random(), {"q": self.text(rng, 20), "a": self.text(rng, rng.randint(1, 500))})
+                           for _ in range(5)]
+                prompt, followup, _, _ = builder.build_rag(question, matches, LANG, self.session(rng))
+            self.assertLessEqual(estimate_tokens(prompt), builder.max_tokens)
+            self.assertLessEqual(estimate_tokens(followup), builder.max_tokens)
+
+    def test_followup_keeps_instructions_but_not_history(self):
+        rng = random.Random(1)
+        session = self.session(rng)
+        session.add_turn("earlier question", "earlier answer")
+        builder = PromptBuilder()
+        _, followup, _ = builder.build_enhance("ສະບາຍດີ", "ສະບາຍດີ", LANG, session)
+        self.assertIn(STATIC_PREFIX + ENHANCE_TASK + LANG, followup)
+        self.assertNotIn("earlier question", followup)
+        _, followup, _, _ = builder.build_rag("ສະບາຍດີ", [], LANG, session)
+        self.assertIn(STATIC_PREFIX + RAG_TASK + LANG, followup)
+
+
+if __name__ == "__main__":
+    unittest.main()
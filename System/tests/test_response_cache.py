@@ -0,0 +1,55 @@
+"""The response cache must not mix answers across providers or generation options."""
+import shutil
+import tempfile
+import unittest
+
+from src.benchmark import StubModelClient
+from src.engine import ChatBot
+
+
+class FakeGemini(StubModelClient):
+    def is_configured(self):
+        return True
+
+    def generate_response(self, prompt, options=None):
+        self.calls += 1
+        return "Gemini answer."
+
+
+class ResponseCacheKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.bot = ChatBot(data_dir=self.data_dir)
+        self.bot.ollama = StubModelClient()
+        self.bot.gemini = FakeGemini()
+        self.bot.set_model("stub")
+        self.bot._model_resolved = True
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def ask(self, text):
+        # A fresh session each time: the history is part of the key too
+        return self.bot.get_response(text, session=self.bot.new_session())
+
+    def test_failover_answer_is_not_cached(self):
+        self.bot.ollama.generate_response = lambda prompt, options=None: "Error: Ollama is down"
+        self.assertIn("Gemini answer.", self.ask("what is the capital"))
+        self.bot.ollama = StubModelClient()
+        self.bot.set_model("stub")
+        self.assertIn("Stub answer.", self.ask("what is the capital"))
+        self.assertEqual(self.bot.ollama.calls, 1)
+
+    def test_options_are_part_of_the_key(self):
+        self.ask("what is the capital")
+        self.ask("what is the capital")
+        self.assertEqual(self.bot.ollama.calls, 1)
+        creativity = int(self.bot.emotion_manager.get_settings().get("creativity", 5))
+        settings = dict(self.bot.emotion_manager.get_settings(), creativity=1 if creativity > 1 else 10)
+        self.bot.emotion_manager.save_emotions(settings)
+        self.ask("what is the capital")
+        self.assertEqual(self.bot.ollama.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Candidate retrieval must not change which stored answer a query gets."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.benchmark import generate_knowledge, generate_queries
+from src.engine import ChatBot
+from src.retrieval import KnowledgeIndex, build_retriever, rank_matches, scaled_limit, widen_below_threshold, widen_matches
+from src.text_norm import detect_language, normalize
+
+
+class CandidateRecallTest(unittest.TestCase):
+    """Top-1 agreement with the full SequenceMatcher scan on a synthetic knowledge base.
+
+    A candidate limit of 2 puts the n-gram ranking under the same pressure a
+    limit of 50 is under at 100k entries.
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.data_dir = tempfile.mkdtemp()
+        entries = generate_knowledge(1000, seed=3)
+        with open(os.path.join(cls.data_dir, "knowledge.json"), 'w', encoding='utf-8') as f:
+            json.dump({"questions": entries}, f, ensure_ascii=False)
+        cls.queries = [q["text"] for q in generate_queries(entries, 40, seed=3)]
+        cls.bot = ChatBot(data_dir=cls.data_dir)
+        cls.bot.candidate_limit = 2
+        prepared = cls.bot._get_retriever().prepared
+        cls.baseline = [rank_matches(normalize(q), entries, 1, prepared=prepared)[0][0] for q in cls.queries]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.data_dir, ignore_errors=True)
+
+    def scores(self, widen):
+        self.bot.candidate_widen = widen
+        return [self.bot.find_matches(q, 1)[0][0] for q in self.queries]
+
+    def agreement(self, scores):
+        return sum(abs(a - b) < 1e-9 for a, b in zip(scores, self.baseline)) / len(self.baseline)
+
+    def test_widening_restores_agreement(self):
+        narrow, wide = self.scores(1), self.scores(10)
+        self.assertGreaterEqual(self.agreement(wide), 0.95)
+        self.assertGreater(self.agreement(wide), self.agreement(narrow))
+
+    def test_no_query_falls_below_the_threshold_it_reaches_in_a_full_scan(self):
+        threshold = self.bot.match_threshold()
+        crossed = [q for q, got, best in zip(self.queries, self.scores(10), self.baseline) if best >= threshold > got]
+        self.assertEqual(crossed, [])
+
+    def test_limit_scales_past_10k_entries(self):
+        self.assertEqual(scaled_limit(50, 10000), 50)
+        self.assertEqual(scaled_limit(50, 100000), 100)
+        self.assertEqual(scaled_limit(50, 1000000), 150)
+
+
+class PartitionWideningTest(unittest.TestCase):
+    """A Lao query whose own partition only has a near miss still gets the
+    mixed-script question filed under English."""
+    ENTRIES = [
+        {"q": "ສະບາຍດີ ຂອບໃຈຫຼາຍໆ", "a": "greeting"},
+        {"q": "ຫ້ອງສະໝຸດເປີດວັນຈັນ", "a": "monday"},
+        {"q": "ຫ້ອງສະໝຸດ opening hours on sunday", "a": "sunday"},
+        {"q": "weather tomorrow", "a": "weather"},
+    ]
+    QUERY = "ຫ້ອງສະໝຸດເປີດວັນອາທິດ opening hours sunday"
+
+    def test_widen_searches_every_partition(self):
+        prepared = KnowledgeIndex().prepare(self.ENTRIES)
+        retriever = build_retriever("ngram", self.ENTRIES, prepared, partitioned=True)
+        query = normalize(self.QUERY)
+        language = detect_language(query)
+        matches = rank_matches(query, retriever.candidates(query, 50, language), 5, prepared=prepared)
+        matches, outcome = widen_matches(query, retriever, matches, language, 5, 50, 0.3)
+        self.assertEqual((language, outcome, matches[0][1]["a"]), ("Lao", "hit", "monday"))
+        matches, widened = widen_below_threshold(query, retriever, matches, 0.8, 5, 500)
+        self.assertTrue(widened)
+        self.assertEqual(matches[0][1]["a"], "sunday")
+
+    def test_chatbot_finds_it_inline_and_in_batch_workers(self):
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir, True)
+        with open(os.path.join(data_dir, "knowledge.json"), 'w', encoding='utf-8') as f:
+            json.dump({"questions": self.ENTRIES}, f, ensure_ascii=False)
+        bot = ChatBot(data_dir=data_dir)
+        bot.retrieval_strategy = "ngram"
+        self.assertEqual(bot.find_matches(self.QUERY, 1)[0][1]["a"], "sunday")
+        # chunk_size=1 sends the two queries to worker processes
+        results = bot.match_batch([self.QUERY, "weather tomorrow"], 1, workers=2, chunk_size=1)
+        self.assertEqual([r["matches"][0][1]["a"] for r in results], ["sunday", "weather"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""ProviderRouter failover, the latency half of its circuit breaker, and the bounded model slots."""
+import time
+import unittest
+
+from src.models.router import ModelBusyError, ModelSlots, ProviderRouter
+
+
+class FakeClient:
+    def __init__(self, answer, latency=0.0):
+        self.answer = answer
+        self.latency = latency
+        self.calls = 0
+
+    def generate_response(self, prompt, options=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.answer
+
+
+class ProviderRouterTest(unittest.TestCase):
+    def router(self, clients, **options):
+        return ProviderRouter(clients.get, tuple(clients), **options)
+
+    def test_fails_over_on_error(self):
+        clients = {"ollama": FakeClient("Error: down"), "gemini": FakeClient("ok")}
+        self.assertEqual(self.router(clients).generate("hi", "ollama"), ("ok", "gemini", True, None))
+
+    def test_slow_provider_opens_circuit(self):
+        clients = {"ollama": FakeClient("slow", latency=0.05), "gemini": FakeClient("fast")}
+        router = self.router(clients, slow_ms=20, failure_threshold=2)
+        # Slow answers are still used, but each counts against the provider
+        self.assertEqual(router.generate("hi", "ollama")[:2], ("slow", "ollama"))
+        self.assertEqual(router.generate("hi", "ollama")[:2], ("slow", "ollama"))
+        self.assertEqual(router.health["ollama"].state, "open")
+        self.assertEqual(router.generate("hi", "ollama")[:2], ("fast", "gemini"))
+
+    def test_latency_ignored_without_slow_ms(self):
+        clients = {"ollama": FakeClient("slow", latency=0.05), "gemini": FakeClient("fast")}
+        router = self.router(clients, failure_threshold=1)
+        router.set_slow_ms(None)
+        for _ in range(3):
+            self.assertEqual(router.generate("hi", "ollama")[1], "ollama")
+        self.assertEqual(router.health["ollama"].state, "closed")
+
+    def test_extra_comes_only_from_the_returned_answer(self):
+        clients = {"ollama": FakeClient("slow", latency=0.2), "gemini": FakeClient("fast")}
+        def call(name, client, prompt):
+            text = client.generate_response(prompt)
+            return (text, {"context": [1]}) if name == "ollama" else text
+        router = self.router(clients, hedge_after_ms=20)
+        # The hedged Ollama call loses and its context is not handed back
+        self.assertEqual(router.generate("hi", "ollama", call), ("fast", "gemini", True, None))
+        clients["ollama"].latency = 0
+        self.assertEqual(router.generate("hi", "ollama", call), ("slow", "ollama", True, {"context": [1]}))
+
+    def test_busy_provider_is_skipped_without_counting_as_failure(self):
+        clients = {"ollama": FakeClient("unused"), "gemini": FakeClient("ok")}
+        def call(name, client, prompt):
+            if name == "ollama":
+                raise ModelBusyError("ollama is busy")
+            return client.generate_response(prompt)
+        router = self.router(clients, failure_threshold=1)
+        self.assertEqual(router.generate("hi", "ollama", call)[:3], ("ok", "gemini", True))
+        self.assertEqual(router.health["ollama"].state, "closed")
+
+    def test_raises_when_every_provider_is_busy(self):
+        def call(name, client, prompt):
+            raise ModelBusyError(f"{name} is busy")
+        router = self.router({"ollama": FakeClient("a"), "gemini": FakeClient("b")})
+        with self.assertRaises(ModelBusyError):
+            router.generate("hi", "ollama", call)
+
+
+class ModelSlotsTest(unittest.TestCase):
+    def test_rejects_past_the_queue_limit(self):
+        slots = ModelSlots("ollama", 1, max_waiting=0)
+        slots.acquire()
+        with self.assertRaisesRegex(ModelBusyError, "waiting"):
+            slots.acquire()
+        slots.release()
+        slots.acquire()
+
+    def test_wait_times_out(self):
+        slots = ModelSlots("ollama", 1, timeout=0.05)
+        slots.acquire()
+        start = time.perf_counter()
+        with self.assertRaises(ModelBusyError):
+            slots.acquire()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.04)
+        self.assertEqual(slots.waiting, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Semantic retrieval with a stand-in encoder: paraphrases match, and only new questions get embedded."""
+import shutil
+import tempfile
+import unittest
+
+from src.retrieval import KnowledgeIndex, build_retriever, rank_matches
+from src.semantic import SemanticRetriever, VectorIndex, semantic_available
+from src.text_norm import normalize
+
+TOPICS = (("price", "cost", "much"), ("rain", "weather", "umbrella"), ("open", "hours", "close"))
+
+
+class TopicEncoder:
+    """One dimension per topic: texts about the same thing get the same direction."""
+    name = "test:topics"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return [[float(any(word in text for word in topic)) for topic in TOPICS] + [0.01] for text in texts]
+
+
+@unittest.skipUnless(semantic_available(), "numpy is not installed")
+class SemanticRetrieverTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.encoder = TopicEncoder()
+        self.entries = [{"q": "how much does a ticket cost"}, {"q": "will it rain tomorrow"},
+                        {"q": "when does the shop open"}]
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def retriever(self, entries):
+        index = VectorIndex(self.path, self.encoder)
+        index.sync([normalize(e["q"]) for e in entries])
+        prepared = KnowledgeIndex().prepare(entries)
+        return SemanticRetriever(index, entries, build_retriever("ngram", entries, prepared),
+                                 lambda q: normalize(q))
+
+    def test_paraphrase_outranks_lexical_overlap(self):
+        retriever = self.retriever(self.entries)
+        query = normalize("do I need an umbrella")
+        candidates, semantic = retriever.search(query, 2)
+        best = rank_matches(query, candidates, 1, semantic, retriever.prepared)[0]
+        self.assertEqual(best[1]["q"], "will it rain tomorrow")
+        self.assertGreaterEqual(best[0], 0.8)
+
+    def test_only_new_questions_are_embedded(self):
+        self.retriever(self.entries)
+        self.encoder.encoded.clear()
+        self.retriever(self.entries + [{"q": "what is the weather like"}])
+        self.assertEqual(self.encoder.encoded, ["what is the weather like"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""ChatServer over real HTTP: sessions, errors and backpressure."""
+import asyncio
+import http.client
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from src.benchmark import StubModelClient
+from src.engine import ChatBot
+from src.server import ChatServer
+
+
+class ServerTestCase(unittest.TestCase):
+    server_options = {}
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.bot = ChatBot(data_dir=self.data_dir)
+        self.bot.ollama = StubModelClient()
+        self.bot.gemini.api_key = None
+        self.bot.set_model("stub")
+        self.bot._model_resolved = True
+
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.server = ChatServer(self.bot, port=0, **self.server_options)
+        self.await_(self.server.start())
+
+    def tearDown(self):
+        self.await_(self.shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    async def shutdown(self):
+        await self.server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def await_(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=10)
+
+    def request(self, method, path, payload=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=10)
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            raw = response.read().decode('utf-8')
+            if response.getheader("Content-Type", "").startswith("application/x-ndjson"):
+                return response.status, [json.loads(line) for line in raw.splitlines()]
+            return response.status, json.loads(raw)
+        finally:
+            conn.close()
+
+
+class ChatEndpointTest(ServerTestCase):
+    def test_chat_keeps_history_per_session(self):
+        status, first = self.request("POST", "/chat", {"message": "what is the capital"})
+        self.assertEqual(status, 200)
+        self.assertIn("Stub answer.", first["reply"])
+        self.request("POST", "/chat", {"message": "and the river", "session_id": first["session_id"]})
+        entry = self.server.sessions._entries[first["session_id"]]
+        self.assertEqual(len(entry.session.history), 4)
+
+    def test_stream_sends_session_then_final(self):
+        status, events = self.request("POST", "/chat", {"message": "what is the capital", "stream": True})
+        self.assertEqual(status, 200)
+        self.assertEqual(events[0]["type"], "session")
+        self.assertEqual(events[-1]["type"], "final")
+
+    def test_bad_requests(self):
+        self.assertEqual(self.request("POST", "/chat", {"message": ""})[0], 400)
+        self.assertEqual(self.request("GET", "/chat")[0], 405)
+        self.assertEqual(self.request("GET", "/nowhere")[0], 404)
+
+    def test_engine_error_gets_500(self):
+        def fail(*args):
+            raise ValueError("boom")
+        self.bot.get_response = fail
+        status, body = self.request("POST", "/chat", {"message": "what is the capital"})
+        self.assertEqual(status, 500)
+        self.assertIn("error", body)
+
+
+class TimeoutTest(ServerTestCase):
+    server_options = {"request_timeout": 0.1}
+
+    def test_session_stays_locked_until_the_timed_out_turn_finishes(self):
+        self.bot.ollama.latency = 0.5
+        status, _ = self.request("POST", "/chat", {"message": "what is the capital", "session_id": "s1"})
+        self.assertEqual(status, 504)
+        entry = self.server.sessions._entries["s1"]
+        self.assertTrue(entry.lock.locked())
+        self.bot.ollama.latency = 0
+        self.server.request_timeout = 10
+        status, _ = self.request("POST", "/chat", {"message": "how tall is the tower", "session_id": "s1"})
+        self.assertEqual(status, 200)
+        # The timed-out turn was cancelled, so only the second one is in the history
+        self.assertEqual(entry.session.history[0], "User: how tall is the tower")
+        self.assertEqual(len(entry.session.history), 2)
+
+
+class BusyModelTest(ServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bot.ollama.latency = 0.5
+        self.bot.set_model_concurrency(1, max_waiting=0)
+
+    def chat_concurrently(self, *messages, stream=False):
+        with ThreadPoolExecutor(len(messages)) as pool:
+            return sorted(status for status, _ in pool.map(
+                lambda m: self.request("POST", "/chat", {"message": m, "stream": stream}), messages))
+
+    def test_call_without_a_free_slot_gets_503(self):
+        self.assertEqual(self.chat_concurrently("what is the capital", "how tall is the tower"), [200, 503])
+
+    def test_stream_without_a_free_slot_gets_503(self):
+        self.assertEqual(self.chat_concurrently("what is the capital", "how tall is the tower", stream=True),
+                         [200, 503])
+
+
+if __name__ == "__main__":
+    unittest.main()
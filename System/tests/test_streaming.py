@@ -0,0 +1,174 @@
+"""Streaming from Ollama (NDJSON) and Gemini (SSE) against a local stub server.
+
+Run from the System folder: python -m unittest discover tests  (or pytest tests)
+"""
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.engine import ChatBot
+from src.models.gemini_client import GeminiClient
+from src.models.ollama_client import OllamaClient
+
+CHUNKS = ["ສະ", "ບາຍ", "ດີ"]
+
+
+def ndjson(*messages):
+    return [json.dumps(m, ensure_ascii=False) + "\n" for m in messages]
+
+
+def sse(*messages):
+    return ["data: " + json.dumps(m, ensure_ascii=False) + "\r\n\r\n" for m in messages]
+
+
+def gemini_chunk(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Replays server.script[path] = (status, [body pieces]) as a chunked response."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.requests.append((self.path, json.loads(self.rfile.read(length) or b"{}")))
+        status, pieces = self.server.script.get(self.path.split("?")[0], (404, ["not found"]))
+        self.send_response(status)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in pieces:
+                data = piece.encode('utf-8')
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                time.sleep(self.server.delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client stopped reading (cancel)
+
+
+class StreamingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.script = {}
+        self.server.requests = []
+        self.server.delay = 0.0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OllamaStreamTest(StreamingTestCase):
+    def client(self):
+        return OllamaClient(base_url=self.base_url, model="stub", retries=0)
+
+    def test_chunks_arrive_in_order_and_context_is_kept(self):
+        self.server.script["/api/generate"] = (200, ndjson(
+            *({"response": c, "done": False} for c in CHUNKS), {"response": "", "done": True, "context": [1, 2]}))
+        result = {}
+        chunks = list(self.client().stream_response("hi", options={"temperature": 0.5}, result=result))
+        self.assertEqual(chunks, CHUNKS)
+        self.assertEqual(result["context"], [1, 2])
+        payload = self.server.requests[0][1]
+        self.assertTrue(payload["stream"])
+        self.assertEqual(payload["options"], {"temperature": 0.5})
+
+    def test_error_line_raises_after_earlier_chunks(self):
+        self.server.script["/api/generate"] = (200, ndjson({"response": "ສະ", "done": False},
+                                                           {"error": "model crashed"}))
+        received = []
+        with self.assertRaisesRegex(RuntimeError, "model crashed"):
+            for chunk in self.client().stream_response("hi"):
+                received.append(chunk)
+        self.assertEqual(received, ["ສະ"])
+
+    def test_bad_status_raises(self):
+        self.server.script["/api/generate"] = (500, ["boom"])
+        with self.assertRaisesRegex(RuntimeError, "500"):
+            list(self.client().stream_response("hi"))
+
+
+class GeminiStreamTest(StreamingTestCase):
+    def client(self):
+        client = GeminiClient(api_key="test-key", retries=0)
+        client.stream_url = self.base_url + "/v1beta/models/stub:streamGenerateContent"
+        return client
+
+    def test_sse_chunks_arrive_in_order(self):
+        self.server.script["/v1beta/models/stub:streamGenerateContent"] = (
+            200, [": keep-alive\r\n\r\n"] + sse(*(gemini_chunk(c) for c in CHUNKS)))
+        self.assertEqual(list(self.client().stream_response("hi", options={"num_predict": 64})), CHUNKS)
+        path, payload = self.server.requests[0]
+        self.assertIn("alt=sse", path)
+        self.assertEqual(payload["generationConfig"], {"maxOutputTokens": 64})
+
+    def test_error_event_raises(self):
+        self.server.script["/v1beta/models/stub:streamGenerateContent"] = (
+            200, sse(gemini_chunk("ສະ"), {"error": {"code": 429, "message": "quota exceeded"}}))
+        received = []
+        with self.assertRaisesRegex(RuntimeError, "quota exceeded"):
+            for chunk in self.client().stream_response("hi"):
+                received.append(chunk)
+        self.assertEqual(received, ["ສະ"])
+
+    def test_missing_key_raises(self):
+        client = self.client()
+        client.api_key = None
+        with self.assertRaises(RuntimeError):
+            list(client.stream_response("hi"))
+
+
+class ChatBotStreamTest(StreamingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data_dir = tempfile.mkdtemp()
+        self.bot = ChatBot(data_dir=self.data_dir)
+        self.bot.ollama = OllamaClient(base_url=self.base_url, model="stub", retries=0)
+        self.bot.set_model("stub")
+        self.bot._model_resolved = True
+        self.server.script["/api/generate"] = (200, ndjson(
+            *({"response": c, "done": False} for c in CHUNKS), {"response": "", "done": True, "context": [7]}))
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_deltas_then_final(self):
+        events = list(self.bot.stream_response("ສະບາຍດີບໍ່"))
+        self.assertEqual([text for kind, text in events if kind == "delta"], CHUNKS)
+        self.assertEqual(events[-1][0], "final")
+        self.assertIn("ສະບາຍດີ", events[-1][1])
+        self.assertEqual(len(self.bot.conversation_history), 2)
+
+    def test_cancel_stops_mid_stream(self):
+        self.server.delay = 0.2
+        cancel = threading.Event()
+        events = []
+        for kind, text in self.bot.stream_response("ສະບາຍດີບໍ່", cancel_event=cancel):
+            events.append((kind, text))
+            cancel.set()
+        self.assertEqual(events, [("delta", "ສະ")])
+        # A cancelled turn leaves nothing in the history
+        self.assertEqual(self.bot.conversation_history, [])
+
+    def test_falls_back_when_stream_fails_before_first_chunk(self):
+        self.server.script["/api/generate"] = (200, ndjson({"error": "model not found"}))
+        self.bot.gemini.api_key = None
+        events = list(self.bot.stream_response("ສະບາຍດີບໍ່"))
+        # Nothing streamed and no other provider: only the canned fallback answer
+        self.assertEqual([kind for kind, _ in events], ["final"])
+        self.assertIn("AI Error", events[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
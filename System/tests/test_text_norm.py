@@ -0,0 +1,55 @@
+"""normalize() must give the same form for every way the same question gets typed."""
+import unittest
+
+from src.text_norm import detect_language, normalize, script_counts
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_ascii_is_lowercased_and_whitespace_collapsed(self):
+        self.assertEqual(normalize("  What   TIME\tis it?\n"), "what time is it?")
+
+    def test_case_folding_goes_beyond_lower(self):
+        self.assertEqual(normalize("STRASSE"), normalize("Straße"))
+
+    def test_nfd_and_nfc_agree(self):
+        self.assertEqual(normalize("cafe\u0301"), normalize("caf\u00e9"))
+
+    def test_zero_width_characters_and_soft_hyphens_are_dropped(self):
+        self.assertEqual(normalize("ສະ\u200bບາຍ\u00adດີ\ufeff"), "ສະບາຍດີ")
+
+    def test_lao_tone_mark_before_upper_vowel_is_reordered(self):
+        # ເຈົ້າ typed as tone mark (U+0EC9) then MAI KAN (U+0EBB)
+        self.assertEqual(normalize("\u0ec0\u0e88\u0ec9\u0ebb\u0eb2"), "\u0ec0\u0e88\u0ebb\u0ec9\u0eb2")
+
+    def test_lao_niggahita_plus_aa_becomes_sara_am(self):
+        self.assertEqual(normalize("ນໍາ"), "ນຳ")
+        self.assertEqual(normalize("ນໍ້າ"), "ນ້ຳ")
+
+    def test_thai_niggahita_plus_aa_becomes_sara_am(self):
+        self.assertEqual(normalize("นํา"), "นำ")
+
+    def test_lao_ho_ligatures(self):
+        self.assertEqual(normalize("ຫນ້າ"), "ໜ້າ")
+        self.assertEqual(normalize("ຫມູ"), "ໝູ")
+
+    def test_empty(self):
+        self.assertEqual(normalize(""), "")
+        self.assertEqual(normalize(None), "")
+
+
+class DetectLanguageTest(unittest.TestCase):
+    def test_majority_script_wins(self):
+        self.assertEqual(detect_language("ສະບາຍດີ"), "Lao")
+        self.assertEqual(detect_language("สวัสดีครับ"), "Thai")
+        self.assertEqual(detect_language("hello there"), "English")
+        self.assertEqual(detect_language("ສະບາຍດີ hi"), "Lao")
+
+    def test_lao_is_the_default(self):
+        self.assertEqual(detect_language("123 ?!"), "Lao")
+
+    def test_script_counts(self):
+        self.assertEqual(script_counts("ສະບາຍ abc ดี"), (5, 2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()